@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Generate a synthetic Oxide log directory for benchmarking the running version scan.
+   Run from the RustServerAutoUpdate directory: python -m benchmarks.corpus -d <Directory>"""
+import os, sys, getopt, random
+from datetime import datetime, timedelta, timezone
+
+LOG_LINES = ["[Info] Loaded plugin Kits v4.0.14 by k1lly0u",
+             "[Info] Unloaded plugin Vanish v1.4.2 by Whispers88",
+             "[Info] Calling hook OnPlayerConnected resulted in a conflict between the following plugins: Kits - False, Welcomer (True)",
+             "[Warning] Kits was compiled successfully in 1204ms",
+             "[Info] [Welcomer] Player76561198000000000 has joined the server",
+             "[Error] Failed to call hook 'OnEntityTakeDamage' on plugin 'Raidable Bases v2.3.1' (NullReferenceException: Object reference not set to an instance of an object)",
+             "[Info] Saving 5 data files"]
+DEPTHS = ("end", "middle", "start", "previous")
+
+def log_name(day):
+    return "oxide_" + day.strftime("%Y-%m-%d") + ".txt"
+
+def make_corpus(logDir, days = 365, totalSize = 10 * 1024 * 1024, depth = "end", version = "2.0.5016", seed = 1):
+    """Write days daily logs ending today, totalSize bytes in all, into logDir. Return the list of files written.
+       Every log holds an old version line near its start, as Oxide writes one on each server start.
+       depth places the newest version line in today's log at its end, middle or start,
+       or 'previous' leaves today's log without one so the scan has to reach yesterday's."""
+    if depth not in DEPTHS:
+        raise ValueError("depth must be one of " + ", ".join(DEPTHS))
+    randomLines = random.Random(seed)
+    os.makedirs(logDir, exist_ok=True)
+    today = datetime.now(timezone(timedelta(hours=0))).date()
+    fileSize = max(1, totalSize // days)
+    files = []
+    for dayOffset in range(days - 1, -1, -1):
+        day = today - timedelta(days=dayOffset)
+        lines = []
+        written = 0
+        while written < fileSize:
+            line = "{:02d}:{:02d} ".format(randomLines.randrange(24), randomLines.randrange(60)) + randomLines.choice(LOG_LINES) + "\n"
+            lines.append(line)
+            written += len(line)
+        versionLine = "00:00 [Info] Loaded extension Rust v{} by Oxide and Contributors\n"
+        if dayOffset > 0 or depth != "previous":
+            lines.insert(min(1, len(lines)), versionLine.format("2.0.4000"))
+        if dayOffset == 0 and depth != "previous":
+            position = {"end": len(lines) - 1, "middle": len(lines) // 2, "start": 2}[depth]
+            lines.insert(position, versionLine.format(version))
+        elif dayOffset == 1 and depth == "previous":
+            lines.append(versionLine.format(version))
+        path = os.path.join(logDir, log_name(day))
+        with open(path, "w", encoding="utf-8") as logFile:
+            logFile.writelines(lines)
+        files.append(path)
+    return files
+
+def parse_size(text):
+    """Size in bytes from a number with an optional K, M or G suffix"""
+    text = text.strip().upper()
+    multiplier = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(text[-1:], 1)
+    return int(float(text.rstrip("KMG")) * multiplier)
+
+def argumenthelp():
+    print("\nSyntax: python -m benchmarks.corpus -d <Directory> [-n <Days> -s <Total Size> -p <Depth>]\n"
+          "REQUIRED INPUT:\n"
+          "-d --dir          Directory to write the logs to.\n"
+          "OPTIONAL INPUT:\n"
+          "-n --days         Daily log files to write, ending today. Default: 365\n"
+          "-s --size         Total size of all logs, with K, M or G suffix. Default: 10M\n"
+          "-p --depth        Where the newest version line is: " + ", ".join(DEPTHS) + ". Default: end\n"
+          "-h --help         This help.\n")
+
+def main(argv):
+    logDir = ""
+    days = 365
+    totalSize = 10 * 1024 * 1024
+    depth = "end"
+    try:
+        opts, args = getopt.getopt(argv,"hd:n:s:p:",["help", "dir=", "days=", "size=", "depth="])
+    except getopt.GetoptError as err:
+        print("Incorrect Syntax: -h or --help for more information")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            argumenthelp()
+            sys.exit()
+        elif opt in ("-d", "--dir"):
+            logDir = arg
+        elif opt in ("-n", "--days"):
+            days = int(arg)
+        elif opt in ("-s", "--size"):
+            totalSize = parse_size(arg)
+        elif opt in ("-p", "--depth"):
+            depth = arg
+    if not logDir.strip():
+        argumenthelp()
+        sys.exit(2)
+    files = make_corpus(logDir, days, totalSize, depth)
+    print("Wrote " + str(len(files)) + " logs, " + str(sum(os.path.getsize(path) for path in files)) + " bytes to " + logDir)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the old decode-per-lookup release parsing with ReleaseInfo.
+   Run from the RustServerAutoUpdate directory: python -m benchmarks.release_parse"""
+import json, sys, getopt, timeit
+from rustbots import oxide
+
+def make_release_json(numAssets = 6, notesSize = 44000):
+    """Build a release payload shaped like the GitHub releases/latest response, roughly 50 KB by default."""
+    user = {"login": "oxidemod", "id": 10235251, "node_id": "MDEyOk9yZ2FuaXphdGlvbjEwMjM1MjUx",
+            "avatar_url": "https://avatars.githubusercontent.com/u/10235251?v=4", "gravatar_id": "",
+            "url": "https://api.github.com/users/OxideMod", "html_url": "https://github.com/OxideMod",
+            "type": "Organization", "site_admin": False}
+    assets = []
+    platforms = ["linux", "windows", "linux-x64", "win-x64", "linux-arm", "osx"]
+    for i in range(numAssets):
+        platform = platforms[i % len(platforms)]
+        name = "Oxide.Rust-" + platform + ".zip" if "win" not in platform else "Oxide.Rust.zip"
+        assets.append({"url": "https://api.github.com/repos/OxideMod/Oxide.Rust/releases/assets/" + str(30000000 + i),
+                       "id": 30000000 + i, "node_id": "MDEyOlJlbGVhc2VBc3NldDMwMDAwMDAw", "name": name,
+                       "label": "", "uploader": user, "content_type": "application/x-zip-compressed",
+                       "state": "uploaded", "size": 6520000 + i, "download_count": 12000 + i,
+                       "created_at": "2021-01-12T20:43:18Z", "updated_at": "2021-01-12T20:43:18Z",
+                       "browser_download_url": "https://github.com/OxideMod/Oxide.Rust/releases/download/2.0.5016/" + name})
+    notes = "\n".join("- Fixed hook " + str(i) + " not being called when a player loots a container" for i in range(notesSize // 70))
+    return json.dumps({"url": "https://api.github.com/repos/OxideMod/Oxide.Rust/releases/35849290",
+                       "assets_url": "https://api.github.com/repos/OxideMod/Oxide.Rust/releases/35849290/assets",
+                       "html_url": "https://github.com/OxideMod/Oxide.Rust/releases/tag/2.0.5016",
+                       "id": 35849290, "author": user, "node_id": "MDc6UmVsZWFzZTM1ODQ5Mjkw",
+                       "tag_name": "2.0.5016", "target_commitish": "develop", "name": "2.0.5016",
+                       "draft": False, "prerelease": False,
+                       "created_at": "2021-01-12T20:30:01Z", "published_at": "2021-01-12T20:43:18Z",
+                       "assets": assets,
+                       "tarball_url": "https://api.github.com/repos/OxideMod/Oxide.Rust/tarball/2.0.5016",
+                       "zipball_url": "https://api.github.com/repos/OxideMod/Oxide.Rust/zipball/2.0.5016",
+                       "body": notes})
+
+def legacy_latest_version(gitJSONString):
+    """tag_name lookup as UpdateCheck.get_latest_version used to do it"""
+    reply = json.loads(gitJSONString)
+    for x in reply:
+        if x == "tag_name":
+            return reply[x]
+
+def legacy_latest_url(gitJSONString, linux = True):
+    """asset lookup as UpdateCheck.get_latest_url used to do it"""
+    reply = json.loads(gitJSONString)
+    for x in reply:
+        if x in "assets":
+            for a in reply[x]:
+                for b in a:
+                    if b == "browser_download_url":
+                        if "linux" in a[b] and linux:
+                            return a[b]
+                        elif not "linux" in a[b] and not linux:
+                            return a[b]
+
+def legacy_check(gitJSONString):
+    """check_update used to decode the payload once for the version and once for the url"""
+    return (legacy_latest_version(gitJSONString), legacy_latest_url(gitJSONString))
+
+def release_info_check(gitJSONString):
+    """check_update decoding the payload once into ReleaseInfo"""
+    releaseInfo = oxide.ReleaseInfo.from_json(gitJSONString)
+    return (releaseInfo.tagName, releaseInfo.get_url())
+
+def argumenthelp():
+    print("\nSyntax: python -m benchmarks.release_parse [-n <Iterations> -r <Repeats>]\n"
+          "OPTIONAL INPUT:\n"
+          "-n --number       Calls per timing run. Default: 2000\n"
+          "-r --repeat       Timing runs. Best run is reported. Default: 5\n"
+          "-h --help         This help.\n")
+
+def main(argv):
+    number = 2000
+    repeat = 5
+    try:
+        opts, args = getopt.getopt(argv,"hn:r:",["help", "number=", "repeat="])
+    except getopt.GetoptError as err:
+        print("Incorrect Syntax: -h or --help for more information")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            argumenthelp()
+            sys.exit()
+        elif opt in ("-n", "--number"):
+            number = int(arg)
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+    payload = make_release_json()
+    if legacy_check(payload) != release_info_check(payload):
+        print("Results differ: " + str(legacy_check(payload)) + " " + str(release_info_check(payload)))
+        sys.exit(1)
+    print("Payload size: " + str(len(payload)) + " bytes")
+    results = {}
+    for name, func in (("legacy", legacy_check), ("releaseinfo", release_info_check)):
+        best = min(timeit.repeat(lambda: func(payload), number=number, repeat=repeat))
+        results[name] = best / number
+        print("{:<12} {:10.2f} us per check".format(name, results[name] * 1e6))
+    print("Speedup: {:.2f}x".format(results["legacy"] / results["releaseinfo"]))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Local stand ins for the GitHub releases API, a Discord webhook and Rust RCON used by the benchmarks.
+   Each runs on a daemon thread on 127.0.0.1 and a free port."""
+import asyncio, base64, hashlib, http.server, json, threading
+from rustbots import rcon
+
+class StubHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self.server_port)
+
+class GitHubHandler(http.server.BaseHTTPRequestHandler):
+    """GET returns the release payload with an ETag and answers If-None-Match with 304, like the GitHub API.
+       The status of every response is appended to server.statuses."""
+    protocol_version = "HTTP/1.1"
+    #Headers and body are written separately. Without this, delayed ACKs add 40 ms to every kept alive request.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = self.server.payload
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            body = b""
+        else:
+            self.send_response(200)
+        self.server.statuses.append(304 if not body else 200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", "9999999999")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class DiscordHandler(http.server.BaseHTTPRequestHandler):
+    """POST is accepted with 204, or 200 and a message when ?wait=true, with a generous rate limit bucket"""
+    protocol_version = "HTTP/1.1"
+    #Headers and body are written separately. Without this, delayed ACKs add 40 ms to every kept alive request.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.posts += 1
+        body = b'{"id": "1"}' if "wait=true" in self.path else b""
+        self.send_response(200 if body else 204)
+        self.send_header("X-RateLimit-Remaining", "1000")
+        self.send_header("X-RateLimit-Reset-After", "1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_github(payload):
+    """Serve payload (str) as the latest release. Return the running server."""
+    server = StubHTTPServer(("127.0.0.1", 0), GitHubHandler)
+    server.payload = payload.encode("utf-8")
+    server.etag = '"' + hashlib.sha1(server.payload).hexdigest() + '"'
+    server.statuses = []
+    return server.start()
+
+def start_discord():
+    """Return a running webhook server. server.posts counts the messages received."""
+    server = StubHTTPServer(("127.0.0.1", 0), DiscordHandler)
+    server.posts = 0
+    return server.start()
+
+class RCONStub:
+    """WebSocket server echoing every command back with its Identifier, as the Rust server replies to RCON.
+       Commands in ignored get no reply. Commands in replies are answered with the Message given there instead of
+       being echoed, e.g. replies["serverinfo"] = json.dumps({"Players": 0}).
+       disconnect() drops every open connection. connections counts those accepted."""
+    def __init__(self):
+        self.port = None
+        self.started = threading.Event()
+        self.loop = None
+        self.ignored = set()
+        self.replies = {}
+        self.writers = set()
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        self.connections += 1
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            key = b""
+            for line in request.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"sec-websocket-key":
+                    key = value.strip()
+            accept = base64.b64encode(hashlib.sha1(key + rcon.WEBSOCKET_GUID).digest())
+            writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+            while True:
+                fin, opcode, payload = await rcon.read_frame(reader)
+                if opcode == rcon.OPCODE_CLOSE:
+                    writer.write(rcon.encode_frame(rcon.OPCODE_CLOSE, payload, mask=False))
+                    break
+                if opcode != rcon.OPCODE_TEXT:
+                    continue
+                command = json.loads(payload.decode("utf-8"))
+                if command["Message"] in self.ignored:
+                    continue
+                reply = {"Identifier": command["Identifier"], "Message": self.replies.get(command["Message"], command["Message"]), "Type": "Generic", "Stacktrace": ""}
+                writer.write(rcon.encode_frame(rcon.OPCODE_TEXT, json.dumps(reply).encode("utf-8"), mask=False))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def disconnect(self):
+        """Close every open connection, as a server restart would"""
+        self.loop.call_soon_threadsafe(lambda: [writer.close() for writer in list(self.writers)])
+
+    def run(self):
+        async def serve():
+            self.loop = asyncio.get_running_loop()
+            server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+            self.port = server.sockets[0].getsockname()[1]
+            self.started.set()
+            await asyncio.Future()
+        asyncio.run(serve())
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.started.wait()
+        return self
+
+def start_rcon():
+    """Return a running RCON stub. Its port is in .port"""
+    return RCONStub().start()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the update check hot path against a synthetic log corpus and local stub servers.
+   Measures get_running_version, check_update, RCON and Discord sends and reports latency,
+   throughput, log bytes read and peak RSS.
+   Run from the RustServerAutoUpdate directory: python -m benchmarks.update_check"""
+import asyncio, os, sys, getopt, shutil, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from rustbots import oxide, rcon, discord, httpsession
+from benchmarks import corpus, stubs
+from benchmarks.release_parse import make_release_json
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far in MB, or None where it is not available"""
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and kilobytes everywhere else.
+    return maxRSS / (1024 * 1024) if sys.platform == "darwin" else maxRSS / 1024
+
+def log_bytes_read():
+    return oxide.LOG_BYTES_READ.get() or 0
+
+class Result:
+    """Timings of one benchmark"""
+    def __init__(self, name, latencies, elapsed, bytesRead = None):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.elapsed = elapsed
+        self.bytesRead = bytesRead
+        self.peakRSS = peak_rss_mb()
+
+    def percentile(self, fraction):
+        return self.latencies[min(len(self.latencies) - 1, int(fraction * len(self.latencies)))]
+
+    def row(self):
+        ops = len(self.latencies)
+        mean = sum(self.latencies) / ops
+        bytesPerOp = "" if self.bytesRead is None else "{:,.0f}".format(self.bytesRead / ops)
+        peakRSS = "" if self.peakRSS is None else "{:.1f}".format(self.peakRSS)
+        return "{:<34} {:>6} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>14} {:>9}".format(
+            self.name, ops, ops / self.elapsed, mean * 1e3, self.percentile(0.5) * 1e3, self.percentile(0.95) * 1e3, bytesPerOp, peakRSS)
+
+HEADER = "{:<34} {:>6} {:>10} {:>10} {:>10} {:>10} {:>14} {:>9}".format("benchmark", "ops", "ops/s", "mean ms", "p50 ms", "p95 ms", "log bytes/op", "peak MB")
+
+def time_calls(name, func, iterations, countBytes = False):
+    """Call func iterations times one after another. Return a Result."""
+    latencies = []
+    bytesBefore = log_bytes_read()
+    start = time.perf_counter()
+    for i in range(iterations):
+        callStart = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - callStart)
+    elapsed = time.perf_counter() - start
+    return Result(name, latencies, elapsed, log_bytes_read() - bytesBefore if countBytes else None)
+
+def bench_running_version(logDir, iterations):
+    """Cold runs scan with a new UpdateCheck each time. Warm runs reuse one, so only appended lines are read."""
+    results = []
+    for scanMode in ("reverse", "forward"):
+        results.append(time_calls("get_running_version " + scanMode + " cold",
+                                  lambda: oxide.UpdateCheck(logDir, scanMode=scanMode).get_running_version(), iterations, True))
+        updateCheck = oxide.UpdateCheck(logDir, scanMode=scanMode)
+        updateCheck.get_running_version()
+        results.append(time_calls("get_running_version " + scanMode + " warm", updateCheck.get_running_version, iterations, True))
+    return results
+
+def bench_check_update(logDir, gitURL, cacheDir, iterations):
+    """check_update with every call hitting the API, and through the release cache"""
+    session = httpsession.create_session()
+    results = []
+    updateCheck = oxide.UpdateCheck(logDir, gitURL, session=session)
+    results.append(time_calls("check_update uncached", updateCheck.check_update, iterations, True))
+    updateCheck = oxide.UpdateCheck(logDir, gitURL, releaseCache=oxide.ReleaseCache(cacheDir, 0), session=session)
+    results.append(time_calls("check_update release cache", updateCheck.check_update, iterations, True))
+    session.close()
+    return results
+
+def bench_rcon(port, iterations, concurrency):
+    """Sequential RCONBot commands, then AsyncRCONBot commands concurrency at a time"""
+    results = []
+    bot = rcon.RCONBot("password", "127.0.0.1", str(port))
+    bot.send_message("warmup")
+    results.append(time_calls("RCONBot.send_message", lambda: bot.send_message("say benchmark"), iterations))
+    bot.close()
+
+    async def run_async():
+        asyncBot = rcon.AsyncRCONBot("password", "127.0.0.1", str(port))
+        await asyncBot.send_message("warmup")
+        latencies = []
+        async def timed_send():
+            callStart = time.perf_counter()
+            await asyncBot.send_message("say benchmark")
+            latencies.append(time.perf_counter() - callStart)
+        start = time.perf_counter()
+        for batchStart in range(0, iterations, concurrency):
+            await asyncio.gather(*[timed_send() for i in range(min(concurrency, iterations - batchStart))])
+        elapsed = time.perf_counter() - start
+        await asyncBot.close()
+        return Result("AsyncRCONBot x" + str(concurrency) + " concurrent", latencies, elapsed)
+    results.append(asyncio.run(run_async()))
+    return results
+
+def bench_discord(webHook, iterations, concurrency):
+    """Blocking send_message one after another, then queue_message from concurrency threads at once.
+       Latency includes the webhook queue's batching delay, which lets concurrent messages share a post."""
+    session = httpsession.create_session()
+    serverInfo = discord.ServerInformation("Rust", "Benchmark Server", "127.0.0.1:28015")
+    bot = discord.DiscordBot(webHook, "BenchmarkBot", session=session)
+    results = [time_calls("DiscordBot.send_message", lambda: bot.send_message(serverInfo, "benchmark"), iterations)]
+    latencies = []
+    def timed_queue(i):
+        callStart = time.perf_counter()
+        bot.queue_message(serverInfo, "benchmark " + str(i)).result()
+        latencies.append(time.perf_counter() - callStart)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed_queue, range(iterations * concurrency)))
+    results.append(Result("DiscordBot.queue_message x" + str(concurrency), latencies, time.perf_counter() - start))
+    session.close()
+    return results
+
+def argumenthelp():
+    print("\nSyntax: python -m benchmarks.update_check [-d <Log Dir> -s <Corpus Size> -n <Days> -p <Depth> -i <Iterations> -r <Network Iterations> -c <Concurrency> -k]\n"
+          "OPTIONAL INPUT:\n"
+          "-d --logdir       Benchmark an existing Oxide log directory instead of generating one.\n"
+          "-s --size         Total size of the generated logs, with K, M or G suffix. Default: 10M\n"
+          "-n --days         Daily log files to generate. Default: 365\n"
+          "-p --depth        Where the newest version line is: " + ", ".join(corpus.DEPTHS) + ". Default: end\n"
+          "-i --iterations   Calls per log scan and check_update benchmark. Default: 20\n"
+          "-r --requests     Calls per RCON and Discord benchmark. Default: 20\n"
+          "-c --concurrency  Concurrent callers in the concurrent RCON and Discord benchmarks. Default: 10\n"
+          "-k --keep         Keep the generated logs.\n"
+          "-h --help         This help.\n")
+
+def main(argv):
+    logDir = ""
+    totalSize = 10 * 1024 * 1024
+    days = 365
+    depth = "end"
+    iterations = 20
+    requests = 20
+    concurrency = 10
+    keep = False
+    try:
+        opts, args = getopt.getopt(argv,"hkd:s:n:p:i:r:c:",["help", "keep", "logdir=", "size=", "days=", "depth=", "iterations=", "requests=", "concurrency="])
+    except getopt.GetoptError as err:
+        print("Incorrect Syntax: -h or --help for more information")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            argumenthelp()
+            sys.exit()
+        elif opt in ("-d", "--logdir"):
+            logDir = arg
+        elif opt in ("-s", "--size"):
+            totalSize = corpus.parse_size(arg)
+        elif opt in ("-n", "--days"):
+            days = int(arg)
+        elif opt in ("-p", "--depth"):
+            depth = arg
+        elif opt in ("-i", "--iterations"):
+            iterations = int(arg)
+        elif opt in ("-r", "--requests"):
+            requests = int(arg)
+        elif opt in ("-c", "--concurrency"):
+            concurrency = int(arg)
+        elif opt in ("-k", "--keep"):
+            keep = True
+    workDir = tempfile.mkdtemp(prefix="rustserverautoupdate-bench")
+    try:
+        if not logDir:
+            logDir = os.path.join(workDir, "logs")
+            start = time.perf_counter()
+            files = corpus.make_corpus(logDir, days, totalSize, depth)
+            print("Generated " + str(len(files)) + " logs, " + "{:,}".format(sum(os.path.getsize(path) for path in files)) +
+                  " bytes in " + "{:.1f}".format(time.perf_counter() - start) + " seconds at " + logDir)
+        scanned = oxide.UpdateCheck(logDir).get_log_file_list()
+        print("Scan window: " + str(len(scanned)) + " logs, " + "{:,}".format(sum(os.path.getsize(path) for path in scanned)) + " bytes")
+        github = stubs.start_github(make_release_json())
+        webHook = stubs.start_discord()
+        rconServer = stubs.start_rcon()
+        print(HEADER)
+        for benchmark in (lambda: bench_running_version(logDir, iterations),
+                          lambda: bench_check_update(logDir, github.url + "/releases/latest", os.path.join(workDir, "cache"), iterations),
+                          lambda: bench_rcon(rconServer.port, requests, concurrency),
+                          lambda: bench_discord(webHook.url + "/webhook", requests, concurrency)):
+            for result in benchmark():
+                print(result.row())
+        print("Discord stub received " + str(webHook.posts) + " posts")
+        github.shutdown()
+        webHook.shutdown()
+    finally:
+        if keep:
+            print("Kept " + workDir)
+        else:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
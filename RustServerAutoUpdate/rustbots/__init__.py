@@ -1 +1 @@
-import rustbots.discord, rustbots.rcon, rustbots.oxide
\ No newline at end of file
+import rustbots.discord, rustbots.rcon, rustbots.oxide, rustbots.jsonfile, rustbots.httpsession, rustbots.schedule, rustbots.coordinator, rustbots.artifacts, rustbots.shell, rustbots.readiness, rustbots.metrics, rustbots.jsonlog, rustbots.countdown, rustbots.wipe, rustbots.control
\ No newline at end of file
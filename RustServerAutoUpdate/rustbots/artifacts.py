@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib, os, shutil, tempfile, time
+from urllib.parse import urlparse
+try:
+    from rustbots import jsonfile, httpsession
+    from rustbots.coordinator import FileLock
+except ImportError:
+    import jsonfile, httpsession
+    from coordinator import FileLock
+
+class ArtifactCache:
+    """Content addressed store of downloaded release assets, shared by every instance on the host.
+       Each file is kept as <cacheDir>/artifacts/<sha256>/<file name> and an index maps download URLs
+       to their hash. Downloads of the same URL are serialised with a lock file, so when several
+       instances see the same update only the first downloads it and the rest reuse the file."""
+    def __init__(self, cacheDir, session = None, timeout = httpsession.DEFAULT_TIMEOUT, keep = 3, chunkSize = 1024 * 1024):
+        """keep is how many artifacts to hold before the oldest are removed.
+           cacheDir must belong to this user and not be writable by anyone else."""
+        self.cacheDir = cacheDir
+        self.artifactDir = os.path.join(cacheDir, "artifacts")
+        self.indexFile = os.path.join(self.artifactDir, "index.json")
+        self.indexLockPath = os.path.join(self.artifactDir, "index.lock")
+        self.session = session if session is not None else httpsession.create_session()
+        self.timeout = timeout
+        self.keep = keep
+        self.chunkSize = chunkSize
+
+    def lookup(self, url):
+        """Path of the cached file for url, or None if it is not cached"""
+        entry = jsonfile.read_json(self.indexFile, {}).get(url)
+        if not entry:
+            return None
+        path = os.path.join(self.artifactDir, entry["sha256"], entry["name"])
+        try:
+            if os.path.getsize(path) == entry["size"]:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def fetch(self, url, expectedSize = None, expectedDigest = None):
+        """Return the path of the cached file for url, downloading it first if necessary.
+           expectedSize in bytes and expectedDigest ('sha256:<hex>') are checked when given.
+           Raises ArtifactCacheError if the download does not match them."""
+        jsonfile.make_private_dir(self.cacheDir)
+        urlHash = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        with FileLock(os.path.join(self.artifactDir, "download_" + urlHash + ".lock")):
+            path = self.lookup(url)
+            if path is not None:
+                return path
+            name = os.path.basename(urlparse(url).path) or "artifact"
+            sha256 = hashlib.sha256()
+            size = 0
+            fd, tempPath = tempfile.mkstemp(prefix=".download", dir=self.artifactDir)
+            try:
+                with os.fdopen(fd, "wb") as tempFile:
+                    with self.session.get(url, stream=True, timeout=self.timeout) as r:
+                        if r.status_code != 200:
+                            raise ArtifactCacheError(url, "Download Failed With Status " + str(r.status_code))
+                        for chunk in r.iter_content(self.chunkSize):
+                            tempFile.write(chunk)
+                            sha256.update(chunk)
+                            size += len(chunk)
+                digest = sha256.hexdigest()
+                if expectedSize is not None and size != expectedSize:
+                    raise ArtifactCacheError(url, "Downloaded " + str(size) + " bytes, expected " + str(expectedSize))
+                if expectedDigest and expectedDigest.lower() != "sha256:" + digest:
+                    raise ArtifactCacheError(url, "Checksum sha256:" + digest + " does not match " + expectedDigest)
+                os.makedirs(os.path.join(self.artifactDir, digest), exist_ok=True)
+                path = os.path.join(self.artifactDir, digest, name)
+                os.replace(tempPath, path)
+            except BaseException:
+                try:
+                    os.unlink(tempPath)
+                except OSError:
+                    pass
+                raise
+            with FileLock(self.indexLockPath):
+                index = jsonfile.read_json(self.indexFile, {})
+                index[url] = {"sha256": digest, "name": name, "size": size, "added": time.time()}
+                self.prune(index)
+                jsonfile.write_json(self.indexFile, index)
+            return path
+
+    def fetch_asset(self, asset):
+        """fetch() a release asset dict from the Git API, checking its size and digest"""
+        return self.fetch(asset["browser_download_url"], asset.get("size"), asset.get("digest"))
+
+    def prune(self, index):
+        """Drop all but the newest keep artifacts from index and disk. Caller holds the index lock."""
+        for url in sorted(index, key=lambda url: index[url].get("added", 0), reverse=True)[self.keep:]:
+            digest = index.pop(url)["sha256"]
+            if not any(entry["sha256"] == digest for entry in index.values()):
+                shutil.rmtree(os.path.join(self.artifactDir, digest), ignore_errors=True)
+
+class ArtifactCacheError(Exception):
+    def __init__(self, url, msg):
+        Exception.__init__(self, msg)
+        self.url = url
+        self.msg = msg
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, json, os, socket, sys, getopt
+
+MAX_REQUEST_BYTES = 64 * 1024
+
+class ControlServer:
+    """Serve handler on a Unix domain socket from the event loop.
+       Requests and replies are single lines of JSON. A request names a command and its arguments,
+       e.g. {"command": "status", "instance": "SERVER1"}. Every reply has "ok" and, when ok is false, "error".
+       handler is a coroutine function taking the request dict and returning the reply dict."""
+    def __init__(self, path, handler):
+        self.path = path
+        self.handler = handler
+        self.server = None
+
+    async def start(self):
+        if not hasattr(asyncio, "start_unix_server"):
+            raise ControlError("Unix domain sockets are not supported on this platform")
+        #A socket file left by a process that did not exit cleanly would make bind fail.
+        if os.path.exists(self.path):
+            if is_listening(self.path):
+                raise ControlError("Another monitor is already listening on " + self.path)
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        #The socket can restart the game server. Only the owner may connect, from the moment it is bound.
+        oldUmask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle, self.path, limit=MAX_REQUEST_BYTES)
+        finally:
+            os.umask(oldUmask)
+        os.chmod(self.path, 0o600)
+        return self.server
+
+    async def handle(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 10)
+            try:
+                request = json.loads(line.decode("utf-8"))
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+                reply = await self.handler(request)
+            except ValueError as err:
+                reply = {"ok": False, "error": str(err)}
+            except Exception as err:
+                reply = {"ok": False, "error": repr(err)}
+            writer.write(json.dumps(reply, default=str).encode("utf-8") + b"\n")
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+def is_listening(path):
+    """True if something accepts connections on the Unix domain socket at path"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+def send_command(path, request, timeout = 30):
+    """Send request (a dict) to the control socket at path. Return the reply dict."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+class ControlError(Exception):
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+def argumenthelp():
+    print("\nSyntax: control.py -p <Control Socket> -c <Command> [-s <Section Name> -m <Message> -d <Minutes>]\n"
+          "Example: control.py -p /home/rustserver/rustserverautoupdate/rustserverautoupdate.sock -c postpone -s SERVER1 -d 30\n"
+          "REQUIRED INPUT:\n"
+          "-p --socket       Path of the control_socket of the running monitor.\n"
+          "-c --command      status, check-now, postpone, cancel or send-message.\n"
+          "OPTIONAL INPUT:\n"
+          "-s --section      Instance to control. Needed with -a unless only one instance is running. status without it lists every instance.\n"
+          "-m --message      Message for send-message. Sent to Discord and RCON like the warnings.\n"
+          "-d --minutes      Minutes to postpone a pending restart by. Default: 15\n"
+          "-t --timeout      Seconds to wait for the reply. Default: 30\n")
+
+def main(argv):
+    path = ""
+    request = {}
+    timeout = 30
+    try:
+        opts, args = getopt.getopt(argv,"hp:c:s:m:d:t:",["help", "socket=", "command=", "section=", "message=", "minutes=", "timeout="])
+    except getopt.GetoptError as err:
+        print("Incorrect Syntax: -h or --help for more information")
+        print("control.py -p <Control Socket> -c <Command> [-s <Section Name> -m <Message> -d <Minutes>]\n")
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            argumenthelp()
+            sys.exit()
+        elif opt in ("-p", "--socket"):
+            path = arg
+        elif opt in ("-c", "--command"):
+            request["command"] = arg
+        elif opt in ("-s", "--section"):
+            request["instance"] = arg
+        elif opt in ("-m", "--message"):
+            request["message"] = arg
+        elif opt in ("-d", "--minutes"):
+            request["minutes"] = float(arg)
+        elif opt in ("-t", "--timeout"):
+            timeout = float(arg)
+    if not path.strip() or not request.get("command"):
+        print("Incorrect Syntax: socket and command required\n"
+              "-h or --help for more information")
+        sys.exit(2)
+    try:
+        reply = send_command(path, request, timeout)
+    except (OSError, ValueError) as err:
+        print("Could not reach the monitor at " + path + ": " + str(err))
+        sys.exit(1)
+    print(json.dumps(reply, indent=2))
+    if not reply.get("ok"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
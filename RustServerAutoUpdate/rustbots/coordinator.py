@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, os, threading, time
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    from rustbots import jsonfile
+except ImportError:
+    import jsonfile
+
+class FileLock:
+    """Exclusive lock on a file shared between processes.
+       Uses flock where available so the lock is released if the holder dies.
+       Without flock the lock only excludes other holders in this process."""
+    heldPaths = set()
+    heldPathsLock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.lockFile = None
+
+    def acquire(self, blocking = True):
+        """Take the lock. Return False if blocking is False and another holder has it."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if fcntl is None:
+            while True:
+                with FileLock.heldPathsLock:
+                    if self.path not in FileLock.heldPaths:
+                        FileLock.heldPaths.add(self.path)
+                        return True
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+        lockFile = open(self.path, "a+")
+        try:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lockFile.close()
+            return False
+        except BaseException:
+            lockFile.close()
+            raise
+        self.lockFile = lockFile
+        return True
+
+    def release(self):
+        if fcntl is None:
+            with FileLock.heldPathsLock:
+                FileLock.heldPaths.discard(self.path)
+            return
+        if self.lockFile is not None:
+            fcntl.flock(self.lockFile.fileno(), fcntl.LOCK_UN)
+            self.lockFile.close()
+            self.lockFile = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.release()
+
+class RestartCoordinator:
+    """Host wide coordination of instance restarts.
+       At most maxConcurrent instances update at the same time. Each holds one of maxConcurrent slot
+       lock files under lockDir from its update command until its server is ready. Restart times are also reserved in a
+       shared plan file, so no more than maxConcurrent restarts are planned within restartSpacing seconds
+       of each other and countdowns on the same host are shifted apart instead of overlapping."""
+    def __init__(self, lockDir, maxConcurrent = 1, restartSpacing = 300, pollInterval = 1):
+        self.lockDir = lockDir
+        self.maxConcurrent = max(1, maxConcurrent)
+        self.restartSpacing = restartSpacing
+        self.pollInterval = pollInterval
+        self.planFile = os.path.join(lockDir, "restart_plan.json")
+        self.planLockPath = os.path.join(lockDir, "restart_plan.lock")
+
+    def try_acquire(self):
+        """Take a free update slot without waiting. Return the FileLock held, or None."""
+        for slot in range(self.maxConcurrent):
+            slotLock = FileLock(os.path.join(self.lockDir, "restart_slot_" + str(slot) + ".lock"))
+            if slotLock.acquire(blocking=False):
+                return slotLock
+        return None
+
+    async def acquire(self):
+        """Wait for a free update slot. Return the FileLock held. Release it once the restarted server is ready."""
+        while True:
+            slotLock = self.try_acquire()
+            if slotLock is not None:
+                return slotLock
+            await asyncio.sleep(self.pollInterval)
+
+    def reserve_restart(self, name, earliest):
+        """Reserve a restart for instance name no sooner than earliest (seconds since the epoch).
+           Return the reserved time, pushed back past other instances' reservations if needed."""
+        with FileLock(self.planLockPath):
+            now = time.time()
+            plan = jsonfile.read_json(self.planFile, {})
+            if not isinstance(plan, dict):
+                plan = {}
+            #Reservations whose restart should be long finished no longer hold up anyone.
+            others = [restartAt for (planName, restartAt) in plan.items() if planName != name and restartAt + self.restartSpacing > now]
+            restartAt = earliest
+            while True:
+                #The millisecond of slack keeps float rounding from finding the same conflict forever.
+                conflicts = [other for other in others if abs(other - restartAt) < self.restartSpacing - 0.001]
+                if len(conflicts) < self.maxConcurrent:
+                    break
+                restartAt = min(conflicts) + self.restartSpacing
+            plan = dict((planName, planTime) for (planName, planTime) in plan.items() if planTime + self.restartSpacing > now)
+            plan[name] = restartAt
+            jsonfile.write_json(self.planFile, plan)
+        return restartAt
+
+    def release_reservation(self, name):
+        """Remove the reservation for instance name"""
+        with FileLock(self.planLockPath):
+            plan = jsonfile.read_json(self.planFile, {})
+            if isinstance(plan, dict) and plan.pop(name, None) is not None:
+                jsonfile.write_json(self.planFile, plan)
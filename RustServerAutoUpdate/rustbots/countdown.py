@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+class CountdownPolicy:
+    """Decide how long the restart countdown may still run from how many players are online.
+       max_remaining returns the most seconds the countdown may have left, or None to keep it as scheduled.
+       The countdown is only ever shortened, so a policy never delays a restart.
+       This base policy always keeps the full countdown."""
+    name = "fixed"
+
+    def max_remaining(self, players):
+        return None
+
+class EmptyServerPolicy(CountdownPolicy):
+    """Restart straight away when nobody is online. Otherwise keep the full countdown."""
+    name = "empty"
+
+    def max_remaining(self, players):
+        return 0 if players <= 0 else None
+
+class PlayerScaledPolicy(CountdownPolicy):
+    """Shorten the countdown as players log off.
+       limits is a list of (most players, most minutes left). The first entry covering the player count applies."""
+    name = "scaled"
+
+    def __init__(self, limits):
+        self.limits = sorted(limits)
+
+    def max_remaining(self, players):
+        for (maxPlayers, minutes) in self.limits:
+            if players <= maxPlayers:
+                return minutes * 60
+        return None
+
+def parse_limits(text):
+    """Parse "players:minutes, players:minutes" into a list of (players, minutes). Raises ValueError."""
+    limits = []
+    for pair in text.split(","):
+        if not pair.strip():
+            continue
+        players, separator, minutes = pair.partition(":")
+        if not separator:
+            raise ValueError("Expected players:minutes, got " + pair.strip())
+        limits.append((int(players), float(minutes)))
+    return limits
+
+def create_policy(name, limits = ""):
+    """Return the policy called name. limits is used by the scaled policy. Raises ValueError for an unknown name."""
+    name = name.strip().lower()
+    if name == CountdownPolicy.name:
+        return CountdownPolicy()
+    if name == EmptyServerPolicy.name:
+        return EmptyServerPolicy()
+    if name == PlayerScaledPolicy.name:
+        return PlayerScaledPolicy(parse_limits(limits))
+    raise ValueError("Unknown countdown policy " + name + ". Use fixed, empty or scaled.")
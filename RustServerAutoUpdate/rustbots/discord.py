@@ -1,6 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import requests, json, sys, getopt
+import json, sys, getopt, threading, time
+from collections import deque
+from concurrent.futures import Future
+try:
+    from rustbots import httpsession, metrics
+except ImportError:
+    import httpsession, metrics
 
 class ServerInformation:
     def __init__(self, gameName, serverName, serverIP, serverHostName = ""):
@@ -12,54 +18,223 @@ class ServerInformation:
         self.serverIP = serverIP
         self.serverHostName = serverHostName
 
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+
+DISCORD_POST_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_discord_post_seconds", "Discord webhook POST latency", ("status",))
+DISCORD_RATE_LIMITED = metrics.REGISTRY.counter("rustserverautoupdate_discord_rate_limited_total", "Discord webhook POSTs answered with 429")
+
+class QueuedMessage:
+    """Embed waiting to be posted to a webhook.
+       Messages with the same key share a username and avatar and can be posted together."""
+    def __init__(self, username, avatar, embed, wait):
+        self.key = (username, avatar)
+        self.embed = embed
+        self.wait = wait
+        self.future = Future()
+
+def embed_characters(embed):
+    """Characters Discord counts towards the combined embed limit"""
+    count = len(embed.get("title", "")) + len(embed.get("description", ""))
+    count += len(embed.get("author", {}).get("name", "")) + len(embed.get("footer", {}).get("text", ""))
+    for field in embed.get("fields", []):
+        count += len(field.get("name", "")) + len(field.get("value", ""))
+    return count
+
+class WebhookQueue:
+    """Send queue for a single webhook, shared by every DiscordBot posting to it in this process.
+       Messages waiting with the same username and avatar are combined into one post of up to 10 embeds.
+       The rate limit bucket headers are followed and a 429 is retried after the time Discord asks for."""
+    def __init__(self, webHook, session, timeout = httpsession.DEFAULT_TIMEOUT, batchDelay = 0.25, maxAttempts = 5):
+        """batchDelay is how long to wait for more messages before posting when more than one is already waiting.
+           maxAttempts limits retries after 429."""
+        self.webHook = webHook
+        self.session = session
+        self.timeout = timeout
+        self.batchDelay = batchDelay
+        self.maxAttempts = maxAttempts
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.remaining = None
+        self.resetAt = 0
+        self.thread = None
+
+    def put(self, username, avatar, embed, wait = False):
+        """Queue an embed. Return a Future with the response text.
+           The text is only useful when wait is True. Otherwise Discord returns an empty body."""
+        item = QueuedMessage(username, avatar, embed, wait)
+        with self.condition:
+            self.items.append(item)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="WebhookQueue", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return item.future
+
+    def take_batch(self):
+        """Wait for messages and remove the oldest along with every later message that can share its post"""
+        with self.condition:
+            while not self.items:
+                self.condition.wait()
+            burst = len(self.items) > 1
+        #A lone message is posted straight away. Several waiting at once are likely part of a burst, so give the rest a moment to arrive.
+        if burst:
+            time.sleep(self.batchDelay)
+        with self.condition:
+            batch = []
+            characters = 0
+            skipped = deque()
+            while self.items and len(batch) < MAX_EMBEDS:
+                item = self.items.popleft()
+                if batch and (item.key != batch[0].key or characters + embed_characters(item.embed) > MAX_EMBED_CHARACTERS):
+                    skipped.append(item)
+                    continue
+                if item.future.set_running_or_notify_cancel():
+                    batch.append(item)
+                    characters += embed_characters(item.embed)
+            skipped.extend(self.items)
+            self.items = skipped
+        return batch
+
+    def run(self):
+        """Worker thread. Post batches until the process exits."""
+        while True:
+            batch = self.take_batch()
+            if batch:
+                try:
+                    responseText = self.post(batch)
+                except Exception as ex:
+                    for item in batch:
+                        item.future.set_exception(ex)
+                else:
+                    for item in batch:
+                        item.future.set_result(responseText)
+
+    def wait_for_bucket(self):
+        """Sleep until the rate limit bucket resets if it is empty"""
+        if self.remaining is not None and self.remaining <= 0:
+            wait = self.resetAt - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.remaining = None
+
+    def update_bucket(self, r):
+        """Record the rate limit bucket from the response headers. Return seconds to wait on a 429, else None."""
+        now = time.monotonic()
+        try:
+            self.remaining = int(r.headers["X-RateLimit-Remaining"])
+            self.resetAt = now + float(r.headers["X-RateLimit-Reset-After"])
+        except (KeyError, ValueError):
+            pass
+        if r.status_code != 429:
+            return None
+        try:
+            retryAfter = float(r.json()["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            try:
+                retryAfter = float(r.headers.get("Retry-After", 1))
+            except ValueError:
+                retryAfter = 1
+        self.remaining = 0
+        self.resetAt = now + retryAfter
+        return retryAfter
+
+    def post(self, batch):
+        """Post a batch as one message. Only ask Discord to wait for the message if a caller needs the reply."""
+        headers = {"Content-Type" : "application/json"}
+        username, avatar = batch[0].key
+        jsonDict = {"username": username,
+                    "avatar_url": avatar,
+                    "file": "content",
+                    "embeds": [item.embed for item in batch]}
+        url = self.webHook + ("?wait=true" if any(item.wait for item in batch) else "")
+        data = json.dumps(jsonDict)
+        for attempt in range(self.maxAttempts):
+            self.wait_for_bucket()
+            start = time.monotonic()
+            r = self.session.post(url, headers=headers, data=data, timeout=self.timeout)
+            DISCORD_POST_SECONDS.observe(time.monotonic() - start, status=r.status_code)
+            if r.status_code == 429:
+                DISCORD_RATE_LIMITED.inc()
+            if self.update_bucket(r) is None:
+                return r.text
+        raise DiscordBotError(str(r.status_code), r.text, "Rate Limited After " + str(self.maxAttempts) + " Attempts")
+
+WEBHOOK_QUEUES = {}
+WEBHOOK_QUEUES_LOCK = threading.Lock()
+
+def get_webhook_queue(webHook, session, timeout = httpsession.DEFAULT_TIMEOUT):
+    """Return the process wide WebhookQueue for webHook, creating it on first use"""
+    with WEBHOOK_QUEUES_LOCK:
+        queue = WEBHOOK_QUEUES.get(webHook)
+        if queue is None:
+            queue = WebhookQueue(webHook, session, timeout)
+            WEBHOOK_QUEUES[webHook] = queue
+        return queue
+
 class DiscordBot:
     """Bot to Send Message to Discord Server Using Webhook"""
-    def __init__(self, webHook, botName, botAvatar = ""):
+    def __init__(self, webHook, botName, botAvatar = "", session = None, timeout = httpsession.DEFAULT_TIMEOUT):
         """Setup reusable bot information
         webHook from Discord Bot Setup. Should be URL.
         botName is not required, but will be displayed as user on Discord.
-        botAvatar allows custom user icon to be displayed. URL."""
+        botAvatar allows custom user icon to be displayed. URL.
+        session is a requests Session to share connections with other bots. timeout is in seconds."""
         self.webHook = webHook
         self.botName = botName
         self.botAvatar = botAvatar
+        self.session = session if session is not None else httpsession.create_session()
+        self.timeout = timeout
+        self.queue = get_webhook_queue(webHook, self.session, timeout)
+
+    def build_embed(self, ServerInformation, message, title = "🚧 ALERT"):
+        """Embed for message and title with the server details as fields"""
+        return {"color": "2067276",
+                "author": {"name": title, "icon_url": self.botAvatar},
+                "title": "",
+                "description": message,
+                "url": "",
+                "type": "content",
+                "thumbnail": {},
+                "footer": {"text": "Hostname: " + ServerInformation.serverHostName, "icon_url": ""},
+                "fields": [{
+                                "name": "Game",
+                                "value": ServerInformation.gameName,
+                                "inline": True,
+                            },
+                            {
+                                "name": "Server IP",
+                                "value": ServerInformation.serverIP,
+                                "inline": True
+                            },
+                            {
+                                "name": "Server Name",
+                                "value": ServerInformation.serverName,
+                                "inline": True
+                            }
+                ]
+        }
+
+    def queue_message(self, ServerInformation, message, title = "🚧 ALERT", wait = False):
+        """Queue message and title for the webhook without blocking. Return a concurrent.futures.Future.
+        Messages queued together for the same webhook are posted as one message with several embeds.
+        Set wait to have the Future return the message Discord created."""
+        return self.queue.put(self.botName, self.botAvatar, self.build_embed(ServerInformation, message, title), wait)
+
     def send_message(self, ServerInformation, message, title = "🚧 ALERT"):
         """Send message and title to discord server
         ServerInformation comes from class and is required.
         message is what should be said by discord bot.
         title can be anything, but is used as an indicator for type of message."""
-        headers = {"Content-Type" : "application/json"}
-        jsonDict = {"username": self.botName,
-                  "avatar_url": self.botAvatar,
-                  "file": "content",
-                  "embeds": [{"color": "2067276",
-                            "author": {"name": title, "icon_url": self.botAvatar},
-                            "title": "",
-                            "description": message,
-                            "url": "",
-                            "type": "content",
-                            "thumbnail": {},
-                            "footer": {"text": "Hostname: " + ServerInformation.serverHostName, "icon_url": ""},
-                            "fields": [{
-                                            "name": "Game",
-                                            "value": ServerInformation.gameName,
-                                            "inline": True,
-                                        },
-                                        {
-                                            "name": "Server IP",
-                                            "value": ServerInformation.serverIP,
-                                            "inline": True
-                                        },
-                                        {
-                                            "name": "Server Name",
-                                            "value": ServerInformation.serverName,
-                                            "inline": True
-                                        }
-                            ]
-                  }]
-        }
-        r = requests.post(self.webHook + "?wait=true", headers=headers, data=json.dumps(jsonDict))
-        return r.text
-        
+        return self.queue_message(ServerInformation, message, title, True).result()
+
+class DiscordBotError(Exception):
+    def __init__(self, responsecode, detail, msg):
+        Exception.__init__(self, msg)
+        self.response = responsecode
+        self.text = detail
+        self.msg = msg
+
 def argumenthelp():
     print("\nSyntax: discord.py -w <webhook> -b <BotName> -m <Message> [-a <botAvatar> -t <Message Title> -g <gameName> -s <serverName> -i <serverIP> -n <serverHostName>]\n"
           "Example: discord.py -w https://discordapp.com/api/webhooks/#####/###XXX### -b 'My Discord Bot' -m 'Hello World'\n"
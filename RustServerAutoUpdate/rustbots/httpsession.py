@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 10
+
+def create_session(retries = 3, backoffFactor = 0.5, poolSize = 10):
+    """Return a requests Session that keeps connections alive and reuses them.
+       Failed connections are retried for every method. Responses of 502, 503 and 504 are
+       only retried for idempotent methods, so a webhook POST is never sent twice.
+       One session can be shared by every bot in the process."""
+    retry = Retry(total=retries, backoff_factor=backoffFactor, status_forcelist=(502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
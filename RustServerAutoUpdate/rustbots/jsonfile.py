@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json, os, stat, tempfile
+
+def read_json(path, default = None):
+    """Return the decoded contents of a JSON file.
+       default is returned if the file is missing or cannot be decoded."""
+    try:
+        with open(path, "r", encoding="utf-8") as jsonFile:
+            return json.load(jsonFile)
+    except (OSError, ValueError):
+        return default
+
+def make_private_dir(path):
+    """Create directory path readable only by this user, or check an existing one can be trusted.
+       Raises PermissionError if it is owned by another user or writable by group or others,
+       since anyone who can write there can change what is read back from it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise NotADirectoryError(path + " is not a directory")
+    if not hasattr(os, "getuid"):
+        return
+    if info.st_uid != os.getuid():
+        raise PermissionError(path + " is owned by another user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(path + " is writable by other users")
+
+def write_json(path, data):
+    """Write data to a JSON file atomically.
+       The file is written to a temporary file in the same directory and renamed over the target,
+       so readers never see a partially written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tempPath = tempfile.mkstemp(prefix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tempFile:
+            json.dump(data, tempFile)
+            tempFile.flush()
+            os.fsync(tempFile.fileno())
+        os.replace(tempPath, path)
+    except BaseException:
+        try:
+            os.unlink(tempPath)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json, logging, logging.handlers, os, queue, sys
+from datetime import datetime, timezone
+
+LOGGER_NAME = "rustserverautoupdate"
+#Attributes every LogRecord has. Anything else on a record was passed in extra and is written as a field.
+RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    """Format each record as one JSON object per line.
+       Fields passed with extra, such as instance, phase and timings, are written next to the message."""
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "message": record.getMessage()}
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    """Plain text for the console: the message, prefixed with the instance when one is set"""
+    def format(self, record):
+        message = record.getMessage()
+        instance = getattr(record, "instance", None)
+        if instance:
+            message = "[" + instance + "] " + message
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
+
+class InstanceLogger(logging.LoggerAdapter):
+    """Logger adapter adding the instance section name to every record. Fields in extra are kept."""
+    def process(self, msg, kwargs):
+        kwargs["extra"] = dict(self.extra, **kwargs.get("extra", {}))
+        return msg, kwargs
+
+def get_instance_logger(section, level = "INFO"):
+    """Logger for one instance, named rustserverautoupdate.<section>, with its own level"""
+    logger = logging.getLogger(LOGGER_NAME + "." + section)
+    logger.setLevel(level.strip().upper() or "INFO")
+    return InstanceLogger(logger, {"instance": section})
+
+def start_logging(logFile = None, maxBytes = 10 * 1024 * 1024, backupCount = 5, console = True):
+    """Send every rustserverautoupdate record through a queue to a listener thread, so logging never blocks the caller.
+       The listener writes JSON lines to logFile, rotated at maxBytes, and plain text to stdout.
+       Return the QueueListener. Stop it on exit to flush what is left."""
+    handlers = []
+    if logFile:
+        os.makedirs(os.path.dirname(os.path.abspath(logFile)), exist_ok=True)
+        fileHandler = logging.handlers.RotatingFileHandler(logFile, maxBytes=maxBytes, backupCount=backupCount, encoding="utf-8")
+        fileHandler.setFormatter(JSONFormatter())
+        handlers.append(fileHandler)
+    if console:
+        consoleHandler = logging.StreamHandler(sys.stdout)
+        consoleHandler.setFormatter(ConsoleFormatter())
+        handlers.append(consoleHandler)
+    logQueue = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(logQueue))
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(logQueue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Metric:
+    """One named metric with a value per set of label values. Safe to update from any thread."""
+    metricType = "untyped"
+
+    def __init__(self, name, helpText, labelNames = ()):
+        self.name = name
+        self.helpText = helpText
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelNames):
+            raise ValueError(self.name + " takes labels " + ", ".join(self.labelNames))
+        return tuple(str(labels[labelName]) for labelName in self.labelNames)
+
+    def label_text(self, key, extra = ()):
+        pairs = list(zip(self.labelNames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(labelName + '="' + escape_label(value) + '"' for (labelName, value) in pairs) + "}"
+
+    def get(self, **labels):
+        """Current value of the series with these labels, or None"""
+        key = self.key(labels)
+        with self.lock:
+            return self.values.get(key)
+
+    def remove(self, **labels):
+        """Drop every series whose labels include the given ones"""
+        with self.lock:
+            for key in list(self.values):
+                if all(key[self.labelNames.index(labelName)] == str(value) for (labelName, value) in labels.items()):
+                    del self.values[key]
+
+    def samples(self):
+        """(suffix, label text, value) for every series"""
+        with self.lock:
+            return [("", self.label_text(key), value) for (key, value) in sorted(self.values.items())]
+
+    def render(self):
+        lines = ["# HELP " + self.name + " " + self.helpText, "# TYPE " + self.name + " " + self.metricType]
+        for (suffix, labelText, value) in self.samples():
+            lines.append(self.name + suffix + labelText + " " + format_value(value))
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Value that only goes up"""
+    metricType = "counter"
+
+    def inc(self, amount = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    metricType = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Summary(Metric):
+    """Count and sum of observations, such as request durations. Also keeps the largest observation."""
+    metricType = "summary"
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            count, total, largest = self.values.get(key, (0, 0.0, value))
+            self.values[key] = (count + 1, total + value, max(largest, value))
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (count, total, largest) in sorted(self.values.items()):
+                samples.append(("", self.label_text(key, [("quantile", "1")]), largest))
+                samples.append(("_sum", self.label_text(key), total))
+                samples.append(("_count", self.label_text(key), count))
+        return samples
+
+class Registry:
+    """Collection of metrics rendered together in the text exposition format"""
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """Add metric, or return the one already registered under its name"""
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, helpText, labelNames = ()):
+        return self.register(Counter(name, helpText, labelNames))
+
+    def gauge(self, name, helpText, labelNames = ()):
+        return self.register(Gauge(name, helpText, labelNames))
+
+    def summary(self, name, helpText, labelNames = ()):
+        return self.register(Summary(name, helpText, labelNames))
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+class MetricsServer:
+    """Minimal HTTP server on the event loop answering every GET with the registry in the text exposition format"""
+    def __init__(self, registry = REGISTRY, host = "127.0.0.1", port = 9150):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        return self.server
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = await asyncio.wait_for(reader.readline(), 10)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = requestLine.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+                status, body = "405 Method Not Allowed", b""
+            else:
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+            headers = ("HTTP/1.1 " + status + "\r\nContent-Type: " + CONTENT_TYPE + "\r\nContent-Length: " + str(len(body)) +
+                       "\r\nConnection: close\r\n\r\n")
+            writer.write(headers.encode("latin-1") + (body if parts and parts[0] != "HEAD" else b""))
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
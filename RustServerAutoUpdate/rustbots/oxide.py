@@ -1,56 +1,269 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import requests, json, sys, getopt, re, glob, os.path
+import json, sys, getopt, re, glob, os.path, hashlib, time, threading
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+try:
+    from rustbots import jsonfile, httpsession, metrics
+except ImportError:
+    import jsonfile, httpsession, metrics
 
-class UpdateCheck:
-    """Used to check local oxide version against latest release"""
-    def __init__(self, oxideLogDir, gitURL = "https://api.github.com/repositories/94599577/releases/latest"):
-        """Initiate by assigning directory. Optionally point to different release. Not recommended"""
-        self.oxideLogDir = os.path.join("", oxideLogDir)
+VERSION_PATTERN = re.compile(rb"Loaded extension Rust v(\d+\.\d+\.\d+)")
+REVERSE_BLOCK_SIZE = 64 * 1024
+
+GITHUB_REQUEST_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_github_request_seconds", "GitHub release API request latency", ("status",))
+GITHUB_RATELIMIT_REMAINING = metrics.REGISTRY.gauge("rustserverautoupdate_github_ratelimit_remaining", "X-RateLimit-Remaining of the last GitHub response")
+LOG_SCAN_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_log_scan_seconds", "Time to find the running version in the Oxide logs")
+LOG_BYTES_READ = metrics.REGISTRY.counter("rustserverautoupdate_log_bytes_read_total", "Bytes of Oxide log read looking for the running version")
+
+def default_cache_dir():
+    """Per user cache directory, $XDG_CACHE_HOME/rustserverautoupdate or ~/.cache/rustserverautoupdate"""
+    cacheHome = os.environ.get("XDG_CACHE_HOME", "")
+    if not os.path.isabs(cacheHome):
+        cacheHome = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cacheHome, "rustserverautoupdate")
+
+class LogCursor:
+    """Scan position within a single oxide log file.
+       inode and size identify the file as it was when last read.
+       offset is where the next unread line starts, lastMatch the newest version seen before it."""
+    def __init__(self, inode, size = 0, offset = 0, lastMatch = None):
+        self.inode = inode
+        self.size = size
+        self.offset = offset
+        self.lastMatch = lastMatch
+
+class ReleaseCache:
+    """Release responses stored on disk and shared by every instance on the host.
+       Responses are revalidated with ETag/If-Modified-Since so an unchanged release costs a 304.
+       The GitHub rate limit headers decide when the next request is allowed. Until then
+       every instance is served the cached response without touching the network."""
+    def __init__(self, cacheDir = None, minPollInterval = 60, reserveRequests = 5):
+        """cacheDir is shared between instances, default_cache_dir() if None. It must belong to this user
+           and not be writable by anyone else, or the cache is not used. minPollInterval is the least number of seconds
+           between requests for the same URL across all instances. reserveRequests is how many
+           requests to keep in hand before the rate limit window resets."""
+        self.cacheDir = cacheDir or default_cache_dir()
+        self.minPollInterval = minPollInterval
+        self.reserveRequests = reserveRequests
+
+    def cache_file(self, gitURL):
+        """Path of the cache entry for gitURL"""
+        urlHash = hashlib.sha1(gitURL.encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheDir, "release_" + urlHash + ".json")
+
+    def load(self, gitURL):
+        """Return the cache entry for gitURL, or an empty entry"""
+        try:
+            jsonfile.make_private_dir(self.cacheDir)
+        except OSError:
+            #Entries in a directory others can write to could be planted. Ask GitHub instead.
+            return {}
+        entry = jsonfile.read_json(self.cache_file(gitURL), {})
+        if not isinstance(entry, dict):
+            entry = {}
+        return entry
+
+    def save(self, gitURL, entry):
+        """Store the cache entry for gitURL"""
+        try:
+            jsonfile.make_private_dir(self.cacheDir)
+            jsonfile.write_json(self.cache_file(gitURL), entry)
+        except OSError:
+            #The cache only saves requests. Failing to write it must not fail the update check.
+            pass
+
+    def next_poll_time(self, headers, now):
+        """Earliest time in seconds since the epoch the URL should be requested again.
+           Retry-After is obeyed as is. Otherwise the remaining requests are spread evenly
+           until the rate limit resets, but never closer together than minPollInterval."""
+        notBefore = now + self.minPollInterval
+        retryAfter = headers.get("Retry-After")
+        if retryAfter:
+            try:
+                return max(notBefore, now + float(retryAfter))
+            except ValueError:
+                try:
+                    return max(notBefore, parsedate_to_datetime(retryAfter).timestamp())
+                except (TypeError, ValueError):
+                    return notBefore
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return notBefore
+        if reset <= now:
+            return notBefore
+        if remaining <= self.reserveRequests:
+            return max(notBefore, reset)
+        return max(notBefore, now + (reset - now) / (remaining - self.reserveRequests))
+
+class ReleaseInfo:
+    """Release details decoded once from the Git API response"""
+    def __init__(self, tagName, assets, publishedAt = None, gitJSONString = ""):
+        """tagName is the release version. assets maps 'linux' and 'windows' to the first
+           matching asset dict from the release. publishedAt is a timezone aware datetime or None."""
+        self.tagName = tagName
+        self.assets = assets
+        self.publishedAt = publishedAt
+        self.gitJSONString = gitJSONString
+
+    @classmethod
+    def from_json(cls, gitJSONString):
+        """Build ReleaseInfo from the API response string"""
+        reply = json.loads(gitJSONString)
+        tagName = reply.get("tag_name") if isinstance(reply, dict) else None
+        if tagName is None:
+            raise UpdateCheckError("200", gitJSONString, "Could Not Find tag_name")
+        assets = {}
+        for asset in reply.get("assets") or []:
+            url = asset.get("browser_download_url")
+            if url:
+                assets.setdefault("linux" if "linux" in url else "windows", asset)
+        publishedAt = None
+        if reply.get("published_at"):
+            try:
+                publishedAt = datetime.strptime(reply["published_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            except ValueError:
+                pass
+        return cls(tagName, assets, publishedAt, gitJSONString)
+
+    def get_url(self, linux = True):
+        """Download url of the linux asset, or the windows asset if linux is False"""
+        asset = self.assets.get("linux" if linux else "windows")
+        if asset is None:
+            raise UpdateCheckError("200", self.gitJSONString, "Could Not Find Download URL")
+        return asset["browser_download_url"]
+
+class ReleaseFeed:
+    """Latest release for one Git API URL.
+       A feed can be shared by several UpdateChecks, for example every instance in one process watching
+       the same repository. Calls within maxAge seconds of the last fetch are answered from memory,
+       and calls made at the same time wait on a single request."""
+    def __init__(self, gitURL = "https://api.github.com/repositories/94599577/releases/latest", releaseCache = None, session = None, timeout = httpsession.DEFAULT_TIMEOUT, maxAge = 0):
+        """releaseCache is an optional ReleaseCache used to make conditional requests to the API.
+           session is a requests Session to share connections with other bots. timeout is in seconds."""
         self.gitURL = gitURL
+        self.releaseCache = releaseCache
+        self.session = session if session is not None else httpsession.create_session()
+        self.timeout = timeout
+        self.maxAge = maxAge
+        self.lock = threading.Lock()
+        self.gitJSONString = None
+        self.releaseInfo = None
+        self.fetchedAt = 0
 
     def get_json_from_api(self):
         """Query Git API for json String with Latest Update Information"""
-        r = requests.get(self.gitURL)
+        if self.releaseCache is not None:
+            return self.get_json_from_cache()
+        r = self.request()
         if r.status_code == 200:
             return r.text
         else:
             raise UpdateCheckError(str(r.status_code), r.text, "Response Status Code Failure")
 
+    def request(self, headers = None):
+        """GET gitURL, recording latency, status and the rate limit left"""
+        start = time.monotonic()
+        r = self.session.get(self.gitURL, headers=headers, timeout=self.timeout)
+        GITHUB_REQUEST_SECONDS.observe(time.monotonic() - start, status=r.status_code)
+        remaining = r.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            GITHUB_RATELIMIT_REMAINING.set(int(remaining))
+        return r
+
+    def get_json_from_cache(self):
+        """Query Git API through the release cache.
+           The cached response is returned without a request while the rate limit asks us to wait.
+           Otherwise a conditional request is made and a 304 reuses the cached response."""
+        entry = self.releaseCache.load(self.gitURL)
+        cachedBody = entry.get("body")
+        now = time.time()
+        if cachedBody and now < entry.get("notBefore", 0):
+            return cachedBody
+        headers = {}
+        if cachedBody and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if cachedBody and entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        r = self.request(headers)
+        if r.status_code == 304 and cachedBody:
+            body = cachedBody
+        elif r.status_code == 200:
+            body = r.text
+            entry = {"body": body,
+                     "etag": r.headers.get("ETag", ""),
+                     "lastModified": r.headers.get("Last-Modified", "")}
+        elif r.status_code in (403, 429) and cachedBody:
+            #Rate limited. Serve the last known release until the limit resets.
+            body = cachedBody
+        else:
+            raise UpdateCheckError(str(r.status_code), r.text, "Response Status Code Failure")
+        entry["notBefore"] = self.releaseCache.next_poll_time(r.headers, now)
+        self.releaseCache.save(self.gitURL, entry)
+        return body
+
+    def get_json(self):
+        """Latest release json String, fetched at most once every maxAge seconds"""
+        with self.lock:
+            if self.gitJSONString is None or time.monotonic() - self.fetchedAt >= self.maxAge:
+                gitJSONString = self.get_json_from_api()
+                if gitJSONString != self.gitJSONString:
+                    self.gitJSONString = gitJSONString
+                    self.releaseInfo = None
+                self.fetchedAt = time.monotonic()
+            return self.gitJSONString
+
+    def get_release_info(self):
+        """Latest ReleaseInfo. The response is decoded once no matter how many checks share the feed."""
+        gitJSONString = self.get_json()
+        with self.lock:
+            if self.releaseInfo is None or self.releaseInfo.gitJSONString is not gitJSONString:
+                self.releaseInfo = ReleaseInfo.from_json(gitJSONString)
+            return self.releaseInfo
+
+class UpdateCheck:
+    """Used to check local oxide version against latest release"""
+    def __init__(self, oxideLogDir, gitURL = "https://api.github.com/repositories/94599577/releases/latest", scanMode = "reverse", releaseCache = None, session = None, timeout = httpsession.DEFAULT_TIMEOUT, releaseFeed = None):
+        """Initiate by assigning directory. Optionally point to different release. Not recommended
+           scanMode 'reverse' reads the logs newest first from the end and stops at the first version found.
+           scanMode 'forward' reads every log from oldest to newest.
+           releaseCache, session and timeout are passed to the ReleaseFeed for gitURL.
+           releaseFeed replaces that feed with one shared with other UpdateChecks."""
+        self.oxideLogDir = os.path.join("", oxideLogDir)
+        self.gitURL = gitURL
+        self.scanMode = scanMode
+        if releaseFeed is None:
+            releaseFeed = ReleaseFeed(gitURL, releaseCache, session, timeout)
+        self.releaseFeed = releaseFeed
+        self.logCursors = {}
+
+    def get_json_from_api(self):
+        """Query Git API for json String with Latest Update Information"""
+        return self.releaseFeed.get_json()
+
+    def get_release_info(self):
+        """Query Git API and decode the response once into a ReleaseInfo"""
+        return self.releaseFeed.get_release_info()
+
     def get_latest_version(self, gitJSONString = ""):
         """Get latest version from GitURL"""
         if not gitJSONString.strip():
             gitJSONString = self.get_json_from_api()
-        reply = json.loads(gitJSONString)
-        for x in reply:
-            if x == "tag_name":
-                return reply[x]
-        raise UpdateCheckError("200", gitJSONString, "Could Not Find tag_name")
+        return ReleaseInfo.from_json(gitJSONString).tagName
 
     def get_latest_url(self, linux = True,  gitJSONString = ""):
         """Get latest linux version download url from GitURL. Optionally retrieve windows url instead of Linux"""
         if not gitJSONString.strip():
             gitJSONString = self.get_json_from_api()
-        reply = json.loads(gitJSONString)
-        for x in reply:
-            if x in "assets":
-                for a in reply[x]:
-                    for b in a:
-                        if b == "browser_download_url":
-                            if "linux" in a[b] and linux:
-                                return a[b]
-                            elif not "linux" in a[b] and not linux:
-                                return a[b]
-        raise UpdateCheckError("200", gitJSONString, "Could Not Find Download URL")
+        return ReleaseInfo.from_json(gitJSONString).get_url(linux)
 
-    def get_running_version(self):
-        """Get running version from local logs. Checks the current and last month logs.
+    def get_log_file_list(self):
+        """Return this month's and last month's oxide logs, oldest first.
            Oxide rolls the logs over nightly, and doesn't necessarily write the latest version on roll over.
            To make sure the latest version is found, we will iterate over the past 2 months of logs.
            This was the compromise between reading every log ( could potentially be a lot ) and reading too few."""
-        pattern = "Loaded extension Rust v(\d+\.\d+\.\d+)"
-        lastMatch = "0.0.0"
         timeZN = timezone(timedelta(hours=0))
         tm = datetime.now(timeZN).timetuple()
         startLog = "oxide_"
@@ -71,24 +284,123 @@ class UpdateCheck:
         #glob does not necessarily return these in order. Need to sort them to make sure the last version is the latest.
         logFileNameList = sorted(glob.glob(os.path.join(self.oxideLogDir, lastMonthsLogs)))
         logFileNameList.extend(sorted(glob.glob(os.path.join(self.oxideLogDir, thisMonthsLogs))))
-        numLogFiles = len(logFileNameList)
-
-        if numLogFiles != 0:
-            for logFile in logFileNameList:
-                with open(logFile) as rustLogFile:                    
-                    for currentLine in rustLogFile:
-                        if "Rust" in currentLine:
-                            currentMatch = re.findall(pattern, currentLine)
-                            if len(currentMatch) != 0:
-                                lastMatch = currentMatch[0]
-        return lastMatch   
+        return logFileNameList
+
+    def find_last_version(self, rustLogFile):
+        """Read an open binary log backwards in blocks and return (version, lineEnd, size).
+           version is the last version in the file or None, lineEnd the offset just past the last
+           complete line and size the file size when read. Stops at the first match from the end."""
+        rustLogFile.seek(0, os.SEEK_END)
+        size = rustLogFile.tell()
+        position = size
+        lineEnd = None
+        carry = b""
+        while position > 0:
+            readSize = min(REVERSE_BLOCK_SIZE, position)
+            position -= readSize
+            rustLogFile.seek(position)
+            block = rustLogFile.read(readSize) + carry
+            LOG_BYTES_READ.inc(readSize)
+            if lineEnd is None:
+                #Skip a partially written last line. The forward scan picks it up once it is complete.
+                blockEnd = block.rfind(b"\n") + 1
+                if blockEnd == 0:
+                    carry = block
+                    continue
+                lineEnd = position + blockEnd
+                block = block[:blockEnd]
+            #The first line in the block may be cut off. Hold it back and search it with the previous block.
+            blockStart = 0 if position == 0 else block.find(b"\n") + 1
+            currentMatch = None
+            for currentMatch in VERSION_PATTERN.finditer(block, blockStart):
+                pass
+            if currentMatch is not None:
+                return (currentMatch.group(1).decode("ascii"), lineEnd, size)
+            carry = block[:blockStart]
+        return (None, lineEnd or 0, size)
+
+    def scan_log_file(self, logFile, reverse = False):
+        """Return the newest version found in logFile, or None if it has none.
+           Only the bytes appended since the last scan are read. A file that has not
+           changed size is skipped entirely. A new inode or a file smaller than last time
+           means it was rotated or truncated, so it is rescanned from the start, or from
+           the end backwards if reverse is True."""
+        try:
+            fileStat = os.stat(logFile)
+        except OSError:
+            self.logCursors.pop(logFile, None)
+            return None
+        cursor = self.logCursors.get(logFile)
+        if cursor is None or cursor.inode != fileStat.st_ino or fileStat.st_size < cursor.size:
+            if reverse:
+                with open(logFile, "rb") as rustLogFile:
+                    lastMatch, lineEnd, size = self.find_last_version(rustLogFile)
+                self.logCursors[logFile] = LogCursor(fileStat.st_ino, size, lineEnd, lastMatch)
+                return lastMatch
+            cursor = LogCursor(fileStat.st_ino)
+            self.logCursors[logFile] = cursor
+        elif fileStat.st_size == cursor.size:
+            return cursor.lastMatch
+        with open(logFile, "rb") as rustLogFile:
+            rustLogFile.seek(cursor.offset)
+            newData = rustLogFile.read()
+        LOG_BYTES_READ.inc(len(newData))
+        #Only scan complete lines. A partially written line is read again on the next check.
+        lineEnd = newData.rfind(b"\n") + 1
+        currentMatch = None
+        for currentMatch in VERSION_PATTERN.finditer(newData, 0, lineEnd):
+            pass
+        if currentMatch is not None:
+            cursor.lastMatch = currentMatch.group(1).decode("ascii")
+        cursor.size = cursor.offset + len(newData)
+        cursor.offset += lineEnd
+        return cursor.lastMatch
+
+    def get_running_version_forward(self, logFileNameList):
+        """Scan every log oldest to newest and keep the last version found."""
+        lastMatch = "0.0.0"
+        for logFile in logFileNameList:
+            currentMatch = self.scan_log_file(logFile)
+            if currentMatch is not None:
+                lastMatch = currentMatch
+        return lastMatch
+
+    def get_running_version_reverse(self, logFileNameList):
+        """Scan the logs newest to oldest and return the first version found."""
+        for logFile in reversed(logFileNameList):
+            currentMatch = self.scan_log_file(logFile, reverse = True)
+            if currentMatch is not None:
+                return currentMatch
+        return "0.0.0"
+
+    def get_running_version(self):
+        """Get running version from local logs. Checks the current and last month logs.
+           Scan positions are kept between calls so each check only reads new log lines.
+           Reverse mode falls back to the forward scan if a log cannot be read backwards."""
+        start = time.monotonic()
+        try:
+            return self.scan_running_version()
+        finally:
+            LOG_SCAN_SECONDS.observe(time.monotonic() - start)
+
+    def scan_running_version(self):
+        logFileNameList = self.get_log_file_list()
+        #Forget files that have aged out of the two month window.
+        for logFile in set(self.logCursors).difference(logFileNameList):
+            del self.logCursors[logFile]
+        if self.scanMode == "reverse":
+            try:
+                return self.get_running_version_reverse(logFileNameList)
+            except OSError:
+                self.logCursors.clear()
+        return self.get_running_version_forward(logFileNameList)
 
     def check_update(self, linux = True):
         """Check for updates. Return tuple (Boolean update required, String update url, String runningversion, String latestversion)"""
-        gitJSON = self.get_json_from_api()
+        releaseInfo = self.get_release_info()
         runningVersion = self.get_running_version()
-        latestVersion = self.get_latest_version(gitJSON)
-        updateURL = self.get_latest_url(linux, gitJSON)
+        latestVersion = releaseInfo.tagName
+        updateURL = releaseInfo.get_url(linux)
         if runningVersion.strip() != latestVersion.strip():            
             return (True, updateURL, runningVersion, latestVersion)
         else:
@@ -101,7 +413,7 @@ class UpdateCheckError(Exception):
         self.msg = msg
 
 def argumenthelp():
-    print("\nSyntax: oxide.py -l <Oxide Log Dir> [-g <GitHub URL> -w]\n"
+    print("\nSyntax: oxide.py -l <Oxide Log Dir> [-g <GitHub URL> -w -f -c <Cache Dir>]\n"
           "Example: oxide.py -l ~\serverlocation\oxide\logs\ [-g <gitURL> -w]\n"
           "Example: oxide.py -r\n"
           "\n"
@@ -112,6 +424,8 @@ def argumenthelp():
           "OPTIONAL INPUT:\n"          
           "-g --giturl       URL of Oxide Git Repository. Default: https://api.github.com/repositories/94599577/releases/latest\n"
           "-w --windows      Retrieve Windows URL instead of Linux.\n"
+          "-f --forward      Scan every log oldest to newest instead of newest first from the end.\n"
+          "-c --cachedir     Share API responses through a release cache in this directory.\n"
           "-h --help         This help.\n")
     
 def main(argv):
@@ -119,9 +433,11 @@ def main(argv):
     gitURL = "https://api.github.com/repositories/94599577/releases/latest"
     linux = True
     returnURLOnly = False
+    scanMode = "reverse"
+    releaseCache = None
 
     try:
-        opts, args = getopt.getopt(argv,"hwrl:g:",["help", "windows", "retrieveurl", "logdir=", "giturl="])
+        opts, args = getopt.getopt(argv,"hwrfl:g:c:",["help", "windows", "retrieveurl", "forward", "logdir=", "giturl=", "cachedir="])
     except getopt.GetoptError as err:
         print("Incorrect Syntax: -h or --help for more information")
         print("oxide.py -l ~\serverlocation\oxide\logs [-g <gitURL> -w]")
@@ -138,15 +454,19 @@ def main(argv):
             linux = False
         elif opt in ("-r", "--retrieveurl"):
             returnURLOnly = True
+        elif opt in ("-f", "--forward"):
+            scanMode = "forward"
+        elif opt in ("-c", "--cachedir"):
+            releaseCache = ReleaseCache(arg)
 
     if not logDir.strip() and not returnURLOnly:
         print("Incorrect Syntax: logdir required\n"
               "-h or --help for more information")
         sys.exit()
-    o = UpdateCheck(logDir, gitURL)
+    o = UpdateCheck(logDir, gitURL, scanMode, releaseCache)
     replyString = ""
     if returnURLOnly:
-        replyString = o.get_latest_url(linux)
+        replyString = o.get_release_info().get_url(linux)
     else:
         reply = o.check_update(linux)    
         for item in reply:
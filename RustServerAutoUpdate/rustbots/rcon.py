@@ -1,30 +1,455 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json, sys, getopt
+import json, sys, getopt, itertools, threading, time, asyncio, base64, hashlib, os, re, struct
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from websocket import create_connection, _exceptions
+try:
+    from rustbots import metrics
+except ImportError:
+    import metrics
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+#Printed by the server once server.save has written the save, e.g. "Saved 84,212 ents, cache(0.14), write(0.02), diskwrite(0.01)."
+SAVE_COMPLETE_PATTERN = re.compile(r"Saved [\d,]+ ents|Saving complete")
+
+RCON_REQUEST_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_rcon_request_seconds", "Round trip time of RCON commands answered by the server", ("server",))
+RCON_RECONNECTS = metrics.REGISTRY.counter("rustserverautoupdate_rcon_reconnects_total", "RCON connections opened after the first", ("server",))
+RCON_CONNECT_FAILURES = metrics.REGISTRY.counter("rustserverautoupdate_rcon_connect_failures_total", "Failed RCON connection attempts", ("server",))
+
+def backoff_delay(failedAttempts, reconnectDelay, maxReconnectDelay):
+    """Seconds to wait before the next connection attempt. Doubles with each failure up to maxReconnectDelay."""
+    return min(reconnectDelay * 2 ** (failedAttempts - 1), maxReconnectDelay)
+
+def parse_player_count(reply):
+    """Players on the server from a serverinfo or playerlist reply.
+       serverinfo counts players still joining or queued too, since a restart drops them as well."""
+    info = json.loads(reply["Message"])
+    if isinstance(info, list):
+        return len(info)
+    return int(info.get("Players", 0)) + int(info.get("Joining", 0)) + int(info.get("Queued", 0))
+
+def encode_frame(opcode, payload, mask = True):
+    """Build a single final WebSocket frame. Clients must mask, servers must not."""
+    header = bytearray([0x80 | opcode])
+    maskBit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(maskBit | length)
+    elif length < 65536:
+        header.append(maskBit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(maskBit | 127)
+        header += struct.pack("!Q", length)
+    if not mask:
+        return bytes(header) + payload
+    maskKey = os.urandom(4)
+    return bytes(header) + maskKey + mask_payload(maskKey, payload)
+
+def mask_payload(maskKey, payload):
+    """XOR payload with the 4 byte mask key. Masking and unmasking are the same operation."""
+    if not payload:
+        return payload
+    repeatedKey = (maskKey * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeatedKey, "big")).to_bytes(len(payload), "big")
+
+async def read_frame(reader):
+    """Read one WebSocket frame. Return (fin, opcode, payload)."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    maskKey = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if maskKey is not None:
+        payload = mask_payload(maskKey, payload)
+    return (bool(first & 0x80), first & 0x0F, payload)
+
+async def open_websocket(host, port, path, timeout = 10):
+    """Open a WebSocket client connection using asyncio streams. Return (reader, writer)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    try:
+        key = base64.b64encode(os.urandom(16))
+        writer.write(b"GET /" + path.encode("utf-8") + b" HTTP/1.1\r\n"
+                     b"Host: " + host.encode("utf-8") + b":" + str(port).encode("ascii") + b"\r\n"
+                     b"Upgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: " + key + b"\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        response = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        statusLine, _, headerLines = response.partition(b"\r\n")
+        if b" 101 " not in statusLine + b" ":
+            raise RCONConnectionError("WebSocket handshake failed: " + statusLine.decode("latin-1"))
+        headers = {}
+        for line in headerLines.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        if headers.get(b"sec-websocket-accept") != expected:
+            raise RCONConnectionError("WebSocket handshake failed: bad Sec-WebSocket-Accept")
+    except BaseException:
+        writer.close()
+        raise
+    return (reader, writer)
 
 class RCONBot:
-    """Send Message to Rust RCON Using WebSocket"""
-    def __init__(self, password, ip = "127.0.0.1", port = "28016", botName = "RustPythonBot"):
+    """Send Message to Rust RCON Using WebSocket
+       One WebSocket is kept open and shared by every command. Each command is sent with a
+       unique Identifier and its reply is matched back by that Identifier, so several commands
+       can wait on the same socket at once. A dropped connection is reopened on the next
+       command, waiting longer after each failed attempt."""
+    def __init__(self, password, ip = "127.0.0.1", port = "28016", botName = "RustPythonBot", reconnectDelay = 1, maxReconnectDelay = 60):
         self.ip = ip
         self.port = port
         self.password = password
         self.botName = botName
+        self.reconnectDelay = reconnectDelay
+        self.maxReconnectDelay = maxReconnectDelay
+        self.ws = None
+        self.pending = {}
+        self.listeners = []
+        self.identifiers = itertools.count(1)
+        self.connectLock = threading.Lock()
+        self.sendLock = threading.Lock()
+        self.failedAttempts = 0
+        self.retryAt = 0
+        self.connections = 0
+
+    def next_identifier(self):
+        """Unique Identifier for a command. 0 and -1 are used by the server for broadcasts."""
+        return next(self.identifiers)
 
-    def send_message(self, command, identifier = "-1", timeout = 10):
+    def connect(self, timeout = 10):
+        """Return the open WebSocket, connecting if necessary.
+           After a failed attempt the next one waits reconnectDelay seconds, doubling up to maxReconnectDelay."""
+        with self.connectLock:
+            if self.ws is not None:
+                return self.ws
+            wait = self.retryAt - time.monotonic()
+            if wait > timeout:
+                raise RCONConnectionError("Waiting " + str(round(wait)) + " seconds before reconnecting to " + self.ip + ":" + self.port)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                ws = create_connection("ws://" + self.ip + ":" + self.port + "/" + self.password, timeout)
+            except Exception:
+                RCON_CONNECT_FAILURES.inc(server=self.ip + ":" + self.port)
+                self.failedAttempts += 1
+                self.retryAt = time.monotonic() + backoff_delay(self.failedAttempts, self.reconnectDelay, self.maxReconnectDelay)
+                raise
+            self.failedAttempts = 0
+            self.retryAt = 0
+            self.count_connection()
+            #Replies are read by a single thread, which blocks until a message or disconnect.
+            ws.settimeout(None)
+            self.ws = ws
+            threading.Thread(target=self.read_replies, args=(ws,), name="RCONBot-" + self.ip + ":" + self.port, daemon=True).start()
+            return ws
+
+    def count_connection(self):
+        if self.connections > 0:
+            RCON_RECONNECTS.inc(server=self.ip + ":" + self.port)
+        self.connections += 1
+
+    def read_replies(self, ws):
+        """Reader thread. Hand each reply to the command waiting on its Identifier.
+           Messages nobody is waiting on are passed to listeners."""
+        error = None
+        try:
+            while True:
+                message = ws.recv()
+                if not message:
+                    break
+                try:
+                    reply = json.loads(message)
+                except ValueError:
+                    continue
+                waiting = self.pending.pop(reply.get("Identifier"), None)
+                if waiting is not None:
+                    if not waiting[0].done():
+                        waiting[0].set_result(reply)
+                else:
+                    for listener in list(self.listeners):
+                        try:
+                            listener(reply)
+                        except Exception:
+                            pass
+        except Exception as ex:
+            error = ex
+        self.drop_connection(ws, error)
+
+    def drop_connection(self, ws, error = None):
+        """Close ws and fail every command still waiting on it."""
+        with self.connectLock:
+            if self.ws is ws:
+                self.ws = None
+        try:
+            ws.shutdown()
+        except Exception:
+            pass
+        for identifier, (future, futureWS) in list(self.pending.items()):
+            if futureWS is ws and not future.done():
+                self.pending.pop(identifier, None)
+                future.set_exception(RCONConnectionError("Connection to " + self.ip + ":" + self.port + " closed" + (": " + str(error) if error else "")))
+
+    def send_message(self, command, identifier = None, timeout = 10):
         """Send Message to Rust RCON. Return reply from server.
            Example send_message('say Welcome to my Server')
            Optionally send identifer and timeout. Identifier is a return for
-           certain commands to allow tracking. Timeout is how long to wait for reply."""
+           certain commands to allow tracking. A unique one is used when not given.
+           Timeout is how long to wait for reply."""
+        if identifier is None:
+            identifier = self.next_identifier()
+        identifier = int(identifier)
         jsonDict = {"Identifier": identifier,
                    "Message": command,
                    "Name": self.botName}
-        ws = create_connection("ws://" + self.ip + ":" + self.port + "/" + self.password, timeout)
-        ws.send(json.dumps(jsonDict))
-        reply = json.loads(ws.recv())
-        ws.close(timeout=.05)
+        ws = self.connect(timeout)
+        future = Future()
+        self.pending[identifier] = (future, ws)
+        start = time.monotonic()
+        try:
+            with self.sendLock:
+                ws.send(json.dumps(jsonDict))
+        except Exception as ex:
+            self.pending.pop(identifier, None)
+            self.drop_connection(ws, ex)
+            raise
+        try:
+            reply = future.result(timeout)
+        except FutureTimeoutError:
+            self.pending.pop(identifier, None)
+            raise _exceptions.WebSocketTimeoutException("No reply from " + self.ip + ":" + self.port + " for command: " + command)
+        RCON_REQUEST_SECONDS.observe(time.monotonic() - start, server=self.ip + ":" + self.port)
         return reply
 
+    def get_player_count(self, timeout = 10):
+        """Return how many players are on the server, from the serverinfo command"""
+        return parse_player_count(self.send_message("serverinfo", timeout=timeout))
+
+    def wait_for_output(self, command, pattern, timeout = 60):
+        """Send command and wait until the server prints a message matching pattern, in the reply or its console output.
+           Return the matching message. Raises WebSocketTimeoutException after timeout seconds."""
+        matched = Future()
+        def listener(reply):
+            message = reply.get("Message", "")
+            if pattern.search(message) and not matched.done():
+                matched.set_result(message)
+        self.listeners.append(listener)
+        try:
+            deadline = time.monotonic() + timeout
+            listener(self.send_message(command, timeout=timeout))
+            try:
+                return matched.result(max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                raise _exceptions.WebSocketTimeoutException("No output matching " + pattern.pattern + " from " + self.ip + ":" + self.port + " for command: " + command)
+        finally:
+            self.listeners.remove(listener)
+
+    def save(self, timeout = 60):
+        """Run server.save and return once the server reports the save was written"""
+        return self.wait_for_output("server.save", SAVE_COMPLETE_PATTERN, timeout)
+
+    def close(self):
+        """Close the WebSocket if it is open"""
+        ws = self.ws
+        if ws is not None:
+            try:
+                with self.sendLock:
+                    ws.send_close()
+            except Exception:
+                pass
+            self.drop_connection(ws)
+
+class AsyncRCONBot:
+    """Send Message to Rust RCON Using WebSocket from an asyncio event loop
+       Same behaviour as RCONBot, without threads. One connection is shared by every command,
+       replies are matched by Identifier and a dropped connection is reopened with backoff."""
+    def __init__(self, password, ip = "127.0.0.1", port = "28016", botName = "RustPythonBot", reconnectDelay = 1, maxReconnectDelay = 60):
+        self.ip = ip
+        self.port = port
+        self.password = password
+        self.botName = botName
+        self.reconnectDelay = reconnectDelay
+        self.maxReconnectDelay = maxReconnectDelay
+        self.writer = None
+        self.readTask = None
+        self.pending = {}
+        self.listeners = []
+        self.identifiers = itertools.count(1)
+        self.connectLock = None
+        self.failedAttempts = 0
+        self.retryAt = 0
+        self.connections = 0
+
+    def next_identifier(self):
+        """Unique Identifier for a command. 0 and -1 are used by the server for broadcasts."""
+        return next(self.identifiers)
+
+    async def connect(self, timeout = 10):
+        """Return the open connection writer, connecting if necessary.
+           After a failed attempt the next one waits reconnectDelay seconds, doubling up to maxReconnectDelay."""
+        if self.connectLock is None:
+            self.connectLock = asyncio.Lock()
+        async with self.connectLock:
+            if self.writer is not None:
+                return self.writer
+            loop = asyncio.get_running_loop()
+            wait = self.retryAt - loop.time()
+            if wait > timeout:
+                raise RCONConnectionError("Waiting " + str(round(wait)) + " seconds before reconnecting to " + self.ip + ":" + self.port)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                reader, writer = await open_websocket(self.ip, self.port, self.password, timeout)
+            except Exception:
+                RCON_CONNECT_FAILURES.inc(server=self.ip + ":" + self.port)
+                self.failedAttempts += 1
+                self.retryAt = loop.time() + backoff_delay(self.failedAttempts, self.reconnectDelay, self.maxReconnectDelay)
+                raise
+            self.failedAttempts = 0
+            self.retryAt = 0
+            self.count_connection()
+            self.writer = writer
+            self.readTask = loop.create_task(self.read_replies(reader, writer))
+            return writer
+
+    def count_connection(self):
+        if self.connections > 0:
+            RCON_RECONNECTS.inc(server=self.ip + ":" + self.port)
+        self.connections += 1
+
+    async def read_replies(self, reader, writer):
+        """Reader task. Hand each reply to the command waiting on its Identifier.
+           Messages nobody is waiting on are passed to listeners."""
+        error = None
+        fragments = []
+        try:
+            while True:
+                fin, opcode, payload = await read_frame(reader)
+                if opcode == OPCODE_PING:
+                    writer.write(encode_frame(OPCODE_PONG, payload))
+                    continue
+                if opcode == OPCODE_CLOSE:
+                    break
+                if opcode not in (OPCODE_TEXT, OPCODE_BINARY, OPCODE_CONTINUATION):
+                    continue
+                fragments.append(payload)
+                if not fin:
+                    continue
+                message = b"".join(fragments)
+                fragments = []
+                try:
+                    reply = json.loads(message.decode("utf-8"))
+                except ValueError:
+                    continue
+                waiting = self.pending.pop(reply.get("Identifier"), None)
+                if waiting is not None:
+                    if not waiting[0].done():
+                        waiting[0].set_result(reply)
+                else:
+                    for listener in list(self.listeners):
+                        try:
+                            listener(reply)
+                        except Exception:
+                            pass
+        except asyncio.CancelledError:
+            error = None
+        except Exception as ex:
+            error = ex
+        self.drop_connection(writer, error)
+
+    def drop_connection(self, writer, error = None):
+        """Close writer and fail every command still waiting on it."""
+        if self.writer is writer:
+            self.writer = None
+        writer.close()
+        for identifier, (future, futureWriter) in list(self.pending.items()):
+            if futureWriter is writer and not future.done():
+                self.pending.pop(identifier, None)
+                future.set_exception(RCONConnectionError("Connection to " + self.ip + ":" + self.port + " closed" + (": " + str(error) if error else "")))
+
+    async def send_message(self, command, identifier = None, timeout = 10):
+        """Send Message to Rust RCON. Return reply from server.
+           Example await send_message('say Welcome to my Server')
+           Optionally send identifer and timeout. A unique identifier is used when not given.
+           Timeout is how long to wait for reply. Raises asyncio.TimeoutError."""
+        if identifier is None:
+            identifier = self.next_identifier()
+        identifier = int(identifier)
+        jsonDict = {"Identifier": identifier,
+                   "Message": command,
+                   "Name": self.botName}
+        writer = await self.connect(timeout)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[identifier] = (future, writer)
+        start = time.monotonic()
+        try:
+            writer.write(encode_frame(OPCODE_TEXT, json.dumps(jsonDict).encode("utf-8")))
+            await writer.drain()
+        except Exception as ex:
+            self.pending.pop(identifier, None)
+            self.drop_connection(writer, ex)
+            raise
+        try:
+            reply = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(identifier, None)
+        RCON_REQUEST_SECONDS.observe(time.monotonic() - start, server=self.ip + ":" + self.port)
+        return reply
+
+    async def get_player_count(self, timeout = 10):
+        """Return how many players are on the server, from the serverinfo command"""
+        return parse_player_count(await self.send_message("serverinfo", timeout=timeout))
+
+    async def wait_for_output(self, command, pattern, timeout = 60):
+        """Send command and wait until the server prints a message matching pattern, in the reply or its console output.
+           Return the matching message. Raises asyncio.TimeoutError after timeout seconds."""
+        loop = asyncio.get_running_loop()
+        matched = loop.create_future()
+        def listener(reply):
+            message = reply.get("Message", "")
+            if pattern.search(message) and not matched.done():
+                matched.set_result(message)
+        self.listeners.append(listener)
+        try:
+            deadline = loop.time() + timeout
+            listener(await self.send_message(command, timeout=timeout))
+            return await asyncio.wait_for(matched, max(0, deadline - loop.time()))
+        finally:
+            self.listeners.remove(listener)
+
+    async def save(self, timeout = 60):
+        """Run server.save and return once the server reports the save was written"""
+        return await self.wait_for_output("server.save", SAVE_COMPLETE_PATTERN, timeout)
+
+    async def close(self):
+        """Close the WebSocket if it is open"""
+        writer = self.writer
+        if writer is not None:
+            try:
+                writer.write(encode_frame(OPCODE_CLOSE, struct.pack("!H", 1000)))
+                await writer.drain()
+            except Exception:
+                pass
+            self.drop_connection(writer)
+        if self.readTask is not None:
+            self.readTask.cancel()
+            self.readTask = None
+
+class RCONConnectionError(Exception):
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
 def argumenthelp():
     print("\nSyntax: rcon.py -p <RCON Password> -c <Command> [-i <Server IP> -o <Server RCON Port> -n <Bot Name> -t <Command Timeout in Seconds>]\n"
           "Example: rcon.py -i '127.0.0.1' -o '28016' -p 'CHANGE_ME' -c 'say Hello World' -n 'MyRustBot' -t 5\n"
@@ -74,14 +499,19 @@ def main(argv):
         print("Incorrect Syntax: password and command required\n"
               "-h or --help for more information")
         sys.exit()
+    #RCONBot can fail before it exists, e.g. on a refused connection. There is nothing to close then.
+    bot = None
     try:
         bot = RCONBot(password, ip, port, botName)
         print("\n***Sending Command***\n")
-        reply = bot.send_message(command, timeout)
+        reply = bot.send_message(command, timeout=timeout)
         if verbose:
             print("VERBOSE. FULL RESPONSE: \n" + json.dumps(reply) + "\n\n")
         print(reply["Message"])
     except _exceptions.WebSocketTimeoutException as err:
         print("Timed Out while waiting on response from server for command: " + command)
+    finally:
+        if bot is not None:
+            bot.close()
 if __name__ == "__main__":
    main(sys.argv[1:])
\ No newline at end of file
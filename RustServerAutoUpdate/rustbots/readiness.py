@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, ctypes, ctypes.util, os
+try:
+    from rustbots.oxide import VERSION_PATTERN
+except ImportError:
+    from oxide import VERSION_PATTERN
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+class DirectoryWatcher:
+    """Wake an asyncio task when files in a directory change.
+       Uses inotify through libc where it is available. Everywhere else, or if the directory
+       cannot be watched, wait() simply sleeps for pollInterval and the caller checks the files itself."""
+    def __init__(self, path, pollInterval = 2):
+        self.path = path
+        self.pollInterval = pollInterval
+        self.fd = None
+        self.changed = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return
+        if fd < 0:
+            return
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return
+        self.fd = fd
+
+    @property
+    def using_inotify(self):
+        return self.fd is not None
+
+    def start(self):
+        """Start listening for inotify events on the running loop"""
+        if self.fd is not None:
+            self.changed = asyncio.Event()
+            asyncio.get_running_loop().add_reader(self.fd, self.on_event)
+
+    def on_event(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.changed.set()
+
+    async def wait(self, timeout):
+        """Return after a change or timeout seconds, whichever is first. Without inotify waits at most pollInterval."""
+        if self.changed is None:
+            await asyncio.sleep(min(timeout, self.pollInterval))
+            return
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+    def close(self):
+        if self.fd is not None:
+            if self.changed is not None:
+                asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+class ReadinessWatcher:
+    """Tell when a restarted server is up again.
+       mark() records how far the Oxide logs have been written before the restart. wait_ready() then follows
+       only what is written after that until "Loaded extension Rust vX" appears, and, when an RCON bot is given,
+       until the server answers an RCON command."""
+    def __init__(self, updateCheck, rconBot = None, pollInterval = 2, rconTimeout = 5):
+        self.updateCheck = updateCheck
+        self.rconBot = rconBot
+        self.pollInterval = pollInterval
+        self.rconTimeout = rconTimeout
+        self.offsets = {}
+
+    def mark(self):
+        """Remember the current end of every log, so only lines written after this are searched"""
+        self.offsets = {}
+        for logFile in self.updateCheck.get_log_file_list():
+            try:
+                fileStat = os.stat(logFile)
+            except OSError:
+                continue
+            self.offsets[logFile] = (fileStat.st_ino, fileStat.st_size)
+
+    def scan_new_lines(self):
+        """Return the newest version loaded since mark(), or None. Advances past complete lines read."""
+        lastMatch = None
+        for logFile in self.updateCheck.get_log_file_list():
+            try:
+                fileStat = os.stat(logFile)
+            except OSError:
+                continue
+            inode, offset = self.offsets.get(logFile, (fileStat.st_ino, 0))
+            if inode != fileStat.st_ino or fileStat.st_size < offset:
+                offset = 0
+            if fileStat.st_size == offset:
+                continue
+            with open(logFile, "rb") as rustLogFile:
+                rustLogFile.seek(offset)
+                newData = rustLogFile.read()
+            lineEnd = newData.rfind(b"\n") + 1
+            for currentMatch in VERSION_PATTERN.finditer(newData, 0, lineEnd):
+                lastMatch = currentMatch.group(1).decode("ascii")
+            self.offsets[logFile] = (fileStat.st_ino, offset + lineEnd)
+        return lastMatch
+
+    async def probe_rcon(self):
+        """True if the server answers an RCON command"""
+        try:
+            await self.rconBot.send_message("serverinfo", timeout=self.rconTimeout)
+            return True
+        except Exception:
+            return False
+
+    async def wait_ready(self, timeout):
+        """Wait up to timeout seconds for the server to load Oxide and answer RCON.
+           Return (version, rconReady). version is the version seen loading, or None if none loaded in time.
+           rconReady is True once the server answers RCON, and always True without an RCON bot."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        watcher = DirectoryWatcher(self.updateCheck.oxideLogDir, self.pollInterval)
+        watcher.start()
+        try:
+            version = None
+            while version is None:
+                version = self.scan_new_lines()
+                if version is None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return (None, False)
+                    #inotify wakes us on every write. The timeout only guards against missed events.
+                    await watcher.wait(min(remaining, self.pollInterval * 15 if watcher.using_inotify else self.pollInterval))
+            while self.rconBot is not None and not await self.probe_rcon():
+                if loop.time() + self.pollInterval > deadline:
+                    return (version, False)
+                await asyncio.sleep(self.pollInterval)
+            return (version, True)
+        finally:
+            watcher.close()
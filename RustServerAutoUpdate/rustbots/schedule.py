@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, heapq, itertools
+
+class ScheduledEvent:
+    """Entry in the EventScheduler timer heap. when is in event loop time (seconds)."""
+    def __init__(self, when, sequence, name, callback, args):
+        self.when = when
+        self.sequence = sequence
+        self.name = name
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+    def cancel(self):
+        self.cancelled = True
+
+class EventScheduler:
+    """Timer heap of upcoming events run from an asyncio event loop.
+       run() sleeps until the earliest deadline and then runs that event, so nothing is woken
+       while there is nothing to do. Events scheduled while sleeping wake it to recompute the deadline.
+       Callbacks may be plain functions or coroutine functions.
+       afterEvent, if set, is called with each event once it has run.
+       onError, if set, is called with the event and the exception when a callback raises, and run() carries on.
+       Without it the exception ends run()."""
+    def __init__(self):
+        self.events = []
+        self.sequence = itertools.count()
+        self.wakeup = None
+        self.stopped = False
+        self.afterEvent = None
+        self.onError = None
+
+    def call_at(self, when, name, callback, *args):
+        """Run callback(*args) at loop time when. Return the ScheduledEvent."""
+        event = ScheduledEvent(when, next(self.sequence), name, callback, args)
+        heapq.heappush(self.events, event)
+        self.notify()
+        return event
+
+    def call_later(self, delay, name, callback, *args):
+        """Run callback(*args) delay seconds from now. Return the ScheduledEvent."""
+        return self.call_at(asyncio.get_event_loop().time() + delay, name, callback, *args)
+
+    def cancel(self, name):
+        """Cancel every pending event called name. Return how many were cancelled."""
+        cancelled = 0
+        for event in self.events:
+            if event.name == name and not event.cancelled:
+                event.cancel()
+                cancelled += 1
+        self.notify()
+        return cancelled
+
+    def pending(self):
+        """Pending events, earliest first"""
+        return sorted(event for event in self.events if not event.cancelled)
+
+    def next_event(self):
+        """Earliest pending event, or None"""
+        while self.events and self.events[0].cancelled:
+            heapq.heappop(self.events)
+        return self.events[0] if self.events else None
+
+    def notify(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def stop(self):
+        """Make run() return once the current event finishes"""
+        self.stopped = True
+        self.notify()
+
+    async def run(self):
+        """Run events as their deadlines arrive until stop() is called"""
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.stopped = False
+        while not self.stopped:
+            event = self.next_event()
+            if event is None or event.when > loop.time():
+                handle = loop.call_at(event.when, self.wakeup.set) if event is not None else None
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                if handle is not None:
+                    handle.cancel()
+                continue
+            heapq.heappop(self.events)
+            try:
+                result = event.callback(*event.args)
+                if asyncio.iscoroutine(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if self.onError is None:
+                    raise
+                self.onError(event, error)
+            if self.afterEvent is not None:
+                self.afterEvent(event)
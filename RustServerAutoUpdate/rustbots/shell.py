@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio, os, signal, time
+from datetime import datetime
+
+def split_command(command):
+    """Split a shell command line into its ';' separated steps.
+       Semicolons inside quotes, parentheses or backticks or escaped with a backslash are left alone.
+       Empty steps are dropped."""
+    steps = []
+    current = []
+    quote = None
+    escaped = False
+    depth = 0
+    for char in command:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quote != "'":
+            escaped = True
+        elif quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif char == ";" and depth == 0:
+            steps.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    steps.append("".join(current).strip())
+    return [step for step in steps if step]
+
+class StepResult:
+    """Outcome of one step of a command. duration is wall clock seconds."""
+    def __init__(self, command, returnCode, duration, timedOut = False):
+        self.command = command
+        self.returnCode = returnCode
+        self.duration = duration
+        self.timedOut = timedOut
+
+    def __str__(self):
+        status = "timed out" if self.timedOut else "exit " + str(self.returnCode)
+        return "{:8.1f}s  {:<10} {}".format(self.duration, status, self.command)
+
+class CommandRunner:
+    """Run a ';' separated shell command without blocking the event loop.
+       Every step runs in the same shell, as it would from a terminal, so cd and shell variables carry over.
+       The shell prints a marker line around each step, which is used to time the steps.
+       Output is written line by line to logFile as it arrives.
+       A step still running after stepTimeout seconds stops the whole command with SIGTERM, then SIGKILL
+       killGrace seconds later. The steps after it are not run."""
+    def __init__(self, command, logFile = None, stepTimeout = None, killGrace = 10, env = None):
+        self.steps = split_command(command)
+        self.logFile = logFile
+        self.stepTimeout = stepTimeout
+        self.killGrace = killGrace
+        self.env = env
+        self.marker = "__rustserverautoupdate_step_" + os.urandom(8).hex()
+        self.results = []
+        self.stepNumber = 0
+        self.stepStart = None
+        self.stepStarted = None
+
+    def script(self):
+        """The command for the shell, with a marker line printed before and after each step.
+           Steps are separated by newlines, which the shell treats the same as ';'."""
+        lines = []
+        for stepNumber, command in enumerate(self.steps, 1):
+            lines.append("printf '%s start %d\\n' " + self.marker + " " + str(stepNumber))
+            lines.append(command)
+            lines.append("printf '%s end %d %d\\n' " + self.marker + " " + str(stepNumber) + ' "$?"')
+        return "\n".join(lines) + "\n"
+
+    def log(self, logHandle, stepNumber, line):
+        if logHandle is not None:
+            logHandle.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S") + " [step " + str(stepNumber) + "] " + line + "\n")
+            logHandle.flush()
+
+    def step_marker(self, logHandle, marker):
+        """Start or finish timing a step from a marker line"""
+        fields = marker.split()
+        try:
+            stepNumber = int(fields[1])
+            command = self.steps[stepNumber - 1]
+        except (IndexError, ValueError):
+            return
+        if fields[0] == "start":
+            self.stepNumber = stepNumber
+            self.stepStart = time.monotonic()
+            self.stepStarted.set()
+            self.log(logHandle, stepNumber, "$ " + command)
+        elif fields[0] == "end" and len(fields) > 2 and stepNumber == self.stepNumber and self.stepStart is not None:
+            result = StepResult(command, int(fields[2]), time.monotonic() - self.stepStart)
+            self.stepStart = None
+            self.results.append(result)
+            self.log(logHandle, stepNumber, str(result))
+
+    async def read_output(self, stream, logHandle):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            line = line.decode("utf-8", "replace").rstrip("\r\n")
+            index = line.find(self.marker)
+            if index < 0:
+                self.log(logHandle, self.stepNumber, line)
+                continue
+            #Output without a trailing newline runs into the marker.
+            if line[:index]:
+                self.log(logHandle, self.stepNumber, line[:index])
+            self.step_marker(logHandle, line[index + len(self.marker):])
+
+    def signal_shell(self, process, signum):
+        """Signal the shell's whole process group, so the commands it started stop too"""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signum)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def wait_for_shell(self, process, logHandle):
+        """Wait for the shell to exit, stopping it if a step runs longer than stepTimeout. Return True if it was stopped."""
+        exited = asyncio.ensure_future(process.wait())
+        try:
+            while not exited.done():
+                started = asyncio.ensure_future(self.stepStarted.wait())
+                remaining = None
+                if self.stepTimeout is not None and self.stepStart is not None:
+                    remaining = max(0, self.stepStart + self.stepTimeout - time.monotonic())
+                done, pending = await asyncio.wait((exited, started), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                started.cancel()
+                if self.stepStarted.is_set():
+                    self.stepStarted.clear()
+                    continue
+                if not done:
+                    self.log(logHandle, self.stepNumber, "Timed out after " + str(self.stepTimeout) + " seconds. Stopping the command.")
+                    self.signal_shell(process, signal.SIGTERM)
+                    try:
+                        await asyncio.wait_for(asyncio.shield(exited), self.killGrace)
+                    except asyncio.TimeoutError:
+                        self.signal_shell(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+                        await exited
+                    return True
+            return False
+        finally:
+            exited.cancel()
+
+    async def run(self):
+        """Run the command. Return a StepResult for every step that started."""
+        self.results = []
+        self.stepNumber = 0
+        self.stepStart = None
+        self.stepStarted = asyncio.Event()
+        logHandle = None
+        if self.logFile:
+            os.makedirs(os.path.dirname(os.path.abspath(self.logFile)), exist_ok=True)
+            logHandle = open(self.logFile, "a", encoding="utf-8")
+        try:
+            #Output goes through our own pipe so waiting on the shell does not also wait for
+            #background processes it started that still hold the pipe open.
+            readFD, writeFD = os.pipe()
+            try:
+                process = await asyncio.create_subprocess_shell(self.script(), stdin=asyncio.subprocess.DEVNULL,
+                                                                stdout=writeFD, stderr=asyncio.subprocess.STDOUT,
+                                                                env=self.env, start_new_session=hasattr(os, "killpg"))
+            except BaseException:
+                os.close(readFD)
+                raise
+            finally:
+                os.close(writeFD)
+            stream = asyncio.StreamReader()
+            transport, protocol = await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream), os.fdopen(readFD, "rb", 0))
+            reader = asyncio.ensure_future(self.read_output(stream, logHandle))
+            try:
+                timedOut = await self.wait_for_shell(process, logHandle)
+                #Stop reading shortly after the shell exits even if a background process keeps writing.
+                try:
+                    await asyncio.wait_for(asyncio.shield(reader), 2)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                self.signal_shell(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+                raise
+            finally:
+                reader.cancel()
+                transport.close()
+            if self.stepStart is not None:
+                #The shell exited or was stopped part way through this step.
+                result = StepResult(self.steps[self.stepNumber - 1], process.returncode, time.monotonic() - self.stepStart, timedOut)
+                self.stepStart = None
+                self.results.append(result)
+                self.log(logHandle, self.stepNumber, str(result))
+            return self.results
+        finally:
+            if logHandle is not None:
+                logHandle.close()
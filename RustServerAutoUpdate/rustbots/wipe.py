@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, random, re, stat, tempfile, time
+from datetime import datetime, timedelta, timezone
+try:
+    from rustbots import jsonfile
+except ImportError:
+    import jsonfile
+
+MAX_SEED = 2147483647
+#Seed lines in a LinuxGSM instance config (seed="123") and in a Rust server.cfg (server.seed 123).
+SHELL_SEED_PATTERN = re.compile(r'^(\s*)seed\s*=.*$', re.MULTILINE)
+CONVAR_SEED_PATTERN = re.compile(r'^(\s*)server\.seed\s.*$', re.MULTILINE)
+SHELL_ASSIGNMENT_PATTERN = re.compile(r'^\s*\w+=', re.MULTILINE)
+
+def is_forced_wipe_day(now):
+    """True if now (an aware datetime) falls on the first Thursday of its month in UTC, when Facepunch force wipes"""
+    now = now.astimezone(timezone.utc)
+    return now.day <= 7 and now.weekday() == 3
+
+def new_seed():
+    return random.randrange(1, MAX_SEED, 1)
+
+def write_text(path, text):
+    """Replace path with text atomically, keeping the file's permissions"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = None
+    fd, tempPath = tempfile.mkstemp(prefix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tempFile:
+            tempFile.write(text)
+            tempFile.flush()
+            os.fsync(tempFile.fileno())
+        if mode is not None:
+            os.chmod(tempPath, mode)
+        os.replace(tempPath, path)
+    except BaseException:
+        try:
+            os.unlink(tempPath)
+        except OSError:
+            pass
+        raise
+
+def write_seed(path, seed):
+    """Set the map seed in a server config file.
+       An existing seed="..." or server.seed line is replaced. Otherwise one is added,
+       as seed="..." if the file holds shell assignments like a LinuxGSM config and as server.seed if not."""
+    try:
+        with open(path, "r", encoding="utf-8") as configFile:
+            text = configFile.read()
+    except FileNotFoundError:
+        text = ""
+    if SHELL_SEED_PATTERN.search(text):
+        text = SHELL_SEED_PATTERN.sub(lambda match: match.group(1) + 'seed="' + str(seed) + '"', text, count=1)
+    elif CONVAR_SEED_PATTERN.search(text):
+        text = CONVAR_SEED_PATTERN.sub(lambda match: match.group(1) + 'server.seed ' + str(seed), text, count=1)
+    else:
+        if text and not text.endswith("\n"):
+            text += "\n"
+        text += ('seed="' + str(seed) + '"' if SHELL_ASSIGNMENT_PATTERN.search(text) else 'server.seed ' + str(seed)) + "\n"
+    write_text(path, text)
+
+class WipeSchedule:
+    """Forced wipe tracking for one server.
+       The last wipe and every seed used are kept in stateFile, so a wipe happens once per forced wipe day
+       and the seed history survives restarts. seedFile is the server config the new seed is written to."""
+    def __init__(self, stateFile, seedFile = "", wipeHour = 19, minDaysBetween = 27):
+        self.stateFile = stateFile
+        self.seedFile = seedFile
+        self.wipeHour = wipeHour
+        self.minDaysBetween = minDaysBetween
+
+    def load(self):
+        state = jsonfile.read_json(self.stateFile, {})
+        if not isinstance(state, dict):
+            state = {}
+        return state
+
+    def last_wipe(self):
+        """Time of the last wipe in seconds since the epoch, or None"""
+        return self.load().get("last_wipe")
+
+    def wipe_due(self, now = None):
+        """True from wipeHour UTC on a forced wipe day, unless the server was wiped in the last minDaysBetween days"""
+        now = now or datetime.now(timezone.utc)
+        if not is_forced_wipe_day(now) or now.astimezone(timezone.utc).hour < self.wipeHour:
+            return False
+        lastWipe = self.last_wipe()
+        return lastWipe is None or now >= datetime.fromtimestamp(lastWipe, timezone.utc) + timedelta(days=self.minDaysBetween)
+
+    def prepare(self):
+        """Pick a new seed and write it to seedFile, if one is set. Return the seed."""
+        seed = new_seed()
+        if self.seedFile:
+            write_seed(self.seedFile, seed)
+        return seed
+
+    def record_wipe(self, seed, wipeTime = None):
+        """Store a finished wipe and its seed in the state file"""
+        state = self.load()
+        state["last_wipe"] = wipeTime or time.time()
+        state["history"] = state.get("history", []) + [{"time": state["last_wipe"], "seed": seed}]
+        jsonfile.write_json(self.stateFile, state)
@@ -1,292 +1,1221 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import sys, signal, getopt, re, glob, os.path, configparser, asyncio, random
-from rustbots import discord, rcon, oxide
+import sys, signal, getopt, os.path, configparser, asyncio, logging, dataclasses, json, math
+from rustbots import discord, rcon, oxide, jsonfile, httpsession, schedule, coordinator, artifacts, shell, readiness, metrics, jsonlog, countdown, wipe, control
 from collections import OrderedDict
-from time import sleep
-from subprocess import run
+from time import time
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-from datetime import datetime, timedelta, timezone
 
-class RustMonitor:
-    def __init__(self, configPath = '', configSection = 'SERVER1'):
-        configSectionUpper = configSection.upper()
-        self.setup_configuration(configPath, configSectionUpper)
-        confsec = self.config[configSectionUpper]
-        self.oxideLogDIR = confsec['oxide_log_dir']
-        self.oxideGitURL = confsec['oxide_git_url']
-        self.oxideCheckTime = self.config.getfloat(configSectionUpper, 'oxide_check_time_in_min')
-        self.oxideAutoUpdate = self.config.getboolean(configSectionUpper, 'oxide_auto_update')
-        self.bashCommand = confsec['bash_get_update_command']
-        self.useRCON =  self.config.getboolean(configSectionUpper, 'use_rcon')
-        self.useDiscord =  self.config.getboolean(configSectionUpper, 'use_discord')
-        self.rconIP = confsec['rcon_ip']
-        self.rconPort = confsec['rcon_port']
-        self.rconPass = confsec['rcon_pass']
-        self.discordWebHook = confsec['discord_webhook']
-        self.discordBotName = confsec['discord_bot_name']
-        self.discordBotAvatarURL = confsec['discord_bot_avatar_url']
-        self.discordMsgGameName = confsec['discord_msg_game_name']
-        self.discordMsgServerName = confsec['discord_msg_server_name']
-        self.discordMsgServerIP = confsec['discord_msg_server_ip_port']
-        self.discordMsgHostName = confsec['discord_msg_server_host_name']
-        self.discordMsgTitle = confsec['discord_msg_title']
-        self.send15MinWarn =  self.config.getboolean(configSectionUpper, 'send_15min_warn')
-        self.send10MinWarn =  self.config.getboolean(configSectionUpper, 'send_10min_warn')
-        self.send05MinWarn =  self.config.getboolean(configSectionUpper, 'send_5min_warn')
-        self.send01MinWarn =  self.config.getboolean(configSectionUpper, 'send_1min_warn')
-        self.msg15Min = confsec['15min_msg']
-        self.msg10Min = confsec['10min_msg']
-        self.msg05Min = confsec['5min_msg']
-        self.msg01Min = confsec['1min_msg']
+RESTART_COOLDOWN_MINUTES = 20
+#Settings used to build connections, caches and log handlers at startup. A reload keeps their old values until restart.
+RESTART_REQUIRED_SETTINGS = ('oxideLogDIR', 'oxideGitURL', 'oxideLogScanMode', 'oxideReleaseCache', 'oxideReleaseMinPoll', 'cacheDIR', 'oxidePrefetch',
+                             'maxConcurrentUpdates', 'restartSpacing', 'restartLockDIR', 'useRCON', 'useDiscord', 'rconIP', 'rconPort', 'rconPass',
+                             'rconBotName', 'discordWebHook', 'discordBotName', 'discordBotAvatarURL', 'httpTimeout', 'httpRetries',
+                             'logFile', 'logMaxSize', 'logBackupCount', 'metricsPort', 'metricsAddress', 'configReloadCheck', 'controlSocket')
+#Settings that are per instance with -s but read once from the DEFAULT section with -a, where each monitor's value goes unused.
+PROCESS_SETTINGS = ('logFile', 'logMaxSize', 'logBackupCount', 'metricsPort', 'metricsAddress', 'configReloadCheck', 'controlSocket')
+PROCESS_OPTIONS = ('log_file', 'log_max_size_in_mb', 'log_backup_count', 'metrics_port', 'metrics_address', 'config_reload_check_in_sec', 'control_socket')
 
-    def setup_configuration(self, configPath, configSection):
-        """Read INI file and update with new options if necessary"""
-        confComments = OrderedDict({'DEFAULT': {'# This is the Default configuration.': None,
-                                                '# These settings apply to all instances.': None,
-                                                '# New options will be added here on upgrade.': None,
-                                                '# Copy to appropriate section below and update as necessary.': None,
-                                                '# Individual instance settings will override defaults.': None},
-                                    configSection   : {'# Enter '+ configSection +' Settings Here.': None}})
-        confDefaults = OrderedDict({'DEFAULT': {'oxide_log_dir':  '/home/rustserver/serverfiles/oxide/logs',
-                                                'oxide_git_url': 'https://api.github.com/repositories/94599577/releases/latest',
-                                                'oxide_check_time_in_min': '15',
-                                                'oxide_auto_update': 'yes',
-                                                'bash_get_update_command': '/home/rustserver/./rustserver stop;/home/rustserver/./rustserver update;/home/rustserver/./rustserver mods-update;/home/rustserver/./rustserver start',
-                                                'use_rcon': 'yes',
-                                                'use_discord': 'no',
-                                                'rcon_ip': '127.0.0.1',
-                                                'rcon_port': '28016',
-                                                'rcon_pass': 'CHANGE_ME',
-                                                'discord_webhook': '',
-                                                'discord_bot_name': 'RustPythonBot',
-                                                'discord_bot_avatar_url': '',
-                                                'discord_msg_game_name': 'My Rust Game',
-                                                'discord_msg_server_name': 'My Server',
-                                                'discord_msg_server_ip_port': '127.0.0.1:28015',
-                                                'discord_msg_server_host_name': '',
-                                                'discord_msg_title': '🚧 ALERT',
-                                                'send_15min_warn': 'yes',
-                                                'send_10min_warn': 'yes',
-                                                'send_5min_warn': 'yes',
-                                                'send_1min_warn': 'yes',
-                                                '15min_msg': 'Oxide Update Detected. Server will restart in 15 minutes for update.',
-                                                '10min_msg': 'Oxide Update Scheduled. Server will restart in 10 minutes for update.',
-                                                '5min_msg':  'Oxide Update Scheduled. Server will restart in 5 minutes for update.',
-                                                '1min_msg':  'FINAL WARNING! SERVER RESTARTING FOR OXIDE UPDATE IN 1 MINUTE!!'},
-                                    configSection:    {}})
-
-        configFile = os.path.join(configPath, "rustserverautoupdate.ini")
-        userconfig = configparser.ConfigParser()
-        userconfig.read(configFile, encoding='utf-8')
-
-        if (len(userconfig.defaults()) != len(confDefaults['DEFAULT'])) or not userconfig.has_section(configSection):
-            config = configparser.ConfigParser(allow_no_value=True)            
-            config.read_dict(confComments)
-            config.read_dict(confDefaults)
-
-            if userconfig.has_section(configSection):
-                for key,value in userconfig._sections[configSection].items():
-                    if config.has_option(configSection, key):
-                        config[configSection][key] = value
-            for section in userconfig.sections():
-                if section != configSection:
-                    config.add_section(section)
-                    config[section]['# enter ' + section + ' settings here.'] = None
-                    for (key,value) in userconfig._sections[section].items():
-                        if config.has_option(section, key):
-                            config[section][key] = value
-            for (key,value) in userconfig.defaults().items():
-                if config.has_option(config.default_section, key):
-                    config[config.default_section][key] = value
-           
-            with open(configFile, 'w', encoding='utf-8') as configfile:
-                config.write(configfile)
-        self.config = configparser.ConfigParser()
-        self.config.read_dict(confDefaults)
-        self.config.read(configFile, encoding='utf-8')
-
-    def check_variables(self, case):
-        """Check variables to confirm they will not cause errors.
-           Fill in generic defaults if non-required variables are empty."""
-        if case == 1:
-            if not self.discordWebHook.strip():
-                raise RustMonitorVariableError('discord_webhook', 'Discord Bot is enabled, but no webHook was provided.')
-            else:
-                self.disdiscordWebHook = self.discordWebHook.strip()
-            if not self.discordBotName.strip():
-                self.discordBotName = 'Unknown Bot'
-            if not self.discordBotAvatarURL.strip():
-                self.discordBotAvatarURL = ""
-            if not self.discordMsgGameName.strip():
-                self.discordMsgGameName = 'Unkown Game'
-            if not self.discordMsgServerName.strip():
-                self.discordMsgServerName = 'Unknown Server'
-            if not self.discordMsgServerIP.strip():
-                self.discordMsgServerIP = '127.0.0.1'
-            if not self.discordMsgHostName.strip():
-                self.discordMsgHostName = ""
-        elif case == 2:
-            if not self.rconIP.strip():
+log = logging.getLogger(jsonlog.LOGGER_NAME)
+
+OXIDE_VERSION = metrics.REGISTRY.gauge("rustserverautoupdate_oxide_version_info", "Running and latest Oxide version of each instance", ("instance", "kind", "version"))
+UPDATE_STEP_SECONDS = metrics.REGISTRY.gauge("rustserverautoupdate_update_step_seconds", "Wall clock time of each step of the last update command", ("instance", "step", "command"))
+UPDATE_COMMAND_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_update_command_seconds", "Wall clock time of the whole update command", ("instance",))
+UPDATE_LOADED_SECONDS = metrics.REGISTRY.gauge("rustserverautoupdate_update_loaded_seconds", "Time from the last update starting to the new version loading", ("instance",))
+UPDATES = metrics.REGISTRY.counter("rustserverautoupdate_updates_total", "Updates run, by whether the new version loaded", ("instance", "result"))
+SAVE_SECONDS = metrics.REGISTRY.summary("rustserverautoupdate_save_seconds", "Time from sending server.save to the server reporting the save written", ("instance",))
+PLAYERS_ONLINE = metrics.REGISTRY.gauge("rustserverautoupdate_players_online", "Players online at the last check during a restart countdown", ("instance",))
+WIPES = metrics.REGISTRY.counter("rustserverautoupdate_wipes_total", "Forced wipes run", ("instance",))
+UPDATE_FAILED = metrics.REGISTRY.gauge("rustserverautoupdate_update_failed", "1 while the last update did not load the new version", ("instance",))
+
+def load_configuration(configPath, configSection = None):
+    """Read INI file and update with new options if necessary. Return the ConfigParser.
+       configSection is added to the file if it is missing. Without one only the defaults are upgraded.
+       The file is parsed once. Every instance sharing it takes its own section from the result."""
+    confComments = OrderedDict({'DEFAULT': {'# This is the Default configuration.': None,
+                                            '# These settings apply to all instances.': None,
+                                            '# New options will be added here on upgrade.': None,
+                                            '# Copy to appropriate section below and update as necessary.': None,
+                                            '# Individual instance settings will override defaults.': None}})
+    if configSection:
+        confComments[configSection] = {'# Enter '+ configSection +' Settings Here.': None}
+    confDefaults = OrderedDict({'DEFAULT': {'oxide_log_dir':  '/home/rustserver/serverfiles/oxide/logs',
+                                            'oxide_git_url': 'https://api.github.com/repositories/94599577/releases/latest',
+                                            'oxide_log_scan_mode': 'reverse',
+                                            'oxide_release_cache': 'yes',
+                                            'oxide_release_min_poll_in_sec': '60',
+                                            'cache_dir': '',
+                                            'oxide_prefetch': 'no',
+                                            'oxide_check_time_in_min': '15',
+                                            'oxide_auto_update': 'yes',
+                                            'bash_get_update_command': '/home/rustserver/./rustserver stop;/home/rustserver/./rustserver update;/home/rustserver/./rustserver mods-update;/home/rustserver/./rustserver start',
+                                            'update_log_file': '',
+                                            'update_step_timeout_in_min': '30',
+                                            'server_ready_timeout_in_min': '30',
+                                            'server_ready_poll_in_sec': '2',
+                                            'max_concurrent_updates': '1',
+                                            'restart_spacing_in_min': '5',
+                                            'restart_lock_dir': '',
+                                            'use_rcon': 'yes',
+                                            'use_discord': 'no',
+                                            'rcon_ip': '127.0.0.1',
+                                            'rcon_port': '28016',
+                                            'rcon_pass': 'CHANGE_ME',
+                                            'discord_webhook': '',
+                                            'discord_bot_name': 'RustPythonBot',
+                                            'discord_bot_avatar_url': '',
+                                            'discord_msg_game_name': 'My Rust Game',
+                                            'discord_msg_server_name': 'My Server',
+                                            'discord_msg_server_ip_port': '127.0.0.1:28015',
+                                            'discord_msg_server_host_name': '',
+                                            'discord_msg_title': '🚧 ALERT',
+                                            'notify_timeout_in_sec': '10',
+                                            'http_timeout_in_sec': '10',
+                                            'http_retries': '3',
+                                            'log_level': 'INFO',
+                                            'log_file': '',
+                                            'log_max_size_in_mb': '10',
+                                            'log_backup_count': '5',
+                                            'metrics_port': '0',
+                                            'metrics_address': '127.0.0.1',
+                                            'config_reload_check_in_sec': '30',
+                                            'control_socket': '',
+                                            'state_file': '',
+                                            'save_timeout_in_sec': '120',
+                                            'wipe_enabled': 'no',
+                                            'wipe_hour_utc': '19',
+                                            'wipe_min_days_between': '27',
+                                            'wipe_wait_for_update_in_min': '60',
+                                            'wipe_state_file': '',
+                                            'wipe_seed_file': '',
+                                            'bash_wipe_update_command': '/home/rustserver/./rustserver stop;/home/rustserver/./rustserver full-wipe;/home/rustserver/./rustserver update;/home/rustserver/./rustserver mods-update;/home/rustserver/./rustserver start',
+                                            'wipe_msg': 'This restart is the monthly forced wipe. The map will be wiped.',
+                                            'restart_countdown_policy': 'empty',
+                                            'restart_countdown_limits': '0:0, 3:5, 8:10',
+                                            'player_poll_in_sec': '30',
+                                            'send_15min_warn': 'yes',
+                                            'send_10min_warn': 'yes',
+                                            'send_5min_warn': 'yes',
+                                            'send_1min_warn': 'yes',
+                                            '15min_msg': 'Oxide Update Detected. Server will restart in 15 minutes for update.',
+                                            '10min_msg': 'Oxide Update Scheduled. Server will restart in 10 minutes for update.',
+                                            '5min_msg':  'Oxide Update Scheduled. Server will restart in 5 minutes for update.',
+                                            '1min_msg':  'FINAL WARNING! SERVER RESTARTING FOR OXIDE UPDATE IN 1 MINUTE!!'}})
+    if configSection:
+        confDefaults[configSection] = {}
+
+    configFile = os.path.join(configPath, "rustserverautoupdate.ini")
+    userconfig = configparser.ConfigParser()
+    userconfig.read(configFile, encoding='utf-8')
+
+    if (len(userconfig.defaults()) != len(confDefaults['DEFAULT'])) or (configSection and not userconfig.has_section(configSection)):
+        config = configparser.ConfigParser(allow_no_value=True)            
+        config.read_dict(confComments)
+        config.read_dict(confDefaults)
+
+        if userconfig.has_section(configSection):
+            for key,value in userconfig._sections[configSection].items():
+                if config.has_option(configSection, key):
+                    config[configSection][key] = value
+        for section in userconfig.sections():
+            if section != configSection:
+                config.add_section(section)
+                config[section]['# enter ' + section + ' settings here.'] = None
+                for (key,value) in userconfig._sections[section].items():
+                    if config.has_option(section, key):
+                        config[section][key] = value
+        for (key,value) in userconfig.defaults().items():
+            if config.has_option(config.default_section, key):
+                config[config.default_section][key] = value
+       
+        with open(configFile, 'w', encoding='utf-8') as configfile:
+            config.write(configfile)
+    #Raw values from the parse above. Interpolation happens on get, the same as reading the file again would.
+    config = configparser.ConfigParser()
+    config.read_dict(confDefaults)
+    config.read_dict({config.default_section: userconfig._defaults})
+    config.read_dict(userconfig._sections)
+    return config
+
+@dataclasses.dataclass(frozen=True)
+class MonitorSettings:
+    """Settings of one instance, read from its section once and never changed.
+       A reload builds a new MonitorSettings and swaps it in, so code holding the old one keeps consistent values."""
+    oxideLogDIR: str
+    oxideGitURL: str
+    oxideLogScanMode: str
+    oxideReleaseCache: bool
+    oxideReleaseMinPoll: float
+    cacheDIR: str
+    oxidePrefetch: bool
+    oxideCheckTime: float
+    oxideAutoUpdate: bool
+    bashCommand: str
+    updateLogFile: str
+    updateStepTimeout: float
+    serverReadyTimeout: float
+    serverReadyPoll: float
+    maxConcurrentUpdates: int
+    restartSpacing: float
+    restartLockDIR: str
+    useRCON: bool
+    useDiscord: bool
+    rconIP: str
+    rconPort: str
+    rconPass: str
+    rconBotName: str
+    discordWebHook: str
+    discordBotName: str
+    discordBotAvatarURL: str
+    discordMsgGameName: str
+    discordMsgServerName: str
+    discordMsgServerIP: str
+    discordMsgHostName: str
+    discordMsgTitle: str
+    notifyTimeout: float
+    httpTimeout: float
+    httpRetries: int
+    logLevel: str
+    logFile: str
+    logMaxSize: float
+    logBackupCount: int
+    metricsPort: int
+    metricsAddress: str
+    configReloadCheck: float
+    controlSocket: str
+    stateFile: str
+    saveTimeout: float
+    wipeEnabled: bool
+    wipeHour: int
+    wipeMinDays: float
+    wipeWaitForUpdate: float
+    wipeStateFile: str
+    wipeSeedFile: str
+    wipeCommand: str
+    wipeMsg: str
+    countdownPolicy: str
+    countdownLimits: str
+    playerPoll: float
+    send15MinWarn: bool
+    send10MinWarn: bool
+    send05MinWarn: bool
+    send01MinWarn: bool
+    msg15Min: str
+    msg10Min: str
+    msg05Min: str
+    msg01Min: str
+
+    @classmethod
+    def from_section(cls, config, section, configPath = ''):
+        """Read section of config. Fill in generic defaults if non-required variables are empty."""
+        confsec = config[section]
+        discordBotName = confsec['discord_bot_name'].strip() or 'Unknown Bot'
+        return cls(oxideLogDIR = confsec['oxide_log_dir'],
+                   oxideGitURL = confsec['oxide_git_url'],
+                   oxideLogScanMode = confsec['oxide_log_scan_mode'].strip().lower(),
+                   oxideReleaseCache = confsec.getboolean('oxide_release_cache'),
+                   oxideReleaseMinPoll = confsec.getfloat('oxide_release_min_poll_in_sec'),
+                   cacheDIR = confsec['cache_dir'].strip() or oxide.default_cache_dir(),
+                   oxidePrefetch = confsec.getboolean('oxide_prefetch'),
+                   oxideCheckTime = confsec.getfloat('oxide_check_time_in_min'),
+                   oxideAutoUpdate = confsec.getboolean('oxide_auto_update'),
+                   bashCommand = confsec['bash_get_update_command'],
+                   updateLogFile = confsec['update_log_file'].strip() or os.path.join(os.path.abspath(configPath), 'rustserverautoupdate_' + section.lower() + '_update.log'),
+                   updateStepTimeout = confsec.getfloat('update_step_timeout_in_min'),
+                   serverReadyTimeout = confsec.getfloat('server_ready_timeout_in_min'),
+                   serverReadyPoll = confsec.getfloat('server_ready_poll_in_sec'),
+                   maxConcurrentUpdates = confsec.getint('max_concurrent_updates'),
+                   restartSpacing = confsec.getfloat('restart_spacing_in_min'),
+                   restartLockDIR = confsec['restart_lock_dir'].strip() or os.path.abspath(configPath),
+                   useRCON = confsec.getboolean('use_rcon'),
+                   useDiscord = confsec.getboolean('use_discord'),
+                   rconIP = confsec['rcon_ip'].strip(),
+                   rconPort = confsec['rcon_port'].strip(),
+                   rconPass = confsec['rcon_pass'].strip(),
+                   rconBotName = discordBotName,
+                   discordWebHook = confsec['discord_webhook'].strip(),
+                   discordBotName = discordBotName,
+                   discordBotAvatarURL = confsec['discord_bot_avatar_url'].strip(),
+                   discordMsgGameName = confsec['discord_msg_game_name'].strip() or 'Unkown Game',
+                   discordMsgServerName = confsec['discord_msg_server_name'].strip() or 'Unknown Server',
+                   discordMsgServerIP = confsec['discord_msg_server_ip_port'].strip() or '127.0.0.1',
+                   discordMsgHostName = confsec['discord_msg_server_host_name'].strip(),
+                   discordMsgTitle = confsec['discord_msg_title'],
+                   notifyTimeout = confsec.getfloat('notify_timeout_in_sec'),
+                   httpTimeout = confsec.getfloat('http_timeout_in_sec'),
+                   httpRetries = confsec.getint('http_retries'),
+                   logLevel = confsec['log_level'],
+                   logFile = confsec['log_file'].strip() or os.path.join(os.path.abspath(configPath), 'rustserverautoupdate_' + section.lower() + '.log'),
+                   logMaxSize = confsec.getfloat('log_max_size_in_mb'),
+                   logBackupCount = confsec.getint('log_backup_count'),
+                   metricsPort = confsec.getint('metrics_port'),
+                   metricsAddress = confsec['metrics_address'].strip(),
+                   configReloadCheck = confsec.getfloat('config_reload_check_in_sec'),
+                   controlSocket = confsec['control_socket'].strip(),
+                   stateFile = confsec['state_file'].strip() or os.path.join(os.path.abspath(configPath), 'rustserverautoupdate_' + section.lower() + '_state.json'),
+                   saveTimeout = confsec.getfloat('save_timeout_in_sec'),
+                   wipeEnabled = confsec.getboolean('wipe_enabled'),
+                   wipeHour = confsec.getint('wipe_hour_utc'),
+                   wipeMinDays = confsec.getfloat('wipe_min_days_between'),
+                   wipeWaitForUpdate = confsec.getfloat('wipe_wait_for_update_in_min'),
+                   wipeStateFile = confsec['wipe_state_file'].strip() or os.path.join(os.path.abspath(configPath), 'rustserverautoupdate_' + section.lower() + '_wipe.json'),
+                   wipeSeedFile = confsec['wipe_seed_file'].strip(),
+                   wipeCommand = confsec['bash_wipe_update_command'],
+                   wipeMsg = confsec['wipe_msg'],
+                   countdownPolicy = confsec['restart_countdown_policy'].strip().lower(),
+                   countdownLimits = confsec['restart_countdown_limits'],
+                   playerPoll = confsec.getfloat('player_poll_in_sec'),
+                   send15MinWarn = confsec.getboolean('send_15min_warn'),
+                   send10MinWarn = confsec.getboolean('send_10min_warn'),
+                   send05MinWarn = confsec.getboolean('send_5min_warn'),
+                   send01MinWarn = confsec.getboolean('send_1min_warn'),
+                   msg15Min = confsec['15min_msg'],
+                   msg10Min = confsec['10min_msg'],
+                   msg05Min = confsec['5min_msg'],
+                   msg01Min = confsec['1min_msg'])
+
+    def validate(self):
+        """Check variables to confirm they will not cause errors. Raise RustMonitorVariableError if one would."""
+        if not self.oxideAutoUpdate and not self.useDiscord and not self.useRCON:
+            raise RustMonitorVariableError('oxide_auto_update', 'Oxide Auto Update, Discord, and RCON are all disabled. There is nothing for this program to do.')
+        if self.useDiscord and not self.discordWebHook:
+            raise RustMonitorVariableError('discord_webhook', 'Discord Bot is enabled, but no webHook was provided.')
+        if self.useRCON:
+            if not self.rconIP:
                 raise RustMonitorVariableError('rcon_ip', 'RCON is Enabled, but no IP was provided')
-            else:
-                self.rconIP = self.rconIP.strip()
-            if not self.rconPort.strip():
+            if not self.rconPort:
                 raise RustMonitorVariableError('rcon_port', 'RCON is Enabled, but no Port was provided')
-            else:
-                self.rconPort = self.rconPort.strip()
-            if not self.rconPass.strip():
+            if not self.rconPass:
                 raise RustMonitorVariableError('rcon_pass', 'RCON is Enabled, but no Password was provided')
-            else:
-                self.rconPass = self.rconPass.strip()
-            if not self.rconBotName.strip():
-                self.discordBotName = 'Unknown Bot'
-    def send_msgs(self, msg):
-        """Containted method to send messages to both discord and RCON"""
-        #TODO: Add logging to exception messages.
-        if self.useDiscord:
-            try:
-                self.discordBot.send_message(self.serverinfo, msg, self.discordMsgTitle)
-            except Exception as ex:
-                print(ex)
-        if self.useRCON:
+        if self.oxideLogScanMode not in ('reverse', 'forward'):
+            raise RustMonitorVariableError('oxide_log_scan_mode', 'Log scan mode must be reverse or forward.')
+        if self.logLevel.strip().upper() not in ('', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+            raise RustMonitorVariableError('log_level', 'Log level must be debug, info, warning, error or critical.')
+        if self.wipeEnabled and not self.oxideAutoUpdate:
+            raise RustMonitorVariableError('wipe_enabled', 'Forced wipes restart the server, which needs Oxide Auto Update enabled.')
+        if self.oxideReleaseCache or self.oxidePrefetch:
             try:
-                self.rconBot.send_message('say ' + msg)
-            except Exception as ex:
-                print(ex)
-    def kick_save(self):
-        """Containted method to kick players and save before restart."""
-        #TODO: Add logging to exception messages.
-        if self.useRCON:
+                jsonfile.make_private_dir(self.cacheDIR)
+            except OSError as err:
+                raise RustMonitorVariableError('cache_dir', 'Cache directory cannot be used. ' + str(err))
+        try:
+            countdown.create_policy(self.countdownPolicy, self.countdownLimits)
+        except ValueError as err:
+            raise RustMonitorVariableError('restart_countdown_policy', str(err))
+
+    def changed(self, other):
+        """Names of the settings that differ between self and other"""
+        return [field.name for field in dataclasses.fields(self) if getattr(self, field.name) != getattr(other, field.name)]
+
+class RustMonitor:
+    def __init__(self, configPath = '', configSection = 'SERVER1', config = None):
+        """config is an already loaded ConfigParser shared with other monitors.
+           Without it the INI file is read and upgraded for configSection."""
+        if config is None:
+            configSectionUpper = configSection.upper()
+            self.setup_configuration(configPath, configSectionUpper)
+        else:
+            configSectionUpper = configSection
+            self.config = config
+        self.section = configSectionUpper
+        self.configPath = configPath
+        self.settings = MonitorSettings.from_section(self.config, configSectionUpper, configPath)
+        self.log = jsonlog.get_instance_logger(configSectionUpper, self.settings.logLevel)
+
+    def setup_configuration(self, configPath, configSection):
+        """Read INI file and update with new options if necessary"""
+        self.config = load_configuration(configPath, configSection)
+
+    def apply_settings(self, settings, unused = ()):
+        """Swap in settings from a reloaded configuration while the monitor keeps running.
+           Settings in RESTART_REQUIRED_SETTINGS keep their current values and a warning says a restart is needed.
+           Settings named in unused are not used by this monitor and are ignored.
+           Return the names of the settings that changed."""
+        changed = [name for name in self.settings.changed(settings) if name not in unused]
+        if unused:
+            settings = dataclasses.replace(settings, **{name: getattr(self.settings, name) for name in unused})
+        if not changed:
+            return changed
+        pending = [name for name in changed if name in RESTART_REQUIRED_SETTINGS]
+        if pending:
+            self.log.warning("Restart to apply changed settings: " + ", ".join(pending), extra={'phase': 'config', 'settings': pending})
+            settings = dataclasses.replace(settings, **{name: getattr(self.settings, name) for name in pending})
+        self.settings = settings
+        self.log.logger.setLevel(settings.logLevel.strip().upper() or 'INFO')
+        if hasattr(self, 'serverinfo'):
+            self.serverinfo = discord.ServerInformation(settings.discordMsgGameName, settings.discordMsgServerName, settings.discordMsgServerIP, settings.discordMsgHostName)
+        if hasattr(self, 'readinessWatcher'):
+            self.readinessWatcher.pollInterval = settings.serverReadyPoll
+        applied = [name for name in changed if name not in pending]
+        if applied:
+            self.log.info("Applied changed settings: " + ", ".join(applied), extra={'phase': 'config', 'settings': applied})
+        return changed
+
+    async def send_msgs(self, msg):
+        """Containted method to send messages to both discord and RCON
+           Both are sent at the same time and each is given notifyTimeout seconds,
+           so a slow webhook does not hold back the in game warning.
+           A Discord message still queued after notifyTimeout stays queued and is posted once the rate limit allows."""
+        sinks = []
+        discordPost = None
+        if self.settings.useDiscord:
+            discordPost = asyncio.wrap_future(self.discordBot.queue_message(self.serverinfo, msg, self.settings.discordMsgTitle))
+            #Shielded so the timeout only stops waiting. Cancelling the post would drop the message from the queue.
+            sinks.append(('Discord', asyncio.shield(discordPost)))
+        if self.settings.useRCON:
+            sinks.append(('RCON', self.rconBot.send_message('say ' + msg, timeout=self.settings.notifyTimeout)))
+        results = await asyncio.gather(*[asyncio.wait_for(send, self.settings.notifyTimeout) for (name, send) in sinks], return_exceptions=True)
+        for (name, send), result in zip(sinks, results):
+            if isinstance(result, asyncio.TimeoutError):
+                if name == 'Discord':
+                    self.log.warning("Discord message still queued after " + str(self.settings.notifyTimeout) + " seconds. It will be posted when the rate limit allows.", extra={'phase': 'notify', 'sink': name})
+                    discordPost.add_done_callback(self.late_post_done)
+                else:
+                    self.log.warning(name + " message timed out after " + str(self.settings.notifyTimeout) + " seconds", extra={'phase': 'notify', 'sink': name})
+            elif isinstance(result, Exception):
+                self.log.error(name + " message failed: " + repr(result), extra={'phase': 'notify', 'sink': name})
+
+    def late_post_done(self, post):
+        """Log the outcome of a Discord message that was still queued when send_msgs stopped waiting"""
+        if post.cancelled():
+            return
+        if post.exception() is not None:
+            self.log.error("Discord message failed: " + repr(post.exception()), extra={'phase': 'notify', 'sink': 'Discord'})
+        else:
+            self.log.info("Queued Discord message posted", extra={'phase': 'notify', 'sink': 'Discord'})
+
+    async def kick_save(self):
+        """Containted method to kick players and save before restart.
+           Returns once the server reports the save was written, or after saveTimeout seconds,
+           so the update command never stops the server part way through a save."""
+        if self.settings.useRCON:
             try:
-                self.rconBot.send_message('kickall "" "Server Restarting"')
-                self.rconBot.send_message('server.save')
+                await self.rconBot.send_message('kickall "" "Server Restarting"')
+                start = self.loop.time()
+                await self.rconBot.save(timeout=self.settings.saveTimeout)
+                duration = self.loop.time() - start
+                self.log.info("Server saved in " + str(round(duration, 1)) + " seconds", extra={'phase': 'kick_save', 'duration': round(duration, 3)})
+                SAVE_SECONDS.observe(duration, instance=self.section)
+            except asyncio.TimeoutError:
+                self.log.warning("Save not confirmed after " + str(self.settings.saveTimeout) + " seconds. Continuing with the update.", extra={'phase': 'kick_save'})
             except Exception as ex:
-                print(ex)
-
-    def wipe_check(self):
-        timeZN = timezone(timedelta(hours=0))
-        tm = datetime.now(timeZN).timetuple()
-        if tm.tm_mday <= 7 and tm.tm_wday == 3:
-            #TODO: Setup INI variable for storing the previous wipe date
-            lastwipedatetimestr = "2021-01-12 20:43:18.267496+00:00"
-            previousdatetime = datetime.strptime(lastwipedatetimestr, '%Y-%m-%d %H:%M:%S.%f%z')
-            mindaysbetweenwipe = timedelta(days=27)
-            if datetime.now(timeZN) >= (previousdatetime + mindaysbetweenwipe):
-                newseed = random.randrange(1, 2147483647, 1)
-                currentwipedt = datetime.now(timeZN)
-                #TODO: Save Current Seed. Write New Seed. Write Last wipe time. Trigger restart
+                self.log.error("Kick and save failed: " + repr(ex), extra={'phase': 'kick_save'})
+
+    def wipe_schedule(self):
+        """WipeSchedule from the current settings, or None if forced wipes are off"""
+        if not self.settings.wipeEnabled:
+            return None
+        return wipe.WipeSchedule(self.settings.wipeStateFile, self.settings.wipeSeedFile, self.settings.wipeHour, self.settings.wipeMinDays)
+
+    def build_warning_schedule(self):
+        """Warnings to send before a restart as (minutes before restart, message), earliest first.
+           The countdown starts with the first warning, so the restart is that many minutes after an update is found."""
+        warnings = [(15, self.settings.send15MinWarn, self.settings.msg15Min),
+                    (10, self.settings.send10MinWarn, self.settings.msg10Min),
+                    (5, self.settings.send05MinWarn, self.settings.msg05Min),
+                    (1, self.settings.send01MinWarn, self.settings.msg01Min)]
+        if self.pendingWipe:
+            warnings = [(minutes, enabled, msg + " " + self.settings.wipeMsg) for (minutes, enabled, msg) in warnings]
+        return sorted(((minutes, msg) for (minutes, enabled, msg) in warnings if enabled), reverse=True)
+
+    async def check_for_update(self):
+        """Scheduled event. Check for a new Oxide version and start the countdown or schedule the next check."""
+        if self.restartAt is not None or self.restarting:
+            #A countdown already covers this release. The restart schedules the next check.
+            return
+        self.cooldownUntil = None
+        start = self.loop.time()
+        self.checking = True
+        try:
+            response = await self.loop.run_in_executor(self.executor, self.oxideBot.check_update)
+        finally:
+            self.checking = False
+        self.lastCheckTime = time()
+        self.lastCheckDuration = self.loop.time() - start
+        fields = {'phase': 'check', 'running': response[2], 'latest': response[3], 'duration': round(self.lastCheckDuration, 3)}
+        self.record_versions(response[2], response[3])
+        updateFound = response[0] and response[3] not in (self.failedVersion, self.skippedVersion)
+        if response[0] and response[3] == self.failedVersion:
+            self.log.warning("Skipping Oxide " + response[3] + ". The last update to it did not load. Running Version: " + response[2], extra=fields)
+        elif response[0] and not updateFound:
+            self.log.info("Skipping Oxide " + response[3] + ". Its restart was cancelled. Running Version: " + response[2], extra=fields)
+        elif not updateFound:
+            #self.send_msgs("Oxide Up to Date: " + response[2])
+            self.log.info("Oxide Up to Date: " + response[2], extra=fields)
+        wipeSchedule = self.wipe_schedule()
+        wipeDue = wipeSchedule is not None and wipeSchedule.wipe_due()
+        if wipeDue and not updateFound:
+            #Oxide usually releases soon after the forced wipe update. Wait for it so one restart covers both.
+            if self.wipeDueSince is None:
+                self.wipeDueSince = self.loop.time()
+                self.log.info("Forced wipe due. Waiting up to " + str(self.settings.wipeWaitForUpdate) + " minutes for an Oxide update to restart once for both.", extra={'phase': 'wipe'})
+            remaining = self.wipeDueSince + self.settings.wipeWaitForUpdate * 60 - self.loop.time()
+            if remaining > 0:
+                self.scheduler.call_later(min(self.settings.oxideCheckTime * 60, remaining), 'check', self.check_for_update)
                 return
+        if updateFound:
+            self.log.info("Found New Version: " + response[3] + " Old Version: " + response[2], extra=fields)
+            self.latestVersion = response[3]
+            if self.artifactCache is not None:
+                self.prefetchTask = self.loop.create_task(self.prefetch_update())
+        else:
+            self.latestVersion = None
+        if updateFound or wipeDue:
+            self.pendingWipe = wipeDue
+            if wipeDue:
+                self.log.info("Forced wipe " + ("with the Oxide update" if updateFound else "without an Oxide update"), extra={'phase': 'wipe'})
+            self.start_countdown()
+        else:
+            self.scheduler.call_later(self.settings.oxideCheckTime * 60, 'check', self.check_for_update)
 
-    async def update_loop(self):
-        self.stop = False
-        timeZN = timezone(timedelta(hours=0))
-        loopCycleTime = timedelta(minutes=self.oxideCheckTime)
-        loopStartTime = datetime.now(timeZN)
-        loopStart = True
-        updateNeeded = False
-        while not self.stop:
-            if ((datetime.now(timeZN) >= (loopStartTime + loopCycleTime)) or loopStart) and not updateNeeded:
-                response = self.oxideBot.check_update()
-                if response[0]:
-                    print("Found New Version: " + response[3] + " Old Version: " + response[2])
-                    updateNeeded = True
-                else:
-                    #self.send_msgs("Oxide Up to Date: " + response[2])
-                    print("Oxide Up to Date: " + response[2])
-                loopStartTime = datetime.now(timeZN)
-                messageWaitTime = timedelta(minutes=0)
-            if updateNeeded and not loopStart:
-                if send15 and (datetime.now(timeZN) >= (loopStartTime + messageWaitTime)):
-                    print("Sending 15 Minute Warning")
-                    with ThreadPoolExecutor() as executor:
-                        await self.loop.run_in_executor(executor, self.send_msgs, self.msg15Min)
-                    send15 = False
-                    loopStartTime = datetime.now(timeZN)
-                    messageWaitTime = timedelta(minutes=15)
-                elif send10 and (datetime.now(timeZN) >= (loopStartTime + (messageWaitTime - timedelta(minutes=10)))):
-                    print("Sending 10 Minute Warning")
-                    with ThreadPoolExecutor() as executor:
-                        await self.loop.run_in_executor(executor, self.send_msgs,self.msg10Min)
-                    send10 = False
-                    loopStartTime = datetime.now(timeZN)
-                    messageWaitTime = timedelta(minutes=10)
-                elif send05 and (datetime.now(timeZN)  >= (loopStartTime + (messageWaitTime - timedelta(minutes=5)))):
-                    print("Sending 5 Minute Warning")
-                    with ThreadPoolExecutor() as executor:
-                        await self.loop.run_in_executor(executor, self.send_msgs, self.msg05Min)
-                    send05 = False
-                    loopStartTime = datetime.now(timeZN)
-                    messageWaitTime = timedelta(minutes=5)
-                elif send01 and (datetime.now(timeZN)  >= (loopStartTime + (messageWaitTime - timedelta(minutes=1)))):
-                    print("Sending 1 Minute Warning")
-                    with ThreadPoolExecutor() as executor:
-                        await self.loop.run_in_executor(executor, self.send_msgs, self.msg01Min)
-                    send01 = False
-                    loopStartTime = datetime.now(timeZN)
-                    messageWaitTime = timedelta(minutes=1)
-                elif autoUpdate and (datetime.now(timeZN) >= (loopStartTime + messageWaitTime)) and not (send01 or send05 or send10 or send15):
-                    print("Updating Oxide")
-                    with ThreadPoolExecutor() as executor:
-                        print(self.bashCommand)
-                        await self.loop.run_in_executor(executor, self.kick_save)
-                        await self.loop.run_in_executor(executor, partial(run, self.bashCommand, shell=True, universal_newlines=True))                    
-                    autoUpdate = False
-                elif not (send01 or send05 or send10 or send15 or autoUpdate):
-                    print("Reset Update Check")
-                    updateNeeded = False
-                    #Using LinuxGSM the shell will return and the game starts up in a separate thread. Need to wait for the game to start so that the logs load.
-                    #Could probably do this a different way, but for now, I think this is the best option. 
-                    #It's unlikely another update would come through in 20 minutes. So this will be 20 minutes + the delay set by the user.
-                    loopStartTime = datetime.now(timeZN) + timedelta(minutes=20)
+    def record_versions(self, runningVersion, latestVersion):
+        """Publish the running and latest versions as metrics"""
+        self.runningVersion = runningVersion
+        self.releasedVersion = latestVersion
+        for (kind, version) in (('running', runningVersion), ('latest', latestVersion)):
+            OXIDE_VERSION.remove(instance=self.section, kind=kind)
+            OXIDE_VERSION.set(1, instance=self.section, kind=kind, version=version)
+
+    async def prefetch_update(self):
+        """Download the new release asset into the shared artifact cache during the countdown.
+           Return the cached path, or None if it could not be downloaded."""
+        try:
+            releaseInfo = await self.loop.run_in_executor(self.executor, self.oxideBot.get_release_info)
+            asset = releaseInfo.assets.get('linux')
+            if asset is None:
+                return None
+            path = await self.loop.run_in_executor(self.executor, self.artifactCache.fetch_asset, asset)
+            self.log.info("Prefetched " + asset['browser_download_url'] + " to " + path, extra={'phase': 'prefetch'})
+            return path
+        except Exception as ex:
+            self.log.error("Prefetch failed: " + repr(ex), extra={'phase': 'prefetch'})
+            return None
+
+    async def update_environment(self):
+        """Environment for the update command. Includes the prefetched asset once its download finishes."""
+        env = dict(os.environ)
+        if self.latestVersion:
+            env['OXIDE_VERSION'] = self.latestVersion
+        if self.prefetchTask is not None:
+            path = await self.prefetchTask
+            self.prefetchTask = None
+            if path:
+                env['OXIDE_ARTIFACT_PATH'] = path
+        return env
+
+    def start_countdown(self):
+        """Schedule every warning and the restart from the warning schedule.
+           With RCON the players online are checked first and then every playerPoll seconds,
+           and the countdown policy may shorten the countdown."""
+        if self.restartAt is not None:
+            return
+        warningSchedule = self.build_warning_schedule()
+        countdownMinutes = warningSchedule[0][0] if warningSchedule else 0
+        now = self.loop.time()
+        restartAt = now + countdownMinutes * 60
+        if self.settings.oxideAutoUpdate and self.restartCoordinator is not None:
+            #Shift the whole countdown if other instances on this host already restart around then.
+            earliest = time() + countdownMinutes * 60
+            delay = self.restartCoordinator.reserve_restart(self.section, earliest) - earliest
+            if delay > 0:
+                self.log.info("Delaying restart " + str(round(delay / 60, 1)) + " minutes to avoid other instances restarting", extra={'phase': 'countdown', 'delay': round(delay, 1)})
+                restartAt += delay
+        self.restartAt = restartAt
+        self.warningsSent = []
+        #Scheduled ahead of the first warning so an empty server restarts without warning anyone.
+        self.schedule_player_checks(now)
+        self.schedule_countdown(warningSchedule)
+
+    def schedule_player_checks(self, when):
+        """Start checking the players online at loop time when, if the countdown policy uses them"""
+        if self.settings.oxideAutoUpdate and self.settings.useRCON and self.settings.countdownPolicy != countdown.CountdownPolicy.name:
+            self.scheduler.call_at(when, 'players', self.check_players)
+
+    def schedule_countdown(self, warningSchedule):
+        """Schedule the warnings still ahead of restartAt and the restart itself"""
+        now = self.loop.time()
+        for (minutes, msg) in warningSchedule:
+            if self.restartAt - minutes * 60 >= now - 1 and minutes not in self.warningsSent:
+                self.scheduler.call_at(self.restartAt - minutes * 60, 'warning', self.send_warning, minutes, msg)
+        if self.settings.oxideAutoUpdate:
+            self.scheduler.call_at(self.restartAt, 'restart', self.restart_server)
+        else:
+            self.scheduler.call_at(self.restartAt, 'cooldown', self.start_cooldown)
+
+    async def check_players(self):
+        """Scheduled event. Ask the countdown policy how long the countdown may still run with the players online
+           and bring the restart forward if it may be shorter."""
+        try:
+            players = await self.rconBot.get_player_count(timeout=self.settings.notifyTimeout)
+        except Exception as ex:
+            self.log.warning("Player count failed: " + repr(ex), extra={'phase': 'countdown'})
+            players = None
+        if players is not None:
+            PLAYERS_ONLINE.set(players, instance=self.section)
+            policy = countdown.create_policy(self.settings.countdownPolicy, self.settings.countdownLimits)
+            limit = policy.max_remaining(players)
+            if limit is not None and limit < self.restartAt - self.loop.time() - 1:
+                self.shorten_countdown(limit, players)
+        remaining = self.restartAt - self.loop.time()
+        if remaining > 0:
+            self.scheduler.call_later(min(self.settings.playerPoll, remaining), 'players', self.check_players)
+
+    def shorten_countdown(self, limit, players):
+        """Move the restart to limit seconds from now and reschedule the warnings still ahead of it"""
+        restartAt = self.loop.time() + limit
+        if self.restartCoordinator is not None:
+            earliest = time() + limit
+            current = time() + self.restartAt - self.loop.time()
+            reserved = self.restartCoordinator.reserve_restart(self.section, earliest)
+            if reserved >= current:
+                #Other instances restart around then. Keep the slot already reserved.
+                self.restartCoordinator.reserve_restart(self.section, current)
+                return
+            restartAt += reserved - earliest
+        remaining = max(0, restartAt - self.loop.time())
+        self.log.info(str(players) + " players online. Restarting " + ("in " + str(round(remaining / 60, 1)) + " minutes" if remaining >= 1 else "now") +
+                      " instead of in " + str(round((self.restartAt - self.loop.time()) / 60, 1)) + " minutes", extra={'phase': 'countdown', 'players': players})
+        self.scheduler.cancel('warning')
+        self.scheduler.cancel('restart')
+        self.restartAt = restartAt
+        self.schedule_countdown(self.build_warning_schedule())
+
+    async def send_warning(self, minutes, msg):
+        """Scheduled event. Send one countdown warning."""
+        self.log.info("Sending " + str(minutes) + " Minute Warning", extra={'phase': 'countdown', 'minutes': minutes})
+        self.warningsSent.append(minutes)
+        await self.send_msgs(msg)
+
+    async def restart_server(self):
+        """Scheduled event. Kick, save and run the update command."""
+        self.scheduler.cancel('players')
+        self.restartAt = None
+        self.restarting = True
+        #Set once the update starts. Until then the journal does not record an update in progress.
+        self.updateStartTime = None
+        try:
+            await self.run_restart()
+        finally:
+            self.restarting = False
+
+    async def run_restart(self):
+        """Run the restart for restart_server and wait for the server to come back.
+           The restart slot is held until the server is ready or serverReadyTimeout runs out."""
+        slotLock = None
+        waited = 0
+        if self.restartCoordinator is not None:
+            slotLock = self.restartCoordinator.try_acquire()
+            if slotLock is None:
+                self.log.info("Waiting for another instance to finish updating", extra={'phase': 'restart'})
+                waitStart = self.loop.time()
+                slotLock = await self.restartCoordinator.acquire()
+                waited = self.loop.time() - waitStart
+        try:
+            await self.repeat_final_warning(waited)
+            self.updateStartTime = self.loop.time()
+            env = await self.update_environment()
+            command = self.settings.bashCommand
+            wipeSchedule = self.wipe_schedule()
+            seed = None
+            #A wipe that came due during an update countdown is done in the same restart.
+            if wipeSchedule is not None and (self.pendingWipe or wipeSchedule.wipe_due()):
+                try:
+                    seed = wipeSchedule.prepare()
+                    #Recorded before the command runs, so neither a failing wipe command nor a crash part way through wipes twice.
+                    wipeSchedule.record_wipe(seed)
+                    env['WIPE_SEED'] = str(seed)
+                    command = self.settings.wipeCommand
+                except OSError as ex:
+                    self.log.error("Not wiping. Could not write the new seed to " + wipeSchedule.seedFile + ": " + repr(ex), extra={'phase': 'wipe'})
+            self.pendingWipe = False
+            self.wipeDueSince = None
+            if seed is None:
+                self.log.info("Updating Oxide", extra={'phase': 'restart', 'command': command})
             else:
-                if self.send15MinWarn:
-                    send15 = True
-                else:
-                    send15 = False
-                if self.send10MinWarn:
-                    send10 = True
-                else:
-                    send10 = False
-                if self.send05MinWarn:
-                    send05 = True
-                else:
-                    send05 = False
-                if self.send01MinWarn:
-                    send01 = True
-                else:
-                    send01 = False
-                if self.oxideAutoUpdate:
-                    autoUpdate = True
-                else:
-                    autoUpdate = False
-            loopStart = False
-            await asyncio.sleep(1)
+                self.log.info("Wiping with seed " + str(seed) + " and updating Oxide", extra={'phase': 'restart', 'command': command, 'seed': seed})
+            await self.kick_save()
+            self.readinessWatcher.mark()
+            #From here a monitor restarted part way through must not run the command again, only wait for the server.
+            self.save_state()
+            results = await self.run_update_command(env, command)
+            if seed is not None:
+                WIPES.inc(instance=self.section)
+                if any(result.returnCode != 0 for result in results):
+                    self.log.error("Wipe command did not finish cleanly. Check " + self.settings.updateLogFile, extra={'phase': 'wipe'})
+            #LinuxGSM start returns while the server is still loading. Keep the slot until it is up,
+            #so the next instance does not update while this one is still booting.
+            await self.wait_for_ready()
+        finally:
+            if slotLock is not None:
+                slotLock.release()
+                self.restartCoordinator.release_reservation(self.section)
+
+    async def repeat_final_warning(self, waited):
+        """Send the last countdown warning again and wait it out if the restart was held up for longer than it promised.
+           The slot another instance holds can be kept until its server is ready, which may be well past restart_spacing_in_min."""
+        warningSchedule = self.build_warning_schedule()
+        if not warningSchedule or waited <= warningSchedule[-1][0] * 60:
+            return
+        minutes, msg = warningSchedule[-1]
+        self.log.info("Restart held up " + str(round(waited / 60, 1)) + " minutes by another instance. Sending the " + str(minutes) + " Minute Warning again.", extra={'phase': 'restart', 'minutes': minutes})
+        await self.send_msgs(msg)
+        await asyncio.sleep(minutes * 60)
+
+    async def run_update_command(self, env, command = None):
+        """Run command, the update command by default, step by step, logging its output to updateLogFile. Return the StepResults."""
+        stepTimeout = self.settings.updateStepTimeout * 60 if self.settings.updateStepTimeout > 0 else None
+        runner = shell.CommandRunner(command or self.settings.bashCommand, self.settings.updateLogFile, stepTimeout, env=env)
+        start = self.loop.time()
+        results = await runner.run()
+        duration = self.loop.time() - start
+        self.log.info("Update command finished in " + str(round(duration, 1)) + " seconds. Output in " + self.settings.updateLogFile, extra={'phase': 'update', 'duration': round(duration, 3)})
+        UPDATE_COMMAND_SECONDS.observe(duration, instance=self.section)
+        UPDATE_STEP_SECONDS.remove(instance=self.section)
+        for stepNumber, result in enumerate(results, 1):
+            self.log.info(str(result), extra={'phase': 'update', 'step': stepNumber, 'command': result.command, 'returncode': result.returnCode,
+                                              'duration': round(result.duration, 3), 'timed_out': result.timedOut})
+            UPDATE_STEP_SECONDS.set(result.duration, instance=self.section, step=stepNumber, command=result.command)
+        return results
+
+    async def wait_for_ready(self, timeout = None):
+        """Wait for the restarted server to load Oxide and answer RCON, then check for updates again straight away.
+           timeout defaults to serverReadyTimeout. Falls back to the fixed cooldown when readiness detection is turned off."""
+        if self.settings.serverReadyTimeout <= 0:
+            self.start_cooldown()
+            return
+        self.log.info("Waiting for server to start", extra={'phase': 'ready'})
+        start = self.loop.time()
+        version, rconReady = await self.readinessWatcher.wait_ready(self.settings.serverReadyTimeout * 60 if timeout is None else timeout)
+        if version is None or not rconReady:
+            self.log.warning("Server not ready after " + str(self.settings.serverReadyTimeout) + " minutes" + (". Oxide " + version + " loaded but RCON did not answer" if version else "") +
+                             ". Next check in " + str(self.settings.oxideCheckTime) + " minutes.", extra={'phase': 'ready', 'running': version})
+            #Whether the update worked depends only on the version loaded, not on RCON answering.
+            self.verify_update(version)
+            self.scheduler.call_later(self.settings.oxideCheckTime * 60, 'check', self.check_for_update)
+            return
+        self.log.info("Server ready running Oxide " + version + " after " + str(round(self.loop.time() - start, 1)) + " seconds", extra={'phase': 'ready', 'running': version, 'duration': round(self.loop.time() - start, 3)})
+        self.verify_update(version)
+        self.scheduler.call_later(0, 'check', self.check_for_update)
+
+    def verify_update(self, version):
+        """Confirm the restarted server loaded latestVersion. version is what the log tail showed, None if nothing loaded.
+           A failed update marks latestVersion so it does not trigger another restart. Return True if it loaded."""
+        if self.latestVersion is None:
+            return True
+        if version == self.latestVersion:
+            self.updateDuration = self.loop.time() - self.updateStartTime
+            self.failedVersion = None
+            self.log.info("Verified Oxide " + version + " loaded " + str(round(self.updateDuration, 1)) + " seconds after the update started", extra={'phase': 'verify', 'running': version, 'duration': round(self.updateDuration, 3)})
+            UPDATE_LOADED_SECONDS.set(self.updateDuration, instance=self.section)
+            UPDATES.inc(instance=self.section, result='verified')
+            UPDATE_FAILED.set(0, instance=self.section)
+            return True
+        self.failedVersion = self.latestVersion
+        UPDATES.inc(instance=self.section, result='failed')
+        UPDATE_FAILED.set(1, instance=self.section)
+        self.log.error("UPDATE FAILED: Expected Oxide " + self.latestVersion + " but the server " + ("loaded " + version if version else "did not load Oxide") + ". Not restarting for this version again.", extra={'phase': 'verify', 'running': version, 'latest': self.latestVersion})
+        return False
+
+    def start_cooldown(self):
+        """Hold off the next check until the server has had time to start"""
+        self.log.info("Reset Update Check", extra={'phase': 'cooldown'})
+        self.restartAt = None
+        self.cooldownUntil = time() + (RESTART_COOLDOWN_MINUTES + self.settings.oxideCheckTime) * 60
+        #Using LinuxGSM the shell will return and the game starts up in a separate thread. Need to wait for the game to start so that the logs load.
+        #Could probably do this a different way, but for now, I think this is the best option. 
+        #It's unlikely another update would come through in 20 minutes. So this will be 20 minutes + the delay set by the user.
+        self.scheduler.call_later((RESTART_COOLDOWN_MINUTES + self.settings.oxideCheckTime) * 60, 'check', self.check_for_update)
+
+    def status(self):
+        """What the monitor is doing, for the control socket"""
+        now = self.loop.time()
+        nextEvent = self.scheduler.next_event()
+        state = 'idle'
+        if self.restarting:
+            state = 'restarting'
+        elif self.restartAt is not None:
+            state = 'countdown'
+        return {'instance': self.section,
+                'state': state,
+                'running_version': self.runningVersion,
+                'latest_version': self.releasedVersion,
+                'failed_version': self.failedVersion,
+                'skipped_version': self.skippedVersion,
+                'pending_wipe': self.pendingWipe,
+                'restart_in_sec': None if self.restartAt is None else round(max(0, self.restartAt - now), 1),
+                'next_event': None if nextEvent is None else {'name': nextEvent.name, 'in_sec': round(max(0, nextEvent.when - now), 1)},
+                'last_check_ago_sec': None if self.lastCheckTime is None else round(time() - self.lastCheckTime, 1),
+                'last_check_seconds': None if self.lastCheckDuration is None else round(self.lastCheckDuration, 3)}
+
+    def check_now(self):
+        """Run the next update check straight away, unless one is running now. Return an error message, or None."""
+        if self.restarting or self.restartAt is not None:
+            return "A restart is already pending"
+        if self.checking:
+            self.log.info("Update check requested while one is running. Using its result.", extra={'phase': 'control'})
+            return None
+        self.scheduler.cancel('check')
+        self.scheduler.call_later(0, 'check', self.check_for_update)
+        self.log.info("Update check requested", extra={'phase': 'control'})
+        return None
+
+    def postpone_restart(self, minutes):
+        """Move the pending restart minutes later. The countdown policy no longer shortens it.
+           Return an error message, or None."""
+        try:
+            minutes = float(minutes)
+        except (TypeError, ValueError):
+            return "minutes must be a number"
+        #JSON lets NaN and Infinity through, and either would leave the restart unschedulable.
+        if not math.isfinite(minutes) or minutes <= 0:
+            return "minutes must be a positive number"
+        if self.restartAt is None:
+            return "No restart is pending"
+        for name in ('warning', 'restart', 'cooldown', 'players'):
+            self.scheduler.cancel(name)
+        restartAt = self.restartAt + minutes * 60
+        if self.settings.oxideAutoUpdate and self.restartCoordinator is not None:
+            earliest = time() + restartAt - self.loop.time()
+            restartAt += self.restartCoordinator.reserve_restart(self.section, earliest) - earliest
+        self.restartAt = restartAt
+        #The restart is later now, so warnings already sent are due again.
+        self.warningsSent = []
+        self.schedule_countdown(self.build_warning_schedule())
+        self.log.info("Restart postponed. Restarting in " + str(round((restartAt - self.loop.time()) / 60, 1)) + " minutes", extra={'phase': 'control', 'minutes': minutes})
+        return None
+
+    def cancel_restart(self):
+        """Cancel the pending restart. The release that caused it does not start another one.
+           Return an error message, or None."""
+        if self.restartAt is None:
+            return "No restart is pending"
+        for name in ('warning', 'restart', 'cooldown', 'players'):
+            self.scheduler.cancel(name)
+        self.restartAt = None
+        self.skippedVersion = self.latestVersion
+        self.pendingWipe = False
+        if self.restartCoordinator is not None:
+            self.restartCoordinator.release_reservation(self.section)
+        if self.prefetchTask is not None:
+            self.prefetchTask.cancel()
+            self.prefetchTask = None
+        self.log.warning("Restart cancelled" + (". Skipping Oxide " + self.skippedVersion if self.skippedVersion else ""), extra={'phase': 'control'})
+        self.scheduler.call_later(self.settings.oxideCheckTime * 60, 'check', self.check_for_update)
+        return None
+
+    async def control(self, request):
+        """Answer one control socket request for this instance"""
+        command = request.get('command')
+        if command == 'status':
+            return dict(self.status(), ok=True)
+        if command == 'check-now':
+            error = self.check_now()
+        elif command == 'postpone':
+            error = self.postpone_restart(request.get('minutes', 15))
+        elif command == 'cancel':
+            error = self.cancel_restart()
+        elif command == 'send-message':
+            if not str(request.get('message', '')).strip():
+                error = "send-message needs a message"
+            else:
+                self.log.info("Sending message: " + request['message'], extra={'phase': 'control'})
+                await self.send_msgs(request['message'])
+                error = None
+        else:
+            error = "Unknown command " + str(command)
+        if error is not None:
+            return {'ok': False, 'error': error, 'instance': self.section}
+        self.save_state()
+        return dict(self.status(), ok=True)
+
+    def journal_state(self):
+        """State needed to carry on after the monitor restarts. Times are seconds since the epoch.
+           They are rounded so the same state converts to the same times from one call to the next."""
+        offset = time() - self.loop.time()
+        state = {'phase': 'idle',
+                 'latest_version': self.latestVersion,
+                 'failed_version': self.failedVersion,
+                 'skipped_version': self.skippedVersion,
+                 'wipe_due_since': None if self.wipeDueSince is None else round(self.wipeDueSince + offset, 1)}
+        if self.restarting and self.updateStartTime is not None:
+            state.update({'phase': 'restarting',
+                          'update_started': round(self.updateStartTime + offset, 1),
+                          'log_offsets': self.readinessWatcher.offsets})
+        elif self.restartAt is not None:
+            state.update({'phase': 'countdown',
+                          'restart_at': round(self.restartAt + offset, 1),
+                          'warnings_sent': self.warningsSent,
+                          'pending_wipe': self.pendingWipe})
+        elif self.cooldownUntil is not None:
+            state.update({'phase': 'cooldown',
+                          'cooldown_until': self.cooldownUntil})
+        return state
+
+    def save_state(self, event = None):
+        """Write the state journal if the state changed. Called after every scheduled event and control request."""
+        state = self.journal_state()
+        #Compared as JSON, since offsets are read back as lists.
+        if json.loads(json.dumps(state)) == self.savedState:
+            return
+        try:
+            jsonfile.write_json(self.settings.stateFile, state)
+            self.savedState = json.loads(json.dumps(state))
+        except (OSError, TypeError, ValueError) as ex:
+            self.log.error("Could not write state journal " + self.settings.stateFile + ": " + repr(ex), extra={'phase': 'journal'})
+
+    def resume_state(self):
+        """Carry on from the state journal left by a previous run.
+           Return True if it scheduled what comes next, False if the monitor should start with a check."""
+        state = jsonfile.read_json(self.settings.stateFile, {})
+        if not isinstance(state, dict) or not state:
+            return False
+        self.savedState = state
+        now = time()
+        toLoop = self.loop.time() - now
+        self.failedVersion = state.get('failed_version')
+        self.skippedVersion = state.get('skipped_version')
+        if state.get('wipe_due_since'):
+            self.wipeDueSince = state['wipe_due_since'] + toLoop
+        phase = state.get('phase')
+        if phase == 'countdown' and state.get('restart_at', 0) > now:
+            self.latestVersion = state.get('latest_version')
+            self.pendingWipe = bool(state.get('pending_wipe'))
+            self.warningsSent = list(state.get('warnings_sent', []))
+            self.restartAt = state['restart_at'] + toLoop
+            self.log.info("Resuming restart countdown. Restarting in " + str(round((state['restart_at'] - now) / 60, 1)) + " minutes", extra={'phase': 'journal'})
+            self.schedule_player_checks(self.loop.time())
+            self.schedule_countdown(self.build_warning_schedule())
+            return True
+        if phase == 'countdown':
+            #The restart was missed while the monitor was down. Check again instead of restarting without warning.
+            self.log.info("Restart countdown ran out while stopped. Checking for updates again.", extra={'phase': 'journal'})
+            return False
+        if phase == 'restarting' and state.get('update_started'):
+            self.latestVersion = state.get('latest_version')
+            self.updateStartTime = state['update_started'] + toLoop
+            self.readinessWatcher.offsets = dict((logFile, tuple(offset)) for (logFile, offset) in state.get('log_offsets', {}).items())
+            self.log.info("Resuming after an interrupted update. Not running the update command again.", extra={'phase': 'journal'})
+            self.scheduler.call_later(0, 'ready', self.resume_restart, max(0, self.settings.serverReadyTimeout * 60 - (now - state['update_started'])))
+            return True
+        if phase == 'cooldown' and state.get('cooldown_until', 0) > now:
+            self.cooldownUntil = state['cooldown_until']
+            self.scheduler.call_later(self.cooldownUntil - now, 'check', self.check_for_update)
+            return True
+        return False
+
+    async def resume_restart(self, timeout):
+        """Scheduled event. Wait for a server restarted by a previous run of the monitor."""
+        self.restarting = True
+        try:
+            await self.wait_for_ready(timeout)
+        finally:
+            self.restarting = False
+
+    def event_failed(self, event, error):
+        """Scheduler error handler. Log the failed event and keep checking for updates at the normal interval,
+           so one failed request does not stop the monitor. GracefulExit still stops it."""
+        if isinstance(error, GracefulExit):
+            raise error
+        self.log.error("Scheduled " + event.name + " failed: " + repr(error), exc_info=error, extra={'phase': event.name})
+        if self.restartAt is None:
+            #A pending countdown carries on and checks again after the restart.
+            self.scheduler.cancel('check')
+            self.scheduler.call_later(self.settings.oxideCheckTime * 60, 'check', self.check_for_update)
+
+    async def update_loop(self):
+        """Run the scheduler, resuming from the state journal or starting with an immediate update check"""
+        if not self.resume_state():
+            self.scheduler.call_later(0, 'check', self.check_for_update)
+        await self.scheduler.run()
+
+    def setup(self, loop, session, executor, releaseFeed = None):
+        """Create the bots. session, executor and releaseFeed may be shared with other monitors in the process."""
+        self.settings.validate()
+        self.loop = loop
+        self.scheduler = schedule.EventScheduler()
+        self.scheduler.afterEvent = self.save_state
+        self.scheduler.onError = self.event_failed
+        self.session = session
+        self.executor = executor
+        if self.settings.useDiscord:
+            self.serverinfo = discord.ServerInformation(self.settings.discordMsgGameName, self.settings.discordMsgServerName, self.settings.discordMsgServerIP, self.settings.discordMsgHostName)
+            self.discordBot = discord.DiscordBot(self.settings.discordWebHook, self.settings.discordBotName, self.settings.discordBotAvatarURL, self.session, self.settings.httpTimeout)
+        if self.settings.useRCON:
+            self.rconBot = rcon.AsyncRCONBot(self.settings.rconPass, self.settings.rconIP, self.settings.rconPort, self.settings.rconBotName)
+        self.restartCoordinator = None
+        if self.settings.maxConcurrentUpdates > 0:
+            self.restartCoordinator = coordinator.RestartCoordinator(self.settings.restartLockDIR, self.settings.maxConcurrentUpdates, self.settings.restartSpacing * 60)
+        self.latestVersion = None
+        self.restartAt = None
+        self.restarting = False
+        self.checking = False
+        self.warningsSent = []
+        self.cooldownUntil = None
+        self.savedState = None
+        self.pendingWipe = False
+        self.wipeDueSince = None
+        self.runningVersion = None
+        self.releasedVersion = None
+        self.lastCheckTime = None
+        self.lastCheckDuration = None
+        self.skippedVersion = None
+        self.failedVersion = None
+        self.updateStartTime = None
+        self.updateDuration = None
+        self.prefetchTask = None
+        self.artifactCache = None
+        if self.settings.oxidePrefetch:
+            self.artifactCache = artifacts.ArtifactCache(self.settings.cacheDIR, self.session, self.settings.httpTimeout)
+        if releaseFeed is None:
+            releaseFeed = self.create_release_feed(self.session)
+        self.oxideBot = oxide.UpdateCheck(self.settings.oxideLogDIR, self.settings.oxideGitURL, self.settings.oxideLogScanMode, releaseFeed=releaseFeed)
+        self.readinessWatcher = readiness.ReadinessWatcher(self.oxideBot, self.rconBot if self.settings.useRCON else None, self.settings.serverReadyPoll)
+
+    def create_release_feed(self, session, maxAge = 0):
+        """ReleaseFeed for this monitor's oxide_git_url using its cache settings"""
+        releaseCache = None
+        if self.settings.oxideReleaseCache:
+            releaseCache = oxide.ReleaseCache(self.settings.cacheDIR, self.settings.oxideReleaseMinPoll)
+        return oxide.ReleaseFeed(self.settings.oxideGitURL, releaseCache, session, self.settings.httpTimeout, maxAge)
+
+    async def close(self):
+        """Close connections held by the bots. Safe to call when setup() failed part way."""
+        rconBot = getattr(self, 'rconBot', None)
+        if rconBot is not None:
+            await rconBot.close()
 
     def main(self):
-        if not self.oxideAutoUpdate and not self.useDiscord and not self.useRCON:
-            raise RustMonitorVariableError('oxide_auto_update', 'Oxide Auto Update, Discord, and RCON are all disabled. There is nothing for this program to do.')
-        if self.useDiscord:
-            self.check_variables(1)
-            self.serverinfo = discord.ServerInformation(self.discordMsgGameName, self.discordMsgServerName, self.discordMsgServerIP, self.discordMsgHostName)
-            self.discordBot = discord.DiscordBot(self.discordWebHook, self.discordBotName, self.discordBotAvatarURL)
-        if self.useRCON:
-            self.rconBotName = self.discordBotName
-            self.check_variables(2)
-            self.rconBot = rcon.RCONBot(self.rconPass, self.rconIP, self.rconPort, self.rconBotName)
-        self.oxideBot = oxide.UpdateCheck(self.oxideLogDIR, self.oxideGitURL)
-        self.loop = asyncio.get_event_loop()
-        tasks = asyncio.gather(self.update_loop())
+        loop = asyncio.get_event_loop()
+        #Discord and GitHub requests share one connection pool.
+        session = httpsession.create_session(self.settings.httpRetries)
+        #Shared by every blocking call the monitor makes. Created once instead of per message.
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='RustMonitor')
+        logListener = jsonlog.start_logging(self.settings.logFile, int(self.settings.logMaxSize * 1024 * 1024), self.settings.logBackupCount)
+        metricsServer = start_metrics_server(loop, self.settings.metricsAddress, self.settings.metricsPort)
+        controlServer = None
+        try:
+            self.setup(loop, session, executor)
+            reloader = ConfigReloader(self.configPath, [self], self.section, self.settings.configReloadCheck)
+            controlServer = start_control_server(loop, self.settings.controlSocket, [self])
+            run_until_exit(loop, self.update_loop(), reloader.run())
+        finally:
+            loop.run_until_complete(self.close())
+            if controlServer is not None:
+                loop.run_until_complete(controlServer.close())
+            if metricsServer is not None:
+                loop.run_until_complete(metricsServer.close())
+            executor.shutdown(wait=False)
+            session.close()
+            logListener.stop()
+
+class RustSupervisor:
+    """Run one RustMonitor for every section in the INI from a single process and event loop.
+       Monitors share one HTTP session and executor. Monitors watching the same oxide_git_url share one
+       ReleaseFeed, so each distinct URL is requested once per check cycle no matter how many servers use it."""
+    def __init__(self, configPath = ''):
+        self.configPath = configPath
+        self.config = load_configuration(configPath)
+        self.monitors = [RustMonitor(configPath, section, self.config) for section in self.config.sections()]
+        if not self.monitors:
+            raise RustMonitorVariableError('section', 'No instance sections found in the configuration.')
+
+    def create_release_feeds(self, session):
+        """One ReleaseFeed per distinct oxide_git_url.
+           A fetch is reused for half the shortest check interval of the monitors sharing it,
+           which covers every monitor checking in the same cycle."""
+        feeds = {}
+        for monitor in self.monitors:
+            if monitor.settings.oxideGitURL not in feeds:
+                feeds[monitor.settings.oxideGitURL] = monitor.create_release_feed(session)
+        self.update_release_feed_ages(feeds)
+        return feeds
+
+    def update_release_feed_ages(self, feeds):
+        """Set each feed's maxAge from the current oxide_check_time of the monitors sharing it"""
+        for (gitURL, feed) in feeds.items():
+            feed.maxAge = min(monitor.settings.oxideCheckTime * 60 / 2 for monitor in self.monitors if monitor.settings.oxideGitURL == gitURL)
+
+    def main(self):
+        loop = asyncio.get_event_loop()
+        session = httpsession.create_session(max(monitor.settings.httpRetries for monitor in self.monitors), poolSize=max(10, len(self.monitors)))
+        executor = ThreadPoolExecutor(max_workers=2 + 2 * len(self.monitors), thread_name_prefix='RustSupervisor')
+        #One log file and metrics endpoint for the whole process, configured in the DEFAULT section.
+        defaults = self.config[self.config.default_section]
+        logFile = defaults['log_file'].strip() or os.path.join(os.path.abspath(self.configPath), 'rustserverautoupdate.log')
+        logListener = jsonlog.start_logging(logFile, int(defaults.getfloat('log_max_size_in_mb') * 1024 * 1024), defaults.getint('log_backup_count'))
+        metricsServer = start_metrics_server(loop, self.config.get(self.config.default_section, 'metrics_address').strip(), self.config.getint(self.config.default_section, 'metrics_port'))
+        controlServer = None
+        try:
+            feeds = self.create_release_feeds(session)
+            for monitor in self.monitors:
+                monitor.setup(loop, session, executor, feeds[monitor.settings.oxideGitURL])
+            log.info("Monitoring " + str(len(self.monitors)) + " instances using " + str(len(feeds)) + " release feeds")
+            reloader = ConfigReloader(self.configPath, self.monitors, checkInterval=self.config.getfloat(self.config.default_section, 'config_reload_check_in_sec'), config=self.config)
+            #oxide_check_time can change on reload. Keep the shared fetches in step with it.
+            reloader.afterReload = lambda: self.update_release_feed_ages(feeds)
+            controlServer = start_control_server(loop, defaults['control_socket'].strip(), self.monitors)
+            run_until_exit(loop, reloader.run(), *[monitor.update_loop() for monitor in self.monitors])
+        finally:
+            loop.run_until_complete(asyncio.gather(*[monitor.close() for monitor in self.monitors if hasattr(monitor, 'loop')]))
+            if controlServer is not None:
+                loop.run_until_complete(controlServer.close())
+            if metricsServer is not None:
+                loop.run_until_complete(metricsServer.close())
+            executor.shutdown(wait=False)
+            session.close()
+            logListener.stop()
+
+class ConfigReloader:
+    """Reload the INI file into new MonitorSettings when it changes or on SIGHUP, without stopping the monitors.
+       The file is parsed once for every monitor. Nothing is applied unless every monitor's new settings are valid.
+       Without a configSection the monitors run under a RustSupervisor: config is the configuration it started with,
+       PROCESS_OPTIONS are checked once in the DEFAULT section, and the monitors' own PROCESS_SETTINGS are ignored.
+       afterReload, if set, is called once new settings have been applied."""
+    def __init__(self, configPath, monitors, configSection = None, checkInterval = 30, config = None):
+        self.configPath = configPath
+        self.configFile = os.path.join(configPath, "rustserverautoupdate.ini")
+        self.monitors = monitors
+        self.configSection = configSection
+        self.checkInterval = checkInterval
+        self.lastStamp = self.stamp()
+        self.requested = None
+        self.afterReload = None
+        self.processOptions = self.process_options(config) if config is not None else None
+
+    def process_options(self, config):
+        """Values of PROCESS_OPTIONS in the DEFAULT section"""
+        return dict((option, config.get(config.default_section, option, fallback='').strip()) for option in PROCESS_OPTIONS)
+
+    def stamp(self):
+        """Modification time and size of the INI file, or None if it cannot be read"""
+        try:
+            stat = os.stat(self.configFile)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """Read the INI file and apply it to every monitor. Return True if it was applied."""
+        try:
+            config = load_configuration(self.configPath, self.configSection)
+            #load_configuration rewrites the file when it adds new options. Do not count that as another change.
+            self.lastStamp = self.stamp()
+            updates = []
+            for monitor in self.monitors:
+                if not config.has_section(monitor.section):
+                    log.warning("Section " + monitor.section + " was removed. Restart to stop monitoring it.", extra={'instance': monitor.section, 'phase': 'config'})
+                    continue
+                settings = MonitorSettings.from_section(config, monitor.section, self.configPath)
+                settings.validate()
+                updates.append((monitor, settings))
+        except RustMonitorVariableError as err:
+            log.error("Configuration not reloaded. " + err.variable + ": " + err.msg, extra={'phase': 'config'})
+            return False
+        except (configparser.Error, ValueError, OSError) as err:
+            log.error("Configuration not reloaded. " + str(err), extra={'phase': 'config'})
+            return False
+        added = set(config.sections()) - set(monitor.section for monitor in self.monitors)
+        if self.configSection is None and added:
+            log.warning("Restart to start monitoring new sections: " + ", ".join(sorted(added)), extra={'phase': 'config'})
+        unused = ()
+        if self.processOptions is not None:
+            unused = PROCESS_SETTINGS
+            processOptions = self.process_options(config)
+            pending = [option for option in PROCESS_OPTIONS if processOptions[option] != self.processOptions[option]]
+            if pending:
+                log.warning("Restart to apply changed settings: " + ", ".join(pending), extra={'phase': 'config', 'settings': pending})
+        for (monitor, settings) in updates:
+            monitor.apply_settings(settings, unused)
+        if self.afterReload is not None:
+            self.afterReload()
+        return True
+
+    async def run(self):
+        """Check the file every checkInterval seconds and reload on SIGHUP. A checkInterval of 0 only reloads on SIGHUP."""
+        loop = asyncio.get_event_loop()
+        self.requested = asyncio.Event()
+        sighup = getattr(signal, 'SIGHUP', None)
+        if sighup is not None:
+            loop.add_signal_handler(sighup, self.requested.set)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.requested.wait(), self.checkInterval if self.checkInterval > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+                if self.requested.is_set():
+                    self.requested.clear()
+                    log.info("Reloading configuration", extra={'phase': 'config'})
+                    self.reload()
+                elif self.stamp() != self.lastStamp:
+                    log.info("Configuration file changed. Reloading.", extra={'phase': 'config'})
+                    self.reload()
+        finally:
+            if sighup is not None:
+                loop.remove_signal_handler(sighup)
+
+class ControlAPI:
+    """Route control socket requests to the monitor named by their instance"""
+    def __init__(self, monitors):
+        self.monitors = dict((monitor.section, monitor) for monitor in monitors)
+
+    async def handle(self, request):
+        instance = request.get('instance')
+        if instance is None and len(self.monitors) == 1:
+            instance = next(iter(self.monitors))
+        if instance is None:
+            if request.get('command') == 'status':
+                return {'ok': True, 'instances': [monitor.status() for monitor in self.monitors.values()]}
+            return {'ok': False, 'error': "Name the instance, one of " + ", ".join(self.monitors)}
+        #-a keeps section names as written in the INI and -s upper cases them. Accept either.
+        monitor = next((monitor for (section, monitor) in self.monitors.items() if section.lower() == str(instance).lower()), None)
+        if monitor is None:
+            return {'ok': False, 'error': "No instance " + str(instance)}
+        return await monitor.control(request)
+
+def start_control_server(loop, path, monitors):
+    """Serve the control socket at path for monitors. Return the ControlServer, or None if path is empty or it cannot be served."""
+    if not path:
+        return None
+    controlServer = control.ControlServer(path, ControlAPI(monitors).handle)
+    try:
+        loop.run_until_complete(controlServer.start())
+    except (control.ControlError, OSError) as err:
+        log.error("Control socket not started: " + str(err))
+        return None
+    log.info("Serving control socket at " + path)
+    return controlServer
+
+def start_metrics_server(loop, address, port):
+    """Serve the metrics registry on address:port. Return the MetricsServer, or None if port is 0."""
+    if port <= 0:
+        return None
+    metricsServer = metrics.MetricsServer(metrics.REGISTRY, address, port)
+    loop.run_until_complete(metricsServer.start())
+    log.info("Serving metrics on http://" + address + ":" + str(port) + "/metrics")
+    return metricsServer
+
+def run_until_exit(loop, *coroutines):
+    """Run each coroutine on loop as its own task until they all finish or a signal raises GracefulExit.
+       A task that fails is logged and the others keep running."""
+    tasks = [loop.create_task(coroutine) for coroutine in coroutines]
+    try:
+        pending = tasks
+        while pending:
+            done, pending = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                error = None if task.cancelled() else task.exception()
+                if isinstance(error, GracefulExit):
+                    raise error
+                if error is not None:
+                    log.error("Stopped after an error: " + repr(error), exc_info=error)
+    except GracefulExit:
+        for task in tasks:
+            task.cancel()
         try:
-            self.loop.run_until_complete(tasks)
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
         except GracefulExit:
-            self.stop = True
-            tasks.add_done_callback(lambda t: self.loop.stop())
-            tasks.cancel()
-            while not tasks.done() and not self.loop.is_closed():
-                self.loop.run_forever()
-            tasks.exception()
+            pass
 
 class RustMonitorVariableError(Exception):
     def __init__(self, variable, msg):
@@ -297,23 +1226,25 @@ class GracefulExit(Exception):
     pass
 
 def signal_handler(signum, frame):
-    print("\nStopping Rust Server Auto Update")
+    log.info("Stopping Rust Server Auto Update")
     raise GracefulExit()
 
 def argumenthelp():
-    print("\nSyntax: rustserverautoupdate.py -c <Path to Configuration INI> [-s <Section Name - Used for multiple instances>]\n"
+    print("\nSyntax: rustserverautoupdate.py -c <Path to Configuration INI> [-s <Section Name - Used for multiple instances> | -a]\n"
           "Example: rustserverautoupdate.py -c \home\rustserver\rustserverautoupdate -s SERVER1\n"
           "\n"
           "Check for updates. Return Space Separated String Array (Boolean update url, updatestring, runningversion, latestversion)\n\n"
           "REQUIRED INPUT - CHOOSE ONE:\n"
           "-c --configpath   Path where Configuration File is Stored. MUST HAVE R.\n"
           "OPTIONAL INPUT:\n"          
-          "-s --section       Section Name for configuration. This allows for multiple instances to be ran from same configuration.\n")
+          "-s --section       Section Name for configuration. This allows for multiple instances to be ran from same configuration.\n"
+          "-a --all-sections  Run every section in the configuration from this one process.\n")
 def main(argv):
     configPath = os.path.dirname(os.path.realpath(__file__))
     sectionName = ""
+    allSections = False
     try:
-        opts, args = getopt.getopt(argv,"hc:s:",["help", "configpath=", "section="])
+        opts, args = getopt.getopt(argv,"hac:s:",["help", "all-sections", "configpath=", "section="])
     except getopt.GetoptError as err:
         print("Incorrect Syntax: -h or --help for more information")
         print("rustserverautoupdate.py -c <Path to Configuration INI> [-s <Section Name - Used for multiple instances>]\n")
@@ -326,14 +1257,20 @@ def main(argv):
             configPath = arg
         elif opt in ("-s", "--section"):
             sectionName = arg
+        elif opt in ("-a", "--all-sections"):
+            allSections = True
     if not configPath.strip():
         configPath = configPath.strip()
     if not sectionName.strip():
         sectionName = "SERVER1"
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
-    rm = RustMonitor(configPath,sectionName)
-    rm.main()
+    if allSections:
+        rs = RustSupervisor(configPath)
+        rs.main()
+    else:
+        rm = RustMonitor(configPath,sectionName)
+        rm.main()
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Control socket commands against a monitor with RCON and Discord turned off.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import asyncio, os, shutil, stat, tempfile, unittest
+import rustserverautoupdate
+from rustbots import control
+
+class PostponeTest(unittest.TestCase):
+    def setUp(self):
+        self.configPath = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        with open(os.path.join(self.configPath, "rustserverautoupdate.ini"), "w") as configFile:
+            configFile.write("[DEFAULT]\nuse_rcon = no\nuse_discord = no\noxide_release_cache = no\n[SERVER1]\n")
+        self.monitor = rustserverautoupdate.RustMonitor(self.configPath, "SERVER1")
+        self.monitor.setup(self.loop, None, None)
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.configPath, ignore_errors=True)
+
+    def postpone(self, minutes):
+        return self.loop.run_until_complete(self.monitor.control({'command': 'postpone', 'minutes': minutes}))
+
+    def test_rejects_bad_minutes(self):
+        restartAt = self.monitor.restartAt = self.loop.time() + 600
+        for minutes in (float('nan'), float('inf'), float('-inf'), 0, -5, "soon", None):
+            reply = self.postpone(minutes)
+            self.assertFalse(reply['ok'], minutes)
+            self.assertIn("minutes", reply['error'])
+        self.assertEqual(self.monitor.restartAt, restartAt)
+
+    def test_postpones_pending_restart(self):
+        restartAt = self.monitor.restartAt = self.loop.time() + 600
+        reply = self.postpone(10)
+        self.assertTrue(reply['ok'])
+        self.assertGreaterEqual(self.monitor.restartAt, restartAt + 600)
+
+    def test_nothing_to_postpone(self):
+        reply = self.postpone(10)
+        self.assertEqual(reply['error'], "No restart is pending")
+
+class ControlServerTest(unittest.TestCase):
+    def setUp(self):
+        self.socketDir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.socketDir, ignore_errors=True)
+
+    def test_socket_is_private_and_umask_restored(self):
+        path = os.path.join(self.socketDir, "monitor.sock")
+        async def handler(request):
+            return {'ok': True}
+        server = control.ControlServer(path, handler)
+        oldUmask = os.umask(0o022)
+        try:
+            self.loop.run_until_complete(server.start())
+            self.assertEqual(os.umask(0o022), 0o022)
+        finally:
+            os.umask(oldUmask)
+        try:
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        finally:
+            self.loop.run_until_complete(server.close())
+
+if __name__ == "__main__":
+    unittest.main()
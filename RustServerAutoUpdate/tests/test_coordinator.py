@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Restart coordination between instances on one host, using sleeping shell commands in place of the update.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import asyncio, os, shutil, tempfile, unittest
+from unittest import mock
+import rustserverautoupdate
+from rustbots import coordinator
+
+class RestartCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.lockDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.lockDir, ignore_errors=True)
+
+    def test_one_slot(self):
+        first = coordinator.RestartCoordinator(self.lockDir, 1)
+        second = coordinator.RestartCoordinator(self.lockDir, 1)
+        slotLock = first.try_acquire()
+        self.assertIsNotNone(slotLock)
+        self.assertIsNone(second.try_acquire())
+        slotLock.release()
+        second.try_acquire().release()
+
+    def test_reservations_are_spaced(self):
+        restartCoordinator = coordinator.RestartCoordinator(self.lockDir, 1, restartSpacing=300)
+        self.assertEqual(restartCoordinator.reserve_restart("SERVER1", 1e10), 1e10)
+        self.assertEqual(restartCoordinator.reserve_restart("SERVER2", 1e10 + 60), 1e10 + 300)
+        restartCoordinator.release_reservation("SERVER1")
+        self.assertEqual(restartCoordinator.reserve_restart("SERVER3", 1e10), 1e10)
+
+class MonitorRestartSlotTest(unittest.TestCase):
+    def setUp(self):
+        self.configPath = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.configPath, ignore_errors=True)
+
+    def monitors(self, command, extra = "", readyTimeout = 0, sections = ("SERVER1",)):
+        with open(os.path.join(self.configPath, "rustserverautoupdate.ini"), "w") as configFile:
+            configFile.write("[DEFAULT]\nuse_rcon = no\nuse_discord = no\noxide_release_cache = no\n"
+                             "oxide_log_dir = " + os.path.join(self.configPath, "logs") + "\n"
+                             "max_concurrent_updates = 1\nserver_ready_timeout_in_min = " + str(readyTimeout) + "\n" + extra +
+                             "bash_get_update_command = " + command + "\n" + "".join("[" + section + "]\n" for section in sections))
+        monitors = [rustserverautoupdate.RustMonitor(self.configPath, section) for section in sections]
+        for monitor in monitors:
+            monitor.setup(self.loop, None, None)
+        return monitors
+
+    def slot_is_free(self):
+        slotLock = coordinator.RestartCoordinator(self.configPath, 1).try_acquire()
+        if slotLock is None:
+            return False
+        slotLock.release()
+        return True
+
+    def test_restarts_are_serialized(self):
+        timesFile = os.path.join(self.configPath, "times")
+        monitors = self.monitors('echo "$(date +%%s.%%N) start" >> ' + timesFile + '; sleep 0.4; echo "$(date +%%s.%%N) end" >> ' + timesFile,
+                                 sections=("SERVER1", "SERVER2"))
+        async def restart_all():
+            await asyncio.gather(*[monitor.restart_server() for monitor in monitors])
+        self.loop.run_until_complete(restart_all())
+        with open(timesFile) as times:
+            events = [line.split()[1] for line in sorted(times, key=lambda line: float(line.split()[0]))]
+        self.assertEqual(events, ["start", "end", "start", "end"])
+        self.assertTrue(self.slot_is_free())
+
+    def test_slot_released_when_command_fails_and_server_never_ready(self):
+        monitor, = self.monitors("exit 3", readyTimeout=0.005)
+        self.loop.run_until_complete(monitor.restart_server())
+        self.assertTrue(self.slot_is_free())
+
+    def test_slot_released_when_command_times_out(self):
+        monitor, = self.monitors("sleep 5", "update_step_timeout_in_min = 0.005\n")
+        self.loop.run_until_complete(monitor.restart_server())
+        self.assertTrue(self.slot_is_free())
+
+    def test_slot_released_when_restart_raises(self):
+        monitor, = self.monitors("true")
+        async def broken():
+            raise OSError("no environment")
+        monitor.update_environment = broken
+        with self.assertRaises(OSError):
+            self.loop.run_until_complete(monitor.restart_server())
+        self.assertTrue(self.slot_is_free())
+
+    def test_held_up_restart_repeats_final_warning(self):
+        monitor, = self.monitors("true")
+        sent = []
+        async def send_msgs(msg):
+            sent.append(msg)
+        monitor.send_msgs = send_msgs
+        with mock.patch("asyncio.sleep", new=mock.AsyncMock()) as sleep:
+            self.loop.run_until_complete(monitor.repeat_final_warning(30))
+            self.assertEqual(sent, [])
+            self.loop.run_until_complete(monitor.repeat_final_warning(120))
+        self.assertEqual(sent, [monitor.settings.msg01Min])
+        sleep.assert_awaited_once_with(60)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Player aware restart countdowns against the local RCON stub from the benchmarks.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import asyncio, json, os, shutil, tempfile, unittest
+import rustserverautoupdate
+from rustbots import countdown, rcon
+from benchmarks import stubs
+
+class ParsePlayerCountTest(unittest.TestCase):
+    def test_serverinfo_counts_joining_and_queued(self):
+        reply = {"Message": json.dumps({"Players": 3, "Joining": 1, "Queued": 2})}
+        self.assertEqual(rcon.parse_player_count(reply), 6)
+
+    def test_playerlist(self):
+        reply = {"Message": json.dumps([{"SteamID": "1"}, {"SteamID": "2"}])}
+        self.assertEqual(rcon.parse_player_count(reply), 2)
+
+    def test_malformed_reply(self):
+        with self.assertRaises(ValueError):
+            rcon.parse_player_count({"Message": "Players: lots"})
+
+class PolicyTest(unittest.TestCase):
+    def test_scaled_limits(self):
+        policy = countdown.create_policy("scaled", "0:0, 3:5, 8:10")
+        self.assertEqual(policy.max_remaining(0), 0)
+        self.assertEqual(policy.max_remaining(2), 300)
+        self.assertIsNone(policy.max_remaining(20))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            countdown.create_policy("sometimes")
+
+class CheckPlayersTest(unittest.TestCase):
+    """RustMonitor.check_players with the countdown 15 minutes from the restart"""
+    def setUp(self):
+        self.stub = stubs.start_rcon()
+        self.configPath = tempfile.mkdtemp()
+        with open(os.path.join(self.configPath, "rustserverautoupdate.ini"), "w") as configFile:
+            configFile.write("[DEFAULT]\nuse_rcon = yes\nuse_discord = no\nrcon_pass = password\nrcon_port = " + str(self.stub.port) + "\n"
+                             "oxide_release_cache = no\nrestart_countdown_policy = scaled\nrestart_countdown_limits = 0:0, 3:5\n[SERVER1]\n")
+        self.loop = asyncio.new_event_loop()
+        self.monitor = rustserverautoupdate.RustMonitor(self.configPath, "SERVER1")
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.monitor.close())
+        self.loop.close()
+        shutil.rmtree(self.configPath, ignore_errors=True)
+
+    def remaining_after_check(self, serverinfo):
+        """Answer serverinfo with serverinfo, run one player check and return the seconds left in the countdown"""
+        self.stub.replies["serverinfo"] = serverinfo
+        async def run():
+            self.monitor.setup(asyncio.get_running_loop(), None, None)
+            self.monitor.restartAt = self.monitor.loop.time() + 15 * 60
+            await self.monitor.check_players()
+            return self.monitor.restartAt - self.monitor.loop.time()
+        return self.loop.run_until_complete(run())
+
+    def test_empty_server_restarts_now(self):
+        self.assertLess(self.remaining_after_check(json.dumps({"Players": 0, "Joining": 0, "Queued": 0})), 1)
+        self.assertEqual([event.name for event in self.monitor.scheduler.pending() if event.name == "restart"], ["restart"])
+
+    def test_few_players_shorten_countdown(self):
+        self.assertAlmostEqual(self.remaining_after_check(json.dumps({"Players": 2})), 5 * 60, delta=1)
+
+    def test_populated_server_keeps_full_countdown(self):
+        self.assertAlmostEqual(self.remaining_after_check(json.dumps({"Players": 40})), 15 * 60, delta=1)
+
+    def test_malformed_reply_keeps_full_countdown(self):
+        self.assertAlmostEqual(self.remaining_after_check("not json"), 15 * 60, delta=1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""WebhookQueue and the monitor's Discord notifications against a stub webhook session.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import asyncio, itertools, json, os, shutil, tempfile, threading, time, unittest
+import rustserverautoupdate
+from rustbots import discord
+
+class StubResponse:
+    def __init__(self, status_code, headers = None, body = ""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = body
+
+    def json(self):
+        return json.loads(self.text)
+
+class StubWebhookSession:
+    """Stands in for a requests Session posting to a webhook.
+       responses are returned in order, then 204 with a roomy bucket. Every post is kept in posts with the time it was made."""
+    def __init__(self, responses = ()):
+        self.responses = list(responses)
+        self.posts = []
+        self.lock = threading.Lock()
+
+    def post(self, url, headers = None, data = None, timeout = None):
+        with self.lock:
+            self.posts.append((time.monotonic(), url, json.loads(data)))
+            if self.responses:
+                return self.responses.pop(0)
+        return StubResponse(204, {"X-RateLimit-Remaining": "5", "X-RateLimit-Reset-After": "1"})
+
+    def descriptions(self):
+        return [embed["description"] for (when, url, data) in self.posts for embed in data["embeds"]]
+
+def rate_limited(retryAfter):
+    return StubResponse(429, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": str(retryAfter)}, json.dumps({"retry_after": retryAfter}))
+
+webhooks = itertools.count(1)
+
+def unique_webhook():
+    """Webhook queues are shared per URL for the whole process. Every test gets its own."""
+    return "http://127.0.0.1/webhook/" + str(next(webhooks))
+
+class WebhookQueueTest(unittest.TestCase):
+    def queue(self, session, maxAttempts = 5):
+        return discord.WebhookQueue(unique_webhook(), session, timeout=5, maxAttempts=maxAttempts)
+
+    def put_all(self, queue, messages, username = "Bot"):
+        """Queue every message before the worker can take any, so they are all waiting together"""
+        with queue.condition:
+            return [queue.put(username, "", {"description": message}) for message in messages]
+
+    def test_batches_up_to_max_embeds(self):
+        session = StubWebhookSession()
+        queue = self.queue(session)
+        messages = ["message " + str(i) for i in range(discord.MAX_EMBEDS + 2)]
+        for future in self.put_all(queue, messages):
+            future.result(5)
+        self.assertEqual([len(data["embeds"]) for (when, url, data) in session.posts], [discord.MAX_EMBEDS, 2])
+        self.assertEqual(session.descriptions(), messages)
+
+    def test_lone_message_is_not_delayed(self):
+        session = StubWebhookSession()
+        bot = discord.DiscordBot(unique_webhook(), "Bot", session=session)
+        start = time.monotonic()
+        bot.send_message(discord.ServerInformation("Rust", "Server", "127.0.0.1"), "hello")
+        self.assertLess(time.monotonic() - start, bot.queue.batchDelay)
+
+    def test_different_senders_are_not_combined(self):
+        session = StubWebhookSession()
+        queue = self.queue(session)
+        with queue.condition:
+            futures = [queue.put("First", "", {"description": "a"}), queue.put("Second", "", {"description": "b"}), queue.put("First", "", {"description": "c"})]
+        for future in futures:
+            future.result(5)
+        self.assertEqual([(data["username"], len(data["embeds"])) for (when, url, data) in session.posts], [("First", 2), ("Second", 1)])
+
+    def test_retries_after_429(self):
+        session = StubWebhookSession([rate_limited(0.3)])
+        queue = self.queue(session)
+        self.put_all(queue, ["retried"])[0].result(5)
+        self.assertEqual(session.descriptions(), ["retried", "retried"])
+        self.assertGreaterEqual(session.posts[1][0] - session.posts[0][0], 0.3)
+
+    def test_gives_up_after_max_attempts(self):
+        session = StubWebhookSession([rate_limited(0.05)] * 3)
+        queue = self.queue(session, maxAttempts=3)
+        with self.assertRaises(discord.DiscordBotError):
+            self.put_all(queue, ["never posted"])[0].result(5)
+        self.assertEqual(len(session.posts), 3)
+
+    def test_waits_for_empty_bucket_to_reset(self):
+        session = StubWebhookSession([StubResponse(204, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.4"})])
+        queue = self.queue(session)
+        self.put_all(queue, ["first"])[0].result(5)
+        self.put_all(queue, ["second"])[0].result(5)
+        self.assertEqual(session.descriptions(), ["first", "second"])
+        self.assertGreaterEqual(session.posts[1][0] - session.posts[0][0], 0.4)
+
+class MonitorNotifyTest(unittest.TestCase):
+    def setUp(self):
+        self.configPath = tempfile.mkdtemp()
+        self.webhook = unique_webhook()
+        with open(os.path.join(self.configPath, "rustserverautoupdate.ini"), "w") as configFile:
+            configFile.write("[DEFAULT]\nuse_rcon = no\nuse_discord = yes\ndiscord_webhook = " + self.webhook + "\n"
+                             "oxide_release_cache = no\nnotify_timeout_in_sec = 0.2\n[SERVER1]\n")
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.configPath, ignore_errors=True)
+
+    def test_rate_limited_warning_is_still_posted(self):
+        session = StubWebhookSession([rate_limited(1)])
+        monitor = rustserverautoupdate.RustMonitor(self.configPath, "SERVER1")
+        async def run():
+            monitor.setup(asyncio.get_running_loop(), session, None)
+            start = time.monotonic()
+            await monitor.send_msgs("first warning")
+            await monitor.send_msgs("second warning")
+            #Each send only waits notify_timeout_in_sec while the queue waits out the 429.
+            self.assertLess(time.monotonic() - start, 1)
+            await asyncio.sleep(1.5)
+        self.loop.run_until_complete(run())
+        self.assertEqual(sorted(set(session.descriptions())), ["first warning", "second warning"])
+
+if __name__ == "__main__":
+    unittest.main()
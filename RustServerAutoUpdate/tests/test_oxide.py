@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ReleaseCache and ReleaseFeed against the local GitHub stub from the benchmarks.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import os, shutil, tempfile, time, unittest
+from email.utils import formatdate
+from rustbots import oxide
+from benchmarks import stubs
+from benchmarks.release_parse import make_release_json
+
+class NextPollTimeTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = oxide.ReleaseCache(tempfile.mkdtemp(), minPollInterval=60, reserveRequests=5)
+        self.now = 1000000.0
+
+    def tearDown(self):
+        shutil.rmtree(self.cache.cacheDir, ignore_errors=True)
+
+    def test_min_poll_interval_without_headers(self):
+        self.assertEqual(self.cache.next_poll_time({}, self.now), self.now + 60)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(self.cache.next_poll_time({"Retry-After": "600"}, self.now), self.now + 600)
+
+    def test_retry_after_date(self):
+        headers = {"Retry-After": formatdate(self.now + 900, usegmt=True)}
+        self.assertEqual(self.cache.next_poll_time(headers, self.now), self.now + 900)
+
+    def test_waits_for_reset_when_out_of_requests(self):
+        headers = {"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": str(self.now + 3000)}
+        self.assertEqual(self.cache.next_poll_time(headers, self.now), self.now + 3000)
+
+    def test_spreads_remaining_requests_until_reset(self):
+        headers = {"X-RateLimit-Remaining": "15", "X-RateLimit-Reset": str(self.now + 3000)}
+        self.assertEqual(self.cache.next_poll_time(headers, self.now), self.now + 300)
+
+class ReleaseFeedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.payload = make_release_json(numAssets=2, notesSize=100)
+        self.github = stubs.start_github(self.payload)
+        self.cacheDir = tempfile.mkdtemp()
+        self.cache = oxide.ReleaseCache(self.cacheDir, minPollInterval=0)
+        self.gitURL = self.github.url + "/repos/OxideMod/Oxide.Rust/releases/latest"
+
+    def tearDown(self):
+        self.github.shutdown()
+        self.github.server_close()
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+    def feed(self):
+        return oxide.ReleaseFeed(self.gitURL, self.cache, timeout=5)
+
+    def test_cached_response_served_until_next_poll_time(self):
+        self.assertEqual(self.feed().get_json_from_api(), self.payload)
+        self.assertEqual(self.feed().get_json_from_api(), self.payload)
+        #The stub's rate limit headers spread the next request far into the future.
+        self.assertEqual(self.github.statuses, [200])
+
+    def test_304_reuses_cached_body(self):
+        self.feed().get_json_from_api()
+        entry = self.cache.load(self.gitURL)
+        entry["notBefore"] = 0
+        self.cache.save(self.gitURL, entry)
+        self.assertEqual(self.feed().get_json_from_api(), self.payload)
+        self.assertEqual(self.github.statuses, [200, 304])
+        self.assertGreater(self.cache.load(self.gitURL)["notBefore"], time.time())
+
+    def test_corrupt_cache_file_is_ignored(self):
+        with open(self.cache.cache_file(self.gitURL), "w") as cacheFile:
+            cacheFile.write('{"body": "trunc')
+        self.assertEqual(self.cache.load(self.gitURL), {})
+        self.assertEqual(self.feed().get_json_from_api(), self.payload)
+        self.assertEqual(self.github.statuses, [200])
+        self.assertEqual(self.cache.load(self.gitURL)["body"], self.payload)
+
+    def test_shared_directory_is_not_trusted(self):
+        os.chmod(self.cacheDir, 0o777)
+        with open(self.cache.cache_file(self.gitURL), "w") as cacheFile:
+            cacheFile.write('{"body": "{\\"tag_name\\": \\"9.9.9\\"}", "notBefore": 99999999999}')
+        self.assertEqual(self.feed().get_json_from_api(), self.payload)
+        self.assertEqual(self.github.statuses, [200])
+
+if __name__ == "__main__":
+    unittest.main()
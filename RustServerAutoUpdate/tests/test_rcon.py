@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""RCONBot and AsyncRCONBot against the local RCON stub from the benchmarks.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import asyncio, socket, time, unittest
+from concurrent.futures import ThreadPoolExecutor
+from websocket import _exceptions
+from rustbots import rcon
+from benchmarks import stubs
+
+def free_port():
+    """A local port nothing is listening on"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def wait_until(condition, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting")
+        time.sleep(0.01)
+
+class RCONBotTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = stubs.start_rcon()
+        self.bot = rcon.RCONBot("password", "127.0.0.1", str(self.stub.port), reconnectDelay=0.1)
+
+    def tearDown(self):
+        self.bot.close()
+
+    def test_concurrent_replies_matched_by_identifier(self):
+        commands = ["say message " + str(i) for i in range(20)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            replies = list(executor.map(self.bot.send_message, commands))
+        self.assertEqual([reply["Message"] for reply in replies], commands)
+        self.assertEqual(len(set(reply["Identifier"] for reply in replies)), len(commands))
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_timeout_leaves_connection_usable(self):
+        self.stub.ignored.add("serverinfo")
+        start = time.monotonic()
+        with self.assertRaises(_exceptions.WebSocketTimeoutException):
+            self.bot.send_message("serverinfo", timeout=0.3)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.bot.pending, {})
+        self.assertEqual(self.bot.send_message("say still here")["Message"], "say still here")
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_reconnect_after_disconnect(self):
+        self.bot.send_message("say first")
+        self.stub.disconnect()
+        wait_until(lambda: self.bot.ws is None)
+        self.assertEqual(self.bot.send_message("say second")["Message"], "say second")
+        self.assertEqual(self.stub.connections, 2)
+
+    def test_waiting_command_fails_on_disconnect(self):
+        self.stub.ignored.add("serverinfo")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiting = executor.submit(self.bot.send_message, "serverinfo", timeout=5)
+            wait_until(lambda: self.bot.pending)
+            self.stub.disconnect()
+            with self.assertRaises(rcon.RCONConnectionError):
+                waiting.result(5)
+
+    def test_reconnect_backs_off(self):
+        bot = rcon.RCONBot("password", "127.0.0.1", str(free_port()), reconnectDelay=30)
+        with self.assertRaises(Exception):
+            bot.send_message("say nobody", timeout=1)
+        start = time.monotonic()
+        with self.assertRaises(rcon.RCONConnectionError):
+            bot.send_message("say nobody", timeout=1)
+        self.assertLess(time.monotonic() - start, 1)
+
+class AsyncRCONBotTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = stubs.start_rcon()
+        self.loop = asyncio.new_event_loop()
+        self.bot = rcon.AsyncRCONBot("password", "127.0.0.1", str(self.stub.port), reconnectDelay=0.1)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.bot.close())
+        self.loop.close()
+
+    def test_concurrent_replies_matched_by_identifier(self):
+        commands = ["say message " + str(i) for i in range(20)]
+        async def run():
+            return await asyncio.gather(*[self.bot.send_message(command) for command in commands])
+        replies = self.loop.run_until_complete(run())
+        self.assertEqual([reply["Message"] for reply in replies], commands)
+        self.assertEqual(len(set(reply["Identifier"] for reply in replies)), len(commands))
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_timeout_leaves_connection_usable(self):
+        self.stub.ignored.add("serverinfo")
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(self.bot.send_message("serverinfo", timeout=0.3))
+        self.assertEqual(self.bot.pending, {})
+        reply = self.loop.run_until_complete(self.bot.send_message("say still here"))
+        self.assertEqual(reply["Message"], "say still here")
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_reconnect_after_disconnect(self):
+        async def run():
+            await self.bot.send_message("say first")
+            self.stub.disconnect()
+            while self.bot.writer is not None:
+                await asyncio.sleep(0.01)
+            return await self.bot.send_message("say second")
+        self.assertEqual(self.loop.run_until_complete(run())["Message"], "say second")
+        self.assertEqual(self.stub.connections, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Reloading the INI file under a RustSupervisor.
+   Run from the RustServerAutoUpdate directory: python -m unittest discover tests"""
+import os, shutil, tempfile, unittest
+import rustserverautoupdate
+from rustbots import jsonlog
+
+CONFIG = ("[DEFAULT]\nuse_rcon = no\nuse_discord = no\noxide_release_cache = no\noxide_check_time_in_min = 10\nmetrics_port = {metricsPort}\n"
+          "[SERVER1]\noxide_check_time_in_min = {checkTime}\n"
+          "[SERVER2]\nlog_file = {logFile}\n")
+
+class SupervisorReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.configPath = tempfile.mkdtemp()
+        self.write_config()
+        self.supervisor = rustserverautoupdate.RustSupervisor(self.configPath)
+        self.feeds = self.supervisor.create_release_feeds(None)
+        self.reloader = rustserverautoupdate.ConfigReloader(self.configPath, self.supervisor.monitors, config=self.supervisor.config)
+        self.reloader.afterReload = lambda: self.supervisor.update_release_feed_ages(self.feeds)
+
+    def tearDown(self):
+        shutil.rmtree(self.configPath, ignore_errors=True)
+
+    def write_config(self, metricsPort = 0, checkTime = 10, logFile = ""):
+        with open(os.path.join(self.configPath, "rustserverautoupdate.ini"), "w") as configFile:
+            configFile.write(CONFIG.format(metricsPort=metricsPort, checkTime=checkTime, logFile=logFile))
+
+    def reload(self):
+        with self.assertLogs(jsonlog.LOGGER_NAME) as logs:
+            self.assertTrue(self.reloader.reload())
+            #assertLogs needs at least one record.
+            rustserverautoupdate.log.info("reloaded")
+        return [record.getMessage() for record in logs.records]
+
+    def test_shared_feed_follows_check_time(self):
+        feed, = self.feeds.values()
+        self.assertEqual(feed.maxAge, 300)
+        self.write_config(checkTime=2)
+        self.reload()
+        self.assertEqual(feed.maxAge, 60)
+        self.write_config(checkTime=30)
+        self.reload()
+        self.assertEqual(feed.maxAge, 300)
+
+    def test_instance_process_settings_are_ignored(self):
+        self.write_config(logFile=os.path.join(self.configPath, "server2.log"))
+        messages = self.reload()
+        self.assertFalse([msg for msg in messages if "Restart to apply" in msg], messages)
+
+    def test_default_process_settings_warn_once(self):
+        self.write_config(metricsPort=9100)
+        messages = [msg for msg in self.reload() if "Restart to apply" in msg]
+        self.assertEqual(messages, ["Restart to apply changed settings: metrics_port"])
+
+if __name__ == "__main__":
+    unittest.main()